@@ -0,0 +1,317 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from groc import generate, utils
+from groc.models import Groc
+from groc.version import VERSION
+
+
+""" groc benchmarks
+
+    python -m benchmarks.bench --sizes 10000,1000000 --save results.json
+    python -m benchmarks.bench --baseline results.json --threshold 0.15
+
+For every size, a database of that many generated purchases is built in
+a temporary directory, then measured:
+
+    build_rows_per_sec     bulk insert (Groc.add_purchases, one
+                           transaction per chunk)
+    import_rows_per_sec    groc add --source (db.insert_from_csv_dict,
+                           one transaction per purchase)
+    validate_rows_per_sec  utils.validate_row on csv rows
+    list_ms, list_month_ms, breakdown_ms, delete_ms
+                           latency percentiles (p50/p95/p99) of the
+                           reports and of deleting a purchase
+    db_size                database file size in bytes
+    peak_rss               peak resident memory in bytes
+
+Every size runs in its own child process, so peak_rss is per size.
+Results are written as JSON. Compared to a baseline, a throughput below
+(1 - threshold) times the baseline or a latency above (1 + threshold)
+times the baseline is a regression, and the exit status is 1.
+"""
+DEFAULT_SIZES = [10000]
+DEFAULT_THRESHOLD = 0.1
+DEFAULT_REPEAT = 50
+
+# Purchases imported via csv, at most
+IMPORT_ROWS = 20000
+
+# Higher is better for these metrics, lower for the others
+THROUGHPUT_METRICS = ['build_rows_per_sec', 'import_rows_per_sec',
+                      'validate_rows_per_sec']
+LATENCY_METRICS = ['list_ms', 'list_month_ms', 'breakdown_ms', 'delete_ms']
+
+
+def percentiles(samples):
+    """
+    p50/p95/p99 of latency samples in seconds, as milliseconds, None
+    without samples.
+    """
+    samples = sorted(samples)
+    if not samples:
+        return {'p50': None, 'p95': None, 'p99': None}
+
+    def at(p):
+        return round(samples[min(len(samples) - 1,
+                                 int(len(samples) * p))] * 1000, 3)
+    return {'p50': at(0.50), 'p95': at(0.95), 'p99': at(0.99)}
+
+
+def timed(func, repeat):
+    """ Run func repeat times, returning latency percentiles. """
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def peak_rss():
+    """ Peak resident memory of this process in bytes. """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def sample_ids(db_path, count, seed=0):
+    """
+    Random purchase ids, picked from the range of ids, so the ids of a
+    large database are never all loaded (they would dominate peak_rss).
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        low, high = conn.execute(
+            'SELECT MIN(id), MAX(id) FROM purchase;').fetchone()
+        if low is None:
+            return []
+        # Twice as many candidates, ids of ignored duplicates are gaps
+        candidates = random.Random(seed).sample(
+            range(low, high + 1), min(count * 2, high - low + 1))
+        existing = {row[0] for row in conn.execute(
+            'SELECT id FROM purchase WHERE id IN ({});'.format(
+                ','.join('?' * len(candidates))), candidates)}
+    finally:
+        conn.close()
+    return [id_ for id_ in candidates if id_ in existing][:count]
+
+
+def open_groc(groc_dir):
+    with mock.patch('groc.models.os.path.expanduser', return_value=groc_dir):
+        return Groc()
+
+
+def bench_size(size, repeat=DEFAULT_REPEAT, seed=0):
+    """
+    Build a database of size purchases and measure it.
+
+    Args:
+        size (int): number of purchases.
+        repeat (int): samples per latency measurement.
+        seed (int): seed of the generated purchases.
+
+    Returns:
+        dict: metrics, see the module docstring.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        groc_dir = os.path.join(tmp, 'groc')
+        g = open_groc(groc_dir)
+        g.init_groc()
+
+        generator = generate.PurchaseGenerator(seed=seed)
+        start = time.perf_counter()
+        built = 0
+        for chunk in generator.purchases(size):
+            with g.transaction():
+                built += g.add_purchases(chunk, True)
+        results['build_rows_per_sec'] = round(
+            built / (time.perf_counter() - start))
+
+        # Another seed, so the imported purchases are new
+        csv_path = os.path.join(tmp, 'import.csv')
+        import_rows = min(size, IMPORT_ROWS)
+        with open(csv_path, 'w', newline='', encoding='utf-8') as file:
+            generate.PurchaseGenerator(seed=seed + 1).write_csv(
+                file, import_rows)
+
+        with open(os.devnull, 'w') as devnull, \
+                mock.patch('sys.stdout', devnull):
+            start = time.perf_counter()
+            g.add_purchase_path(csv_path, True)
+            results['import_rows_per_sec'] = round(
+                import_rows / (time.perf_counter() - start))
+
+        rows = [{'date': date.isoformat(), 'store': store,
+                 'total': str(total / 100), 'description': description or ''}
+                for chunk in generate.PurchaseGenerator(seed=seed).columns(
+                    import_rows)
+                for date, store, total, description in zip(*chunk)]
+        start = time.perf_counter()
+        for row in rows:
+            utils.validate_row(row)
+        results['validate_rows_per_sec'] = round(
+            len(rows) / (time.perf_counter() - start))
+
+        months = [f'{month:02d}' for month in range(1, 13)]
+        results['list_ms'] = timed(
+            lambda i: g.list_purchases_limit(50).fetchall(), repeat)
+        results['list_month_ms'] = timed(
+            lambda i: g.list_purchases_date(
+                months[i % 12], '2019').fetchall(), repeat)
+        results['breakdown_ms'] = timed(
+            lambda i: g.breakdown(months, ['2018', '2019']).fetchall(),
+            repeat)
+
+        victims = sample_ids(os.path.join(groc_dir, 'groc.db'), repeat, seed)
+        results['delete_ms'] = timed(
+            lambda i: g.delete_purchase([victims[i]]), len(victims))
+
+        g.close()
+        results['db_size'] = os.path.getsize(os.path.join(groc_dir,
+                                                          'groc.db'))
+    results['peak_rss'] = peak_rss()
+    return results
+
+
+def _bench_child(size, repeat, seed, conn):
+    conn.send(bench_size(size, repeat, seed))
+    conn.close()
+
+
+def run(sizes, repeat=DEFAULT_REPEAT, seed=0):
+    """
+    Benchmark every size in a child process.
+
+    Returns:
+        dict: environment and per size results, JSON serializable.
+
+    Raises:
+        RuntimeError: if the benchmark of a size failed.
+    """
+    import multiprocessing
+
+    results = {}
+    for size in sizes:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        child = multiprocessing.Process(target=_bench_child,
+                                        args=(size, repeat, seed, sender))
+        child.start()
+        # Only the child writes, so recv sees EOF if it dies
+        sender.close()
+        try:
+            results[str(size)] = receiver.recv()
+        except EOFError:
+            pass
+        finally:
+            receiver.close()
+            child.join()
+        if child.exitcode != 0 or str(size) not in results:
+            raise RuntimeError(f'Benchmark of {size:,} purchases failed '
+                               f'(exit code {child.exitcode}).')
+    return {
+        'groc': VERSION,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare results with a baseline of the same sizes.
+
+    Args:
+        results (dict): output of run.
+        baseline (dict): earlier output of run.
+        threshold (float): tolerated relative change.
+
+    Returns:
+        list: regression messages, empty if there are none.
+    """
+    regressions = []
+    for size, metrics in results['results'].items():
+        base = baseline['results'].get(size)
+        if base is None:
+            continue
+        for name in THROUGHPUT_METRICS:
+            if name in base and metrics[name] < base[name] * (1 - threshold):
+                regressions.append(
+                    f'{size} rows: {name} {metrics[name]:,} < '
+                    f'baseline {base[name]:,}')
+        for name in LATENCY_METRICS:
+            for p, value in metrics.get(name, {}).items():
+                limit = base.get(name, {}).get(p)
+                if (limit is not None and value is not None and
+                        value > limit * (1 + threshold)):
+                    regressions.append(
+                        f'{size} rows: {name} {p} {value}ms > '
+                        f'baseline {limit}ms')
+    return regressions
+
+
+def format_results(results):
+    lines = []
+    for size, metrics in results['results'].items():
+        lines.append(f'{int(size):,} purchases')
+        for name, value in metrics.items():
+            if isinstance(value, dict):
+                value = ' '.join(f'{p}={v}ms' if v is not None else f'{p}=-'
+                                 for p, v in value.items())
+            else:
+                value = f'{value:,}'
+            lines.append(f'  {name:<22} {value}')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark groc.')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma separated purchase counts, '
+                             'e.g. 10000,1000000,10000000')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='samples per latency measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results to compare with')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='tolerated relative change, e.g. 0.1 for 10%%')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    try:
+        results = run(sizes, args.repeat, args.seed)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+    print(format_results(results))
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for message in regressions:
+            print(f'REGRESSION {message}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import exceptions
+from .models import Groc, PartitionedGroc
+
+
+""" asyncio facade of Groc
+
+    async with AsyncGroc() as g:
+        await g.add_purchase_path('purchases/', ignore_duplicate=True)
+        months = await g.breakdown(['01'], ['2019'])
+        async for rows in g.stream('list_purchases_limit', -1):
+            ...
+
+Writes run on a single writer thread, reports on a pool of reader
+threads (each with its own read-only connection), so the event loop is
+never blocked by the database. Report coroutines return lists of rows;
+stream() yields rows in batches for large results instead.
+"""
+# Reader threads running reports
+DEFAULT_READERS = 4
+
+# Rows per batch yielded by stream()
+DEFAULT_BATCH_SIZE = 500
+
+# Batches fetched ahead of the consumer of stream()
+STREAM_BUFFER = 2
+
+# Report methods of Groc returning a cursor
+CURSOR_REPORTS = ['select_by_id', 'breakdown', 'list_purchases_date',
+                  'list_purchases_limit', 'list_purchases_date_limit']
+
+
+class AsyncGroc:
+    """ Coroutine methods over a Groc instance, see module docstring. """
+
+    def __init__(self, groc=None, readers=DEFAULT_READERS, **kwargs):
+        """
+        Args:
+            groc: Groc instance to use, closed by aclose(). By default a
+                  Groc (or PartitionedGroc) with read-only report
+                  connections, created with kwargs.
+            readers (int): reader threads running reports.
+            kwargs: arguments of Groc.
+        """
+        if groc is None:
+            kwargs.setdefault('read_only_reports', True)
+            groc = Groc(**kwargs)
+            if groc.is_partitioned():
+                groc = PartitionedGroc(**kwargs)
+        self.groc = groc
+        self._writer = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix='groc-writer')
+        self._readers = ThreadPoolExecutor(max_workers=readers,
+                                           thread_name_prefix='groc-reader')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aclose(self):
+        """ Wait for running calls, then close the Groc instance. """
+        await self._write(self.groc.close)
+        self._writer.shutdown()
+        self._readers.shutdown()
+
+    def _run(self, executor, func, *args):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(executor, functools.partial(func, *args))
+
+    def _write(self, func, *args):
+        return self._run(self._writer, func, *args)
+
+    def _read(self, func, *args):
+        return self._run(self._readers, func, *args)
+
+    def _fetch(self, name, *args):
+        """ Run a cursor report on a reader thread, returning all rows. """
+        return self._read(
+            lambda: getattr(self.groc, name)(*args).fetchall())
+
+    # Reports
+
+    async def select_purchase_count(self):
+        return await self._read(self.groc.select_purchase_count)
+
+    async def select_by_id(self, ids):
+        return await self._fetch('select_by_id', ids)
+
+    async def breakdown(self, month, year):
+        return await self._fetch('breakdown', month, year)
+
+    async def list_purchases_date(self, month, year):
+        return await self._fetch('list_purchases_date', month, year)
+
+    async def list_purchases_limit(self, limit=50):
+        return await self._fetch('list_purchases_limit', limit)
+
+    async def list_purchases_date_limit(self, month, year, limit=50):
+        return await self._fetch('list_purchases_date_limit',
+                                 month, year, limit)
+
+    async def stream(self, name, *args, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Stream the rows of a report in batches.
+
+        The report runs on a reader thread, fetching at most STREAM_BUFFER
+        batches ahead of the consumer. Breaking out of the loop stops it.
+
+        Args:
+            name (str): report method of Groc, one of CURSOR_REPORTS.
+            args: arguments of the report method.
+            batch_size (int): rows per batch.
+
+        Yields:
+            list: rows of the report.
+
+        Raises:
+            ValueError: if name is not a report.
+        """
+        if name not in CURSOR_REPORTS:
+            raise ValueError(f'{name!r} is not one of {CURSOR_REPORTS}.')
+
+        loop = asyncio.get_running_loop()
+        batches = asyncio.Queue(maxsize=STREAM_BUFFER)
+        stopped = threading.Event()
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(batches.put(item), loop).result()
+
+        def produce():
+            try:
+                cursor = getattr(self.groc, name)(*args)
+                while not stopped.is_set():
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    put(rows)
+            except Exception as e:
+                put(e)
+            else:
+                put(None)
+
+        producer = self._read(produce)
+        try:
+            while True:
+                item = await batches.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+            # Unblock the producer until it sees stopped
+            while not producer.done():
+                try:
+                    batches.get_nowait()
+                except asyncio.QueueEmpty:
+                    await asyncio.sleep(0)
+            await producer
+
+    # Writes
+
+    async def add_purchase_manual(self, row, ignore_duplicate):
+        return await self._write(self.groc.add_purchase_manual,
+                                 row, ignore_duplicate)
+
+    async def delete_purchase(self, ids):
+        return await self._write(self.groc.delete_purchase, ids)
+
+    async def clear_db(self):
+        return await self._write(self.groc.clear_db)
+
+    async def add_purchase_path(self, path, ignore_duplicate):
+        """
+        Add purchases of a csv file or directory, see Groc.add_purchase_path.
+
+        The import runs in one transaction. Cancelling the task stops it
+        and rolls it back entirely; the task only finishes cancelling
+        once the rollback is done. Partitioned databases have no shared
+        transaction, so purchases added before cancelling are kept.
+
+        Returns:
+            int: count of how many purchases added.
+
+        Raises:
+            asyncio.CancelledError: if the task was cancelled.
+        """
+        cancelled = threading.Event()
+
+        def run():
+            if self.groc.is_partitioned():
+                return self.groc.add_purchase_path(path, ignore_duplicate,
+                                                   cancelled)
+            with self.groc.transaction():
+                return self.groc.add_purchase_path(path, ignore_duplicate,
+                                                   cancelled)
+
+        future = self._write(run)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancelled.set()
+            try:
+                await future
+            except exceptions.ImportCancelled:
+                pass
+            raise
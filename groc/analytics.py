@@ -0,0 +1,296 @@
+import datetime
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+""" Columnar analytics
+
+Purchases are loaded once into compact typed arrays (one per column)
+instead of one sqlite3.Row per purchase, and grouped in memory. With
+NumPy installed (pip install groc[analytics]) the groupings are
+vectorized, otherwise they run over the same arrays in plain Python.
+"""
+
+# Days from 0001-01-01 (proleptic ordinal 1) to 1970-01-01
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+# Rows fetched per batch while loading
+LOAD_BATCH_SIZE = 10000
+
+
+""" SQLite specific statements, formatted with {schema} """
+sqlite_select_purchase_columns = """SELECT
+    CAST(julianday(purchase_date) - 2440587.5 AS INTEGER) AS day,
+    total,
+    store_id,
+    purchase_year * 12 + purchase_month - 1 AS month_key
+FROM {schema}.purchase;"""
+
+sqlite_select_stores = """SELECT id, name FROM {schema}.store;"""
+
+
+def day_to_date(day):
+    """ Date of a day number (days since 1970-01-01). """
+    return datetime.date.fromordinal(EPOCH_ORDINAL + int(day))
+
+
+def round_half_away(value):
+    """ Round like SQLite's round(): halves away from zero. """
+    return int(math.copysign(math.floor(abs(value) + 0.5), value))
+
+
+def format_money(cents):
+    """ Format cents like the total_money converter (see db). """
+    return f'${cents / 100:,.2f}'
+
+
+def _group_python(keys, cents, store_ids):
+    groups = {}
+    for key, total, store_id in zip(keys, cents, store_ids):
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [1, total, total, total, {store_id}]
+        else:
+            group[0] += 1
+            group[1] += total
+            if total < group[2]:
+                group[2] = total
+            elif total > group[3]:
+                group[3] = total
+            group[4].add(store_id)
+    return {key: (count, total, low, high, len(stores))
+            for key, (count, total, low, high, stores) in groups.items()}
+
+
+def _group_numpy(keys, cents, store_ids):
+    if not len(keys):
+        return {}
+    uniq, inverse = numpy.unique(keys, return_inverse=True)
+    order = numpy.argsort(inverse, kind='stable')
+    sorted_cents = cents[order]
+    counts = numpy.bincount(inverse, minlength=len(uniq))
+    starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+
+    totals = numpy.add.reduceat(sorted_cents, starts)
+    lows = numpy.minimum.reduceat(sorted_cents, starts)
+    highs = numpy.maximum.reduceat(sorted_cents, starts)
+
+    # Distinct (group, store) pairs, counted per group
+    span = int(store_ids.max()) + 1
+    pairs = numpy.unique(inverse.astype(numpy.int64) * span + store_ids)
+    store_counts = numpy.bincount(pairs // span, minlength=len(uniq))
+
+    return {
+        int(key): (int(count), int(total), int(low), int(high), int(stores))
+        for key, count, total, low, high, stores in zip(
+            uniq, counts, totals, lows, highs, store_counts)
+    }
+
+
+def _stats(count, total, low, high, stores):
+    return {
+        'count': count,
+        'total': total,
+        'min': low,
+        'max': high,
+        'avg': round_half_away(total / count),
+        'store_count': stores,
+    }
+
+
+class PurchaseColumns:
+    """
+    Purchases loaded into typed columns for fast in-memory grouping.
+
+    Columns (array.array, or NumPy views of them):
+        day: int32 days since 1970-01-01.
+        cents: int64 purchase totals in cents.
+        store_id: int32 index into stores.
+        month_key: int32 year * 12 + month - 1.
+
+        columns = PurchaseColumns().load(conn)
+        columns.breakdown(['01', '02'], ['2019'])
+    """
+
+    def __init__(self, use_numpy=None):
+        """
+        Args:
+            use_numpy (bool): group with NumPy, None to use it if installed.
+        """
+        if use_numpy and numpy is None:
+            raise ImportError('NumPy is not installed, '
+                              'see pip install groc[analytics].')
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self.day = array('i')
+        self.cents = array('q')
+        self.store_id = array('i')
+        self.month_key = array('i')
+        self.stores = []
+        self._store_ids = {}
+
+    def __len__(self):
+        return len(self.cents)
+
+    def load(self, conn, schema='main'):
+        """
+        Append the purchases of a database to the columns.
+
+        Store ids are renumbered, so purchases of several databases
+        (partitions, archive) can be loaded into the same columns.
+
+        Args:
+            conn: SQLite connection object.
+            schema (str): schema of the database on the connection.
+
+        Returns:
+            PurchaseColumns: self.
+        """
+        store_map = {}
+        for store_id, name in conn.execute(
+                sqlite_select_stores.format(schema=schema)):
+            if name not in self._store_ids:
+                self._store_ids[name] = len(self.stores)
+                self.stores.append(name)
+            store_map[store_id] = self._store_ids[name]
+
+        cursor = conn.cursor()
+        # Plain tuples, sqlite3.Row objects are not needed here
+        cursor.row_factory = None
+        cursor.execute(sqlite_select_purchase_columns.format(schema=schema))
+        while True:
+            rows = cursor.fetchmany(LOAD_BATCH_SIZE)
+            if not rows:
+                break
+            days, cents, store_ids, month_keys = zip(*rows)
+            self.day.extend(days)
+            self.cents.extend(cents)
+            self.store_id.extend(store_map[i] for i in store_ids)
+            self.month_key.extend(month_keys)
+        return self
+
+    def _column(self, name):
+        column = getattr(self, name)
+        if not self.use_numpy:
+            return column
+        dtype = numpy.int64 if column.typecode == 'q' else numpy.int32
+        if not len(column):
+            return numpy.empty(0, dtype=dtype)
+        return numpy.frombuffer(column, dtype=dtype)
+
+    def _group(self, keys, selected=None):
+        """
+        Group purchases by a key column.
+
+        Args:
+            keys: key per purchase (same type as the columns).
+            selected (set): optional, only group these keys.
+
+        Returns:
+            dict: key -> (count, total, min, max, distinct store count).
+        """
+        cents = self._column('cents')
+        store_ids = self._column('store_id')
+
+        if not self.use_numpy:
+            if selected is not None:
+                rows = [(k, c, s) for k, c, s in zip(keys, cents, store_ids)
+                        if k in selected]
+                keys, cents, store_ids = (zip(*rows) if rows
+                                          else ((), (), ()))
+            return _group_python(keys, cents, store_ids)
+
+        if selected is not None:
+            mask = numpy.isin(keys, numpy.fromiter(selected, dtype=keys.dtype))
+            keys, cents, store_ids = keys[mask], cents[mask], store_ids[mask]
+        return _group_numpy(keys, cents, store_ids)
+
+    def monthly(self, month=None, year=None):
+        """
+        Purchase stats per month.
+
+        Args:
+            month (list): two digit months, None for all.
+            year (list): four digit years, None for all.
+
+        Returns:
+            list: dicts with year, month, count, total, min, max, avg
+                  (cents) and store_count, newest month first.
+        """
+        keys = self._column('month_key')
+        selected = None
+        if month is not None or year is not None:
+            present = (numpy.unique(keys).tolist() if self.use_numpy
+                       else set(keys))
+            selected = {
+                key for key in present
+                if (month is None or f'{key % 12 + 1:02d}' in month) and
+                   (year is None or str(key // 12) in year)
+            }
+        groups = self._group(keys, selected)
+        return [dict(year=key // 12, month=key % 12 + 1, **_stats(*groups[key]))
+                for key in sorted(groups, reverse=True)]
+
+    def breakdown(self, month, year):
+        """
+        Compute the rows of Groc.breakdown.
+
+        Args:
+            month (list): two digit months.
+            year (list): four digit years.
+
+        Returns:
+            list: dicts keyed like the breakdown columns, with the same
+                  (formatted) values.
+        """
+        return [{
+            'num_month': f"{row['month']:02d}",
+            'year': str(row['year']),
+            'month': datetime.date(
+                row['year'], row['month'], 1).strftime('%b'),
+            'total': format_money(row['total']),
+            'purchase count': row['count'],
+            'min purchase': format_money(row['min']),
+            'max purchase': format_money(row['max']),
+            'avg purchase': format_money(row['avg']),
+            'store count': row['store_count'],
+        } for row in self.monthly([str(m) for m in month],
+                                  [str(y) for y in year])]
+
+    def by_store(self):
+        """
+        Purchase stats per store.
+
+        Returns:
+            list: dicts with store, count, total, min, max and avg (cents),
+                  highest total first.
+        """
+        groups = self._group(self._column('store_id'))
+        rows = []
+        for store_id, stats in groups.items():
+            row = dict(store=self.stores[store_id], **_stats(*stats))
+            del row['store_count']
+            rows.append(row)
+        return sorted(rows, key=lambda row: (-row['total'], row['store']))
+
+    def by_week(self):
+        """
+        Purchase stats per week, weeks starting on Monday.
+
+        Returns:
+            list: dicts with week (date of the Monday), count, total, min,
+                  max, avg (cents) and store_count, newest week first.
+        """
+        days = self._column('day')
+        # 1970-01-01 was a Thursday, (day + 3) % 7 is 0 on Mondays
+        if self.use_numpy:
+            weeks = days - (days + 3) % 7
+        else:
+            weeks = array('i', (day - (day + 3) % 7 for day in days))
+        groups = self._group(weeks)
+        return [dict(week=day_to_date(key), **_stats(*groups[key]))
+                for key in sorted(groups, reverse=True)]
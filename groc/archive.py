@@ -0,0 +1,288 @@
+import sqlite3
+
+from . import db, exceptions, partitions
+
+
+""" Archive database
+
+Purchases older than a cutoff are moved from groc.db into archive.db
+(see archive_path), which has the same schema, so the hot database
+stays small. The archive is ATTACHed to a connection as schema
+'archive' when it is needed: reports including the archive combine both
+schemas with UNION ALL, and imports check the archive for duplicates.
+Purchases keep their ids, AUTOINCREMENT never hands out an id of
+groc.db twice.
+"""
+ARCHIVE_NAME = 'archive.db'
+ARCHIVE_SCHEMA = 'archive'
+SCHEMAS = ['main', ARCHIVE_SCHEMA]
+
+# Purchases moved per transaction.
+DEFAULT_CHUNK_SIZE = 5000
+
+
+""" SQLite specific statements """
+sqlite_create_archive_batch = """CREATE TEMP TABLE IF NOT EXISTS
+archive_batch (id INTEGER PRIMARY KEY);"""
+
+sqlite_clear_archive_batch = """DELETE FROM temp.archive_batch;"""
+
+sqlite_fill_archive_batch = """INSERT INTO temp.archive_batch (id)
+SELECT id
+FROM main.purchase
+WHERE purchase_year <= ? AND purchase_date < ?
+LIMIT ?;"""
+
+sqlite_count_archivable = """SELECT
+    COUNT(*) AS purchase_count
+FROM main.purchase
+WHERE purchase_year <= ? AND purchase_date < ?;"""
+
+sqlite_archive_stores = """INSERT OR IGNORE INTO archive.store (name)
+SELECT s.name
+FROM main.store s
+WHERE s.id IN (
+    SELECT p.store_id
+    FROM main.purchase p
+    WHERE p.id IN (SELECT id FROM temp.archive_batch)
+);"""
+
+sqlite_archive_purchases = """INSERT OR IGNORE INTO archive.purchase
+    (id, purchase_date, total, description, store_id)
+SELECT
+    p.id,
+    p.purchase_date,
+    p.total,
+    p.description,
+    a.id
+FROM main.purchase p
+INNER JOIN main.store s ON p.store_id = s.id
+INNER JOIN archive.store a ON a.name = s.name
+WHERE
+    p.id IN (SELECT id FROM temp.archive_batch)
+    AND NOT EXISTS (
+        SELECT 1 FROM archive.purchase ap
+        WHERE ap.purchase_date = p.purchase_date
+            AND ap.total = p.total
+            AND ap.store_id = a.id
+            AND ap.description IS p.description
+    );"""
+
+sqlite_delete_archived = """DELETE FROM main.purchase
+WHERE id IN (SELECT id FROM temp.archive_batch);"""
+
+sqlite_delete_orphan_stores = """DELETE FROM main.store
+WHERE id NOT IN (SELECT store_id FROM main.purchase);"""
+
+sqlite_breakdown_purchases = """SELECT
+    p.purchase_year,
+    p.purchase_month,
+    p.total,
+    s.name AS store
+FROM {schema}.purchase p
+INNER JOIN {schema}.store s ON p.store_id = s.id
+WHERE p.purchase_month IN (%s) AND p.purchase_year IN (%s)"""
+
+sqlite_count_and_total_per_month = """SELECT
+    printf('%%02d', p.purchase_month) AS num_month,
+    CAST(p.purchase_year AS TEXT) AS year,
+    printf('%%04d-%%02d-01', p.purchase_year, p.purchase_month)
+        AS "month [purchase_month_abbreviated]",
+    SUM(p.total) as "total [total_money]",
+    COUNT(*) AS "purchase count",
+    MIN(p.total) as "min purchase [total_money]",
+    MAX(p.total) as "max purchase [total_money]",
+    round(avg(p.total)) as "avg purchase [total_money]",
+    COUNT(DISTINCT p.store) as "store count"
+FROM (
+{purchases}
+) p
+GROUP BY
+    p.purchase_year,
+    p.purchase_month
+ORDER BY p.purchase_year DESC, p.purchase_month DESC;"""
+
+
+def archive_path(db_path):
+    """ Path of the archive database of a database, see db.sidecar_path. """
+    return db.sidecar_path(db_path, ARCHIVE_NAME)
+
+
+def create_archive(path):
+    """
+    Create the archive database, or bring an existing one up to the
+    latest schema version.
+
+    Args:
+        path (str): path of the archive database.
+    """
+    conn = db.create_connection(path)
+    try:
+        db.setup_db(conn)
+    finally:
+        conn.close()
+
+
+def is_attached(conn):
+    """ Check whether the archive is attached to a connection. """
+    return any(row[1] == ARCHIVE_SCHEMA
+               for row in conn.execute('PRAGMA database_list;'))
+
+
+def attach(conn, path):
+    """
+    Attach the archive to a connection, if it is not attached yet.
+    Must not be called inside a transaction.
+
+    Args:
+        conn: SQLite connection to groc.db.
+        path (str): path of the archive database.
+
+    Raises:
+        exceptions.DatabaseError: if the archive cannot be attached.
+    """
+    if is_attached(conn):
+        return
+    try:
+        conn.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA};', (path,))
+    except sqlite3.DatabaseError as e:
+        raise exceptions.DatabaseError(f'Error attaching archive: {e}')
+
+
+def _cutoff_values(before):
+    return (before.year, before.isoformat())
+
+
+def count_archivable(conn, before):
+    """
+    Count purchases older than a cutoff date.
+
+    Args:
+        conn: SQLite connection to groc.db.
+        before (datetime.date): cutoff, purchases before it are counted.
+
+    Returns:
+        int: number of purchases.
+    """
+    return db.query(conn, sqlite_count_archivable,
+                    _cutoff_values(before)).fetchone()['purchase_count']
+
+
+@db.retry_on_lock
+def _move_chunk(conn, before, chunk_size):
+    """ Move one chunk of purchases to the attached archive. """
+    try:
+        conn.execute('BEGIN IMMEDIATE;')
+        try:
+            conn.execute(sqlite_clear_archive_batch)
+            moved = conn.execute(
+                sqlite_fill_archive_batch,
+                _cutoff_values(before) + (chunk_size,)).rowcount
+            if moved:
+                conn.execute(sqlite_archive_stores)
+                conn.execute(sqlite_archive_purchases)
+                conn.execute(sqlite_delete_archived)
+                for schema in SCHEMAS:
+                    db.bump_data_version(conn, schema)
+            conn.commit()
+            return moved
+        except BaseException:
+            conn.rollback()
+            raise
+    except sqlite3.DatabaseError as e:
+        if db.is_lock_error(e):
+            raise exceptions.DatabaseLockedError(db.LOCKED_MESSAGE)
+        raise exceptions.DatabaseError(f'Archiving failed: {e}')
+
+
+def archive_before(conn, path, before, chunk_size=DEFAULT_CHUNK_SIZE,
+                   progress=None):
+    """
+    Move purchases older than a cutoff date (and stores no longer used)
+    to the archive database.
+
+    Purchases are moved in chunks, each in its own short transaction, so
+    other groc processes can read and write in between and an interrupted
+    run can simply be repeated.
+
+    Args:
+        conn: SQLite connection to groc.db, not inside a transaction.
+        path (str): path of the archive database, created if needed.
+        before (datetime.date): cutoff, purchases before it are moved.
+        chunk_size (int): purchases per transaction.
+        progress (callable): optional, called as progress(moved) after
+                             each chunk.
+
+    Returns:
+        int: number of purchases moved.
+    """
+    create_archive(path)
+    attach(conn, path)
+    conn.execute(sqlite_create_archive_batch)
+
+    total = 0
+    while True:
+        moved = _move_chunk(conn, before, chunk_size)
+        if not moved:
+            break
+        total += moved
+        if progress:
+            progress(moved)
+
+    if total:
+        try:
+            with conn:
+                conn.execute(sqlite_delete_orphan_stores)
+        except sqlite3.DatabaseError as e:
+            if db.is_lock_error(e):
+                raise exceptions.DatabaseLockedError(db.LOCKED_MESSAGE)
+            raise exceptions.DatabaseError(f'Archiving failed: {e}')
+    return total
+
+
+""" Queries over groc.db and the attached archive """
+
+
+def select_purchase_count(conn):
+    """ Count purchases of groc.db and the archive. """
+    sql = partitions.union_sql(partitions.sqlite_partition_count, SCHEMAS)
+    return sum(row['purchase_count'] for row in db.query(conn, sql))
+
+
+def get_purchases_limit(conn, limit):
+    """ See db.get_purchases_limit, including archived purchases. """
+    sql = partitions.union_sql(partitions.sqlite_partition_purchases,
+                               SCHEMAS, suffix='\nORDER BY date DESC\nLIMIT ?;')
+    return db.query(conn, sql, (limit,))
+
+
+def get_purchases_date(conn, month, year):
+    """ See db.get_purchases_date, including archived purchases. """
+    sql = partitions.union_sql(
+        partitions.sqlite_partition_purchases, SCHEMAS,
+        ' WHERE p.purchase_month = ? AND p.purchase_year = ?',
+        '\nORDER BY date DESC;')
+    return db.query(conn, sql, (int(month), int(year)) * len(SCHEMAS))
+
+
+def get_purchases_date_limit(conn, month, year, limit):
+    """ See db.get_purchases_date_limit, including archived purchases. """
+    sql = partitions.union_sql(
+        partitions.sqlite_partition_purchases, SCHEMAS,
+        ' WHERE p.purchase_month = ? AND p.purchase_year = ?',
+        '\nORDER BY date DESC\nLIMIT ?;')
+    return db.query(conn, sql,
+                    (int(month), int(year)) * len(SCHEMAS) + (limit,))
+
+
+def select_count_total_per_month(conn, month, year):
+    """
+    See db.select_count_total_per_month, including archived purchases.
+    A month split by the cutoff is aggregated over both databases.
+    """
+    purchases = partitions.union_sql(sqlite_breakdown_purchases, SCHEMAS)
+    sql = db.multiple_parameter_substitution(
+        sqlite_count_and_total_per_month.format(purchases=purchases),
+        [len(month), len(year)] * len(SCHEMAS))
+    values = [int(m) for m in month] + [int(y) for y in year]
+    return db.query(conn, sql, values * len(SCHEMAS))
@@ -0,0 +1,237 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from . import db, exceptions, migrations
+
+
+""" Online backups with the SQLite backup API
+
+Pages are copied in steps of a few hundred, sleeping between steps so
+other groc processes can keep reading and writing. The source connection
+holds one read transaction for the whole backup: in WAL mode it keeps
+seeing the snapshot taken when the backup started, so the copy is
+consistent even while an import commits, and the backup is never
+restarted by those commits.
+"""
+# Pages copied per backup step.
+DEFAULT_PAGES = 256
+
+# Seconds slept between backup steps.
+DEFAULT_STEP_SLEEP = 0.01
+
+GZIP_SUFFIX = '.gz'
+
+
+def is_gzip(path):
+    """ Check whether a backup path is gzip compressed by its name. """
+    return path.endswith(GZIP_SUFFIX)
+
+
+def _step_progress(sleep, progress):
+    """ Backup progress callback sleeping between steps. """
+    def callback(status, remaining, total):
+        if progress:
+            progress(total - remaining, total)
+        if remaining and sleep:
+            time.sleep(sleep)
+    return callback
+
+
+def _stats(conn, start):
+    """ Size of a copied database and the copy speed since start. """
+    page_count = conn.execute('PRAGMA page_count;').fetchone()[0]
+    page_size = conn.execute('PRAGMA page_size;').fetchone()[0]
+    seconds = time.monotonic() - start
+    return {
+        'pages': page_count,
+        'size': page_count * page_size,
+        'seconds': seconds,
+        'pages_per_second': page_count / seconds if seconds else None,
+    }
+
+
+def copy(source, target, pages=-1, sleep=0, progress=None):
+    """
+    Copy a database between two connections with the backup API.
+
+    Args:
+        source: SQLite connection to copy from.
+        target: SQLite connection to copy to, not inside a transaction.
+        pages (int): pages copied per step, -1 for all at once.
+        sleep (float): seconds slept between steps.
+        progress (callable): optional, called as progress(copied, total)
+                             after each step.
+
+    Raises:
+        exceptions.DatabaseLockedError: if a database stayed locked.
+        exceptions.DatabaseError: if the copy failed.
+    """
+    try:
+        source.backup(target, pages=pages,
+                      progress=_step_progress(sleep, progress))
+    except sqlite3.DatabaseError as e:
+        if db.is_lock_error(e):
+            raise exceptions.DatabaseLockedError(db.LOCKED_MESSAGE)
+        raise exceptions.DatabaseError(f'Backup failed: {e}')
+
+
+def backup(conn, dest, pages=DEFAULT_PAGES, sleep=DEFAULT_STEP_SLEEP,
+           compress=None, overwrite=False, progress=None):
+    """
+    Copy a live database to a file.
+
+    Args:
+        conn: SQLite connection to back up, not inside a transaction.
+        dest (str): path of the backup file.
+        pages (int): pages copied per step.
+        sleep (float): seconds slept between steps.
+        compress (bool): gzip the backup, None to decide by a .gz suffix.
+        overwrite (bool): replace an existing file at dest.
+        progress (callable): optional, called as progress(copied, total)
+                             after each step.
+
+    Returns:
+        dict: pages, size (bytes), seconds and pages_per_second.
+
+    Raises:
+        exceptions.DatabaseError: if dest exists or the backup failed.
+    """
+    if compress is None:
+        compress = is_gzip(dest)
+    if os.path.exists(dest) and not overwrite:
+        raise exceptions.DatabaseError(f'{dest} already exists!')
+
+    if compress:
+        fd, target_path = tempfile.mkstemp(
+            suffix='.db', dir=os.path.dirname(os.path.abspath(dest)))
+        os.close(fd)
+    else:
+        target_path = dest
+        if os.path.exists(dest):
+            os.remove(dest)
+
+    start = time.monotonic()
+    try:
+        target = sqlite3.connect(target_path)
+        try:
+            with db.read_snapshot(conn):
+                # Start the read transaction before the first step
+                conn.execute('SELECT COUNT(*) FROM sqlite_master;').fetchone()
+                copy(conn, target, pages, sleep, progress)
+            # A standalone file, without a -wal file next to it
+            target.execute('PRAGMA journal_mode = DELETE;')
+            stats = _stats(target, start)
+        finally:
+            target.close()
+
+        if compress:
+            with open(target_path, 'rb') as src, gzip.open(dest, 'wb') as out:
+                shutil.copyfileobj(src, out)
+    finally:
+        if compress and os.path.exists(target_path):
+            os.remove(target_path)
+
+    return stats
+
+
+def open_backup(path):
+    """
+    Open a backup file, decompressing gzip backups to a temporary file.
+
+    Args:
+        path (str): path of the backup file.
+
+    Returns:
+        tuple: (SQLite connection, temporary file path or None).
+
+    Raises:
+        exceptions.DatabaseError: if the file is not a groc database.
+    """
+    if not os.path.isfile(path):
+        raise exceptions.DatabaseError(f'{path} could not be found!')
+
+    temp_path = None
+    try:
+        if is_gzip(path):
+            fd, temp_path = tempfile.mkstemp(suffix='.db')
+            with os.fdopen(fd, 'wb') as out, gzip.open(path, 'rb') as src:
+                shutil.copyfileobj(src, out)
+
+        conn = db.create_connection(temp_path or path, read_only=True,
+                                    migrate=False)
+        if not migrations.is_initialized(conn):
+            raise exceptions.DatabaseError(
+                f'{path} is not a groc database backup.')
+        migrations.pending_migrations(conn)
+    except (OSError, sqlite3.DatabaseError):
+        if temp_path:
+            os.remove(temp_path)
+        raise exceptions.DatabaseError(f'{path} is not a groc database backup.')
+    except exceptions.DatabaseError:
+        if temp_path:
+            os.remove(temp_path)
+        raise
+    return conn, temp_path
+
+
+def restore(conn, src, pages=DEFAULT_PAGES, sleep=DEFAULT_STEP_SLEEP,
+            progress=None):
+    """
+    Replace the contents of a database with a backup.
+
+    Backups of an older schema version are migrated after restoring.
+    The restored database gets a new database id, so results cached
+    for the database it was copied from are not reused.
+
+    Args:
+        conn: SQLite connection to restore into, not inside a transaction.
+        src (str): path of the backup file, gzip compressed if it ends
+                   with .gz.
+        pages (int): pages copied per step.
+        sleep (float): seconds slept between steps.
+        progress (callable): optional, called as progress(copied, total)
+                             after each step.
+
+    Returns:
+        dict: pages, size (bytes), seconds and pages_per_second.
+
+    Raises:
+        exceptions.DatabaseError: if src is not a groc database backup.
+    """
+    start = time.monotonic()
+    source, temp_path = open_backup(src)
+    try:
+        copy(source, conn, pages, sleep, progress)
+        stats = _stats(source, start)
+    finally:
+        source.close()
+        if temp_path:
+            os.remove(temp_path)
+
+    migrations.migrate(conn)
+    db.execute_sql(conn, db.sqlite_reset_db_id)
+    return stats
+
+
+def purchase_count(src):
+    """
+    Count the purchases stored in a backup file.
+
+    Args:
+        src (str): path of the backup file.
+
+    Returns:
+        int: number of purchases.
+    """
+    source, temp_path = open_backup(src)
+    try:
+        cur = db.select_purchase_count(source)
+        return cur.fetchone()['purchase_count']
+    finally:
+        source.close()
+        if temp_path:
+            os.remove(temp_path)
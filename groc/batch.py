@@ -0,0 +1,269 @@
+import contextlib
+import datetime
+import json
+import shlex
+
+from . import exceptions, utils
+
+
+""" Batch mode
+
+groc batch runs many commands in one process, on one connection:
+
+    add --store "Store Foo" --total 20.00 --date 2019-01-01
+    {"command": "delete", "id": [3, 4]}
+    list --limit 10
+
+A line is either a command with the same options as on the command
+line, or a JSON object with a "command" key and one key per option
+(true for flags, a list for repeated options). Blank lines and
+# comments are skipped. Options are parsed by the click commands, the
+handlers below run them on a Groc instance and return plain data, so
+the CLI can print it as a JSON stream.
+"""
+COMMANDS = ['add', 'delete', 'list', 'breakdown', 'export']
+
+# Export/CSV import field names
+EXPORT_FIELDS = ['date', 'store', 'total', 'description']
+
+
+def parse_line(line):
+    """
+    Split a batch line into a command name and its arguments.
+
+    Args:
+        line (str): a command line or a JSON object.
+
+    Returns:
+        tuple: (command name, list of argument strings), None for blank
+               and comment lines.
+
+    Raises:
+        exceptions.BatchError: if the line cannot be parsed.
+    """
+    line = line.strip()
+    if line.startswith('{'):
+        try:
+            options = json.loads(line)
+        except ValueError as e:
+            raise exceptions.BatchError(f'Invalid JSON: {e}')
+        if not isinstance(options, dict) or 'command' not in options:
+            raise exceptions.BatchError('JSON lines need a "command" key.')
+        name = options.pop('command')
+        args = json_args(options)
+    else:
+        try:
+            args = shlex.split(line, comments=True)
+        except ValueError as e:
+            raise exceptions.BatchError(f'Invalid line: {e}')
+        if not args:
+            return None
+        name = args.pop(0)
+
+    if name not in COMMANDS:
+        raise exceptions.BatchError(
+            f'Unknown command {name!r}, expected one of: '
+            f'{", ".join(COMMANDS)}.')
+    return name, args
+
+
+def json_args(options):
+    """
+    Command line arguments of JSON options: true for flags, a list for
+    repeated options, false and null are left out.
+
+    Args:
+        options (dict): option name (like dry_run) -> value.
+
+    Returns:
+        list: argument strings, e.g. ['--dry-run', '--id', '1'].
+    """
+    args = []
+    for key, value in options.items():
+        option = '--' + key.replace('_', '-')
+        values = value if isinstance(value, list) else [value]
+        for value in values:
+            if value is True:
+                args.append(option)
+            elif value is not False and value is not None:
+                args.extend([option, str(value)])
+    return args
+
+
+def parse_params(group, name, args, parent=None):
+    """
+    Parse command arguments with the click command of the same name.
+
+    Args:
+        group (click.Group): the groc command group.
+        name (str): command name, one of COMMANDS.
+        args (list): argument strings.
+        parent (click.Context): optional, context of the group.
+
+    Returns:
+        dict: the command's parameters.
+
+    Raises:
+        click.ClickException: if the arguments are invalid.
+    """
+    command = group.get_command(parent, name)
+    with command.make_context(name, args, parent=parent) as ctx:
+        return ctx.params
+
+
+def default_month_year(month, year):
+    """
+    Months and years of a breakdown: all months of the years if only
+    years are given, the current month and year otherwise.
+
+    Args:
+        month (list): two digit months, possibly empty.
+        year (list): four digit years, possibly empty.
+
+    Returns:
+        tuple: (months, years).
+    """
+    if year and not month:
+        month = [f'{m:02d}' for m in range(1, 13)]
+    if not year:
+        year = [datetime.date.today().strftime('%Y')]
+    if not month:
+        month = [datetime.date.today().strftime('%m')]
+    return month, year
+
+
+@contextlib.contextmanager
+def _including_archive(g, include_archive):
+    # Only ever turned on, so a Groc created with include_archive
+    # (like the one of groc serve) keeps including the archive
+    if not include_archive or g.include_archive:
+        yield
+        return
+    g.include_archive = True
+    try:
+        yield
+    finally:
+        g.include_archive = False
+
+
+def _quiet_progress(rows, bytes_read, total_bytes, finished):
+    """
+    Progress callback of csv imports (see db.insert_from_csv_dict), it
+    replaces their per file messages, which would end up in the result
+    stream.
+    """
+
+
+def run_add(g, params):
+    if params['source']:
+        count = g.add_purchase_path(params['source'],
+                                    params['ignore_duplicate'],
+                                    progress=_quiet_progress)
+    elif params['store']:
+        added = g.add_purchase_manual({
+            'date': params['date'],
+            'total': params['total'],
+            'store': params['store'],
+            'description': params['description']},
+            params['ignore_duplicate'])
+        count = 1 if added else 0
+    else:
+        raise exceptions.BatchError(
+            'add needs --source or --store and --total.')
+    return {'added': count}
+
+
+def run_delete(g, params):
+    ids = [row['id'] for row in g.select_purchase_ids(params['id'])]
+    if ids and not params['dry_run']:
+        g.delete_purchase(ids)
+    return {'deleted': ids, 'dry_run': params['dry_run']}
+
+
+def run_list(g, params):
+    month = params['month'] and params['month'].strftime('%m')
+    year = params['year'] and params['year'].strftime('%Y')
+    limit = params['limit']
+    with _including_archive(g, params['include_archive']):
+        if month and params['all']:
+            purchases = g.list_purchases_date(month, year)
+        elif month:
+            purchases = g.list_purchases_date_limit(month, year, limit)
+        else:
+            purchases = g.list_purchases_limit(limit)
+        return {'purchases': [dict(row) for row in purchases]}
+
+
+def run_breakdown(g, params):
+    month, year = default_month_year(params['month'], params['year'])
+    with _including_archive(g, params['include_archive']):
+        return {'months': [dict(row) for row in g.breakdown(month, year)]}
+
+
+def export_purchases(g, month=None, year=None):
+    """
+    Purchases as records in the CSV import format (see EXPORT_FIELDS),
+    all of them or those of a month and year, newest first.
+
+    Args:
+        g: Groc instance.
+        month (str): two digit month, None for all purchases.
+        year (str): four digit year.
+
+    Yields:
+        dict: purchase records.
+    """
+    for purchase in g.iter_purchases(month, year):
+        yield {
+            'date': purchase.date.isoformat(),
+            'store': purchase.store,
+            'total': utils.format_cents(purchase.total),
+            'description': purchase.description,
+        }
+
+
+def run_export(g, params):
+    month = params['month'] and params['month'].strftime('%m')
+    year = params['year'] and params['year'].strftime('%Y')
+    with _including_archive(g, params['include_archive']):
+        return {'purchases': list(export_purchases(g, month, year))}
+
+
+HANDLERS = {
+    'add': run_add,
+    'delete': run_delete,
+    'list': run_list,
+    'breakdown': run_breakdown,
+    'export': run_export,
+}
+
+
+def run(g, name, params):
+    """
+    Run a command on a Groc instance.
+
+    Args:
+        g: Groc instance.
+        name (str): command name, one of COMMANDS.
+        params (dict): the command's parsed click parameters.
+
+    Returns:
+        dict: JSON serializable command result.
+    """
+    return HANDLERS[name](g, params)
+
+
+def result_line(number, name, result=None, error=None):
+    """ Format a command result (or error) as a JSON stream line. """
+    line = {'line': number, 'command': name}
+    if error is None:
+        line.update(ok=True, result=result)
+    else:
+        line.update(ok=False, error=error)
+    return json.dumps(line, default=str)
+
+
+def transaction_line(committed):
+    """ Format the outcome of a batch transaction as a JSON stream line. """
+    return json.dumps(
+        {'transaction': 'committed' if committed else 'rolled back'})
@@ -0,0 +1,291 @@
+import json
+import sqlite3
+import threading
+import time
+
+from . import db, exceptions, metrics
+
+
+""" Report result cache
+
+Results of reporting methods are stored in cache.db next to the
+database (<stem>.cache.db next to databases other than the default),
+keyed by method and arguments. Every entry records the data version
+of the database it was computed from (see groc_meta in db); an entry is
+only used while the database still has that version, so any insert or
+delete invalidates it. The cache is bounded in size, least
+recently used entries are evicted first. It is best effort: a locked or
+broken cache file only means a cache miss.
+
+Results are stored as JSON (column names and plain values), never as
+pickles: the file may be writable by others, loading it must not run
+code. Results of more than MAX_ROWS rows are not cached, so caching
+never loads a large result into memory.
+"""
+CACHE_NAME = 'cache.db'
+
+# Bytes of cached results kept before evicting.
+DEFAULT_MAX_SIZE = 8 * 1024 * 1024
+
+# Rows of a result cached at most.
+MAX_ROWS = 10000
+
+
+""" SQLite specific statements """
+sqlite_create_cache_table = """CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);"""
+
+sqlite_select_cached = """SELECT version, value FROM cache WHERE key = ?;"""
+
+sqlite_touch_cached = """UPDATE cache SET last_used = ? WHERE key = ?;"""
+
+sqlite_insert_cached = """INSERT OR REPLACE INTO cache
+    (key, version, value, size, last_used)
+VALUES (?, ?, ?, ?, ?);"""
+
+sqlite_evict_cached = """DELETE FROM cache WHERE key IN (
+    SELECT key FROM (
+        SELECT
+            key,
+            SUM(size) OVER (ORDER BY last_used DESC, key) AS kept
+        FROM cache
+    )
+    WHERE kept > ?
+);"""
+
+sqlite_cache_size = """SELECT
+    COUNT(*) AS entries,
+    COALESCE(SUM(size), 0) AS size
+FROM cache;"""
+
+
+def cache_path(db_path):
+    """ Path of the cache database of a database, see db.sidecar_path. """
+    return db.sidecar_path(db_path, CACHE_NAME)
+
+
+class CachedRow(tuple):
+    """ A result row indexable by position or column name. """
+
+    def __new__(cls, values, names):
+        row = super().__new__(cls, values)
+        row._names = names
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._names.index(key)
+        return super().__getitem__(key)
+
+    def keys(self):
+        return list(self._names)
+
+
+class CachedCursor:
+    """
+    A fetched query result, standing in for a sqlite3 cursor
+    (description, fetchone, fetchall, iteration). Rows not fetched yet
+    are read from rest, the cursor they came from, if given.
+    """
+
+    def __init__(self, description, rows, rest=None):
+        self.description = description
+        names = tuple(column[0] for column in description)
+        self._rows = [CachedRow(row, names) for row in rows]
+        self._position = 0
+        self._rest = rest
+
+    @classmethod
+    def from_cursor(cls, cursor, max_rows=None):
+        """
+        Fetch up to max_rows (MAX_ROWS by default) rows of a cursor.
+
+        Returns:
+            tuple: (complete, CachedCursor), complete is False if the
+                   cursor had more rows, which are left in it.
+        """
+        if max_rows is None:
+            max_rows = MAX_ROWS
+        rows = cursor.fetchmany(max_rows + 1)
+        if len(rows) > max_rows:
+            return False, cls(cursor.description, rows, rest=cursor)
+        return True, cls(cursor.description, rows)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        if len(rows) < size and self._rest is not None:
+            rows.extend(self._rest.fetchmany(size - len(rows)))
+        return rows
+
+    def fetchall(self):
+        rows = self.fetchmany(len(self._rows))
+        if self._rest is not None:
+            rows.extend(self._rest.fetchall())
+        return rows
+
+
+def dumps(value):
+    """
+    Encode a result as JSON.
+
+    Args:
+        value: a CachedCursor or a JSON serializable value.
+
+    Returns:
+        str: JSON document.
+
+    Raises:
+        TypeError, ValueError: if the value is not serializable.
+    """
+    if isinstance(value, CachedCursor):
+        return json.dumps({
+            'columns': [column[0] for column in value.description],
+            'rows': [list(row) for row in value._rows],
+        }, allow_nan=False)
+    return json.dumps({'value': value}, allow_nan=False)
+
+
+def loads(data):
+    """
+    Decode a result encoded by dumps.
+
+    Raises:
+        ValueError: if data is not a result.
+    """
+    document = json.loads(data)
+    if not isinstance(document, dict):
+        raise ValueError('Not a cached result.')
+    if 'columns' in document:
+        description = tuple((name, None, None, None, None, None, None)
+                            for name in document['columns'])
+        return CachedCursor(description, document['rows'])
+    return document['value']
+
+
+class ResultCache:
+    """ Size bounded LRU cache of results in a SQLite file. """
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE,
+                 busy_timeout=db.DEFAULT_BUSY_TIMEOUT):
+        """
+        Args:
+            path (str): path of the cache database, created if needed.
+            max_size (int): bytes of results kept.
+            busy_timeout (float): seconds to wait on a locked cache.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.busy_timeout = busy_timeout
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = db.create_connection(
+                self.path, self.busy_timeout, check_same_thread=False,
+                migrate=False)
+            with self._conn:
+                self._conn.execute(sqlite_create_cache_table)
+        return self._conn
+
+    def get(self, key, version):
+        """
+        Look up a result.
+
+        Args:
+            key (str): result key.
+            version (str): data version the result must be computed from.
+
+        Returns:
+            tuple: (True, result) on a hit, (False, None) on a miss.
+        """
+        with self._lock:
+            try:
+                conn = self._connection()
+                row = conn.execute(sqlite_select_cached, (key,)).fetchone()
+                if row is not None and row['version'] == version:
+                    value = loads(row['value'])
+                    with conn:
+                        conn.execute(sqlite_touch_cached, (time.time(), key))
+                    self.hits += 1
+                    if metrics.active is not None:
+                        metrics.active.count('cache_hits')
+                    return True, value
+            except (sqlite3.DatabaseError, exceptions.DatabaseError,
+                    ValueError, TypeError, KeyError):
+                pass
+            self.misses += 1
+            if metrics.active is not None:
+                metrics.active.count('cache_misses')
+            return False, None
+
+    def put(self, key, version, value):
+        """
+        Store a result, evicting least recently used ones if needed.
+
+        Args:
+            key (str): result key.
+            version (str): data version the result was computed from.
+            value: result, see dumps.
+        """
+        try:
+            data = dumps(value)
+        except (TypeError, ValueError):
+            return
+        size = len(data.encode('utf-8'))
+        if size > self.max_size:
+            return
+        with self._lock:
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.execute(sqlite_insert_cached,
+                                 (key, version, data, size, time.time()))
+                    conn.execute(sqlite_evict_cached, (self.max_size,))
+            except (sqlite3.DatabaseError, exceptions.DatabaseError):
+                pass
+
+    def stats(self):
+        """
+        Get cache statistics.
+
+        Returns:
+            dict: hits and misses of this instance, entries and size
+                  (bytes) of the cache.
+        """
+        with self._lock:
+            try:
+                row = self._connection().execute(sqlite_cache_size).fetchone()
+                entries, size = row['entries'], row['size']
+            except (sqlite3.DatabaseError, exceptions.DatabaseError):
+                entries, size = None, None
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': entries, 'size': size}
+
+    def close(self):
+        """ Close the cache database connection. """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
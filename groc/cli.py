@@ -1,13 +1,26 @@
-import copy
 import datetime
+import os
+import signal
+import sys
 
 import click
-from prettytable import from_db_cursor
 
-from .models import Groc
+from . import batch, exceptions
 from .version import VERSION
 
 
+# Every groc invocation imports this module, even for groc --version.
+# Database models (and their dependencies) and prettytable are imported
+# by the commands that use them, keeping startup fast for scripts that
+# call groc many times (see tests/test_startup.py).
+def __getattr__(name):
+    """ Import Groc and PartitionedGroc on first access. """
+    if name in ('Groc', 'PartitionedGroc'):
+        from . import models
+        return getattr(models, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 class MutuallyExclusiveOption(click.Option):
     def __init__(self, *args, **kwargs):
         self.mutually_exclusive = kwargs.pop('mutually_exclusive', [])
@@ -55,38 +68,225 @@ class MutuallyExclusiveOption(click.Option):
         return super().handle_parse_result(ctx, opts, args)
 
 
+class GrocGroup(click.Group):
+    """ Command group accepting --profile without a value. """
+    optional_values = {'--profile': ('cpu', ['cpu', 'mem'])}
+
+    def parse_args(self, ctx, args):
+        # click 7 options cannot have an optional value: a bare option,
+        # before the command name, gets its default value
+        args = [*args]
+        for i, arg in enumerate(args):
+            if arg in self.commands:
+                break
+            if arg in self.optional_values:
+                default, choices = self.optional_values[arg]
+                if i + 1 == len(args) or args[i + 1] not in choices:
+                    args[i] = f'{arg}={default}'
+        return super().parse_args(ctx, args)
+
+
+def get_groc(**kwargs):
+    """
+    Create a Groc instance configured by the global command line options,
+    a PartitionedGroc if the groc directory stores yearly partitions.
+    Its connections are closed when the command finishes.
+
+    Args:
+        kwargs: extra Groc arguments, overriding the global options.
+    """
+    from .models import Groc, PartitionedGroc
+
+    ctx = click.get_current_context()
+    options = dict(ctx.obj or {}, **kwargs)
+    g = Groc(**options)
+    if g.is_partitioned():
+        g = PartitionedGroc(**options)
+    ctx.call_on_close(g.close)
+    return g
+
+
 # Click CLI
-@click.group()
+@click.group(cls=GrocGroup)
 @click.version_option(version=VERSION, prog_name='groc')
+@click.option('--db', 'db_url',
+              type=click.Path(dir_okay=False),
+              envvar='GROC_DB',
+              help='Database file to use instead of ~/.groc/groc.db.')
+@click.option('--in-memory', is_flag=True,
+              envvar='GROC_IN_MEMORY',
+              help='Load the database into memory, writing changes back '
+                   'when the command finishes.')
+@click.option('--cache/--no-cache',
+              default=True,
+              envvar='GROC_CACHE',
+              help='Reuse report results until the database changes.')
+@click.option('--busy-timeout',
+              type=float,
+              envvar='GROC_BUSY_TIMEOUT',
+              help='Seconds to wait for a database locked by another process.')
+@click.option('--lock-timeout',
+              type=float,
+              envvar='GROC_LOCK_TIMEOUT',
+              help='Seconds a write waits for other groc writers to finish.')
+@click.option('--trace', is_flag=True,
+              envvar='GROC_TRACE',
+              help='Show the SQL statements run, with their timings.')
+@click.option('--slow-log',
+              type=click.Path(dir_okay=False),
+              envvar='GROC_SLOW_LOG',
+              help='Append statements slower than --slow-threshold '
+                   'to this file.')
+@click.option('--slow-threshold',
+              type=click.FloatRange(min=0),
+              default=100.0,
+              show_default=True,
+              envvar='GROC_SLOW_THRESHOLD',
+              help='Milliseconds a statement takes to be logged as slow.')
+@click.option('--profile',
+              type=click.Choice(['cpu', 'mem']),
+              envvar='GROC_PROFILE',
+              help='Profile the command with cProfile (cpu, the default '
+                   'without a value) or tracemalloc (mem).')
+@click.option('--profile-output',
+              type=click.Path(dir_okay=False),
+              help='File to write the profile to, by default '
+                   'groc-COMMAND-TIMESTAMP.prof (or .txt) here.')
+@click.option('--metrics-file',
+              type=click.Path(dir_okay=False),
+              envvar='GROC_METRICS_FILE',
+              help='Write the metrics of the command to this file.')
+@click.option('--metrics-format',
+              type=click.Choice(['json', 'prometheus']),
+              envvar='GROC_METRICS_FORMAT',
+              help='Append JSON lines (default) or update a Prometheus '
+                   'textfile (default for .prom files).')
 @click.pass_context
-def groc_entrypoint(ctx):
+def groc_entrypoint(ctx, db_url, in_memory, cache, busy_timeout,
+                    lock_timeout, trace, slow_log, slow_threshold, profile,
+                    profile_output, metrics_file, metrics_format):
     """
     A simple bill tracking tool to help you review and analyze purchases.
     """
-    ctx.obj = {}
+    ctx.obj = {
+        'db_url': db_url,
+        'in_memory': in_memory,
+        'cache': cache,
+        'busy_timeout': busy_timeout,
+        'lock_timeout': lock_timeout
+    }
+    if trace or slow_log:
+        start_trace(ctx, trace, slow_log, slow_threshold / 1000)
+    if metrics_file:
+        start_metrics(ctx, metrics_file, metrics_format)
+    if profile:
+        start_profile(ctx, profile, profile_output)
+
+
+def start_trace(ctx, show, slow_log, slow_threshold):
+    """
+    Trace SQL statements until the command finishes, then show
+    the statement summary on stderr if show is set.
+    """
+    from . import trace
+
+    tracer = trace.enable(trace.Tracer(slow_log, slow_threshold))
+
+    def finish():
+        trace.disable()
+        if show:
+            click.echo(format_trace_summary(tracer.summary()), err=True)
+    ctx.call_on_close(finish)
+
+
+def start_metrics(ctx, path, file_format):
+    """
+    Collect metrics until the command finishes, then write them to path
+    as JSON lines or Prometheus text (see metrics).
+    """
+    from . import metrics
+
+    if file_format is None:
+        file_format = 'prometheus' if path.endswith('.prom') else 'json'
+    collector = metrics.enable(metrics.Metrics(ctx.invoked_subcommand))
+
+    def finish():
+        metrics.disable()
+        snapshot = collector.snapshot(ctx.obj['db_url'])
+        try:
+            if file_format == 'prometheus':
+                metrics.write_prometheus(path, snapshot)
+            else:
+                metrics.write_json_lines(path, snapshot)
+        except OSError as e:
+            # Metrics must never make a command fail
+            click.echo(f'Could not write metrics to {path}: {e}', err=True)
+    ctx.call_on_close(finish)
+
+
+def start_profile(ctx, mode, path):
+    """
+    Profile until the command finishes, then write the profile to path
+    and show its summary on stderr.
+    """
+    from . import profiling
+
+    profiler = profiling.make_profiler(mode)
+    path = path or profiling.default_path(ctx.invoked_subcommand, profiler)
+
+    def finish():
+        profiler.stop()
+        profiler.write(path)
+        click.echo(profiler.summary(), err=True)
+        click.echo(f'Profile written to {path}', err=True)
+    # Close callbacks run in reverse order: the connections of the command
+    # are closed, and profiled, before this one runs
+    ctx.call_on_close(finish)
+    profiler.start()
+
+
+def format_trace_summary(summary):
+    """ Format the output of trace.Tracer.summary as a table. """
+    count = sum(stats['count'] for stats in summary)
+    total = sum(stats['total'] for stats in summary)
+    lines = [f'SQL trace: {count} statement(s), {len(summary)} distinct, '
+             f'{total * 1000:.1f} ms timed',
+             f"{'count':>7} {'total ms':>9} {'max ms':>8}  statement"]
+    for stats in summary:
+        statement = stats['statement']
+        if len(statement) > 100:
+            statement = statement[:97] + '...'
+        lines.append(f"{stats['count']:>7} {stats['total'] * 1000:>9.2f} "
+                     f"{stats['max'] * 1000:>8.2f}  {statement}")
+    return '\n'.join(lines)
 
 
 @groc_entrypoint.command('init', short_help='Create database in groc directory')
 @click.option('--verbose', is_flag=True)
-def init(verbose):
+@click.option('--partitioned', is_flag=True,
+              help='Store purchases in one database file per year.')
+def init(verbose, partitioned):
     """
     Set up Groc!
 
     Creates the groc directory in User directory and
     creates the groc database inside groc directory.
     Use the verbose flag to see extra output statements.
+    Use the partitioned flag to keep every year of purchases in its
+    own database file, so reports only read the years they need.
     \f
     Args:
         verbose (bool): Flag to output extra output statements.
+        partitioned (bool): Flag to store purchases in yearly partitions.
     """
-    g = Groc()
+    g = get_groc()
 
     if verbose:
         if g.groc_dir_exists():
             click.echo('Groc directory exists')
         else:
             click.echo('Attempting to create groc directory and db')
-    g.init_groc()
+    g.init_groc(partitioned=partitioned)
     click.secho('Welcome to groc! You\'re all set up!', fg='green')
 
 
@@ -102,7 +302,7 @@ def reset(dry_run):
     Args:
         dry_run (bool): flag to toggle real deletion of purchases.
     """
-    g = Groc()
+    g = get_groc()
     purchase_count = g.select_purchase_count()
 
     click.echo(f'Database reset will delete {purchase_count} purchase entries.')
@@ -112,6 +312,311 @@ def reset(dry_run):
         click.echo('Database reset successful.')
 
 
+@groc_entrypoint.command('migrate', short_help='Upgrade the database schema')
+@click.option('--status', is_flag=True,
+              help='Show pending migrations without applying them.')
+def migrate(status):
+    """
+    Apply pending database schema migrations.
+
+    Migrations are also applied automatically when groc connects,
+    use this command to run them ahead of time, e.g. on a large
+    database. Every migration runs in its own transaction.
+    \f
+    Args:
+        status (bool): Flag to only list pending migrations.
+    """
+    g = get_groc(auto_migrate=False)
+    current, latest = g.schema_version()
+    pending = g.pending_migrations()
+
+    click.echo(f'Schema version {current} (latest {latest}).')
+    if not pending:
+        click.echo('Database is up to date.')
+        return
+
+    if status:
+        for migration in pending:
+            click.echo(f'Pending: {migration.version} {migration.description}')
+        return
+
+    for migration in g.migrate():
+        click.echo(f'Applied: {migration.version} {migration.description}')
+
+
+def format_size(size):
+    """ Format a byte count for humans. """
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            break
+        size /= 1024
+    return f'{size:,.1f} {unit}' if unit != 'B' else f'{size} B'
+
+
+def format_db_stats(stats, title):
+    """ Format the output of Groc.db_stats as a table string. """
+    fragmentation = stats['fragmentation']
+    lines = [
+        title,
+        f"Database size: {format_size(stats['size'])} "
+        f"({stats['page_count']} pages of {stats['page_size']} B)",
+        f"Free pages: {stats['freelist_count']} "
+        f"({format_size(stats['free_size'])})",
+        'Fragmentation: {}'.format(
+            '--' if fragmentation is None else f'{fragmentation:.1%}'),
+        f"Auto vacuum: {stats['auto_vacuum']}",
+    ]
+
+    if stats['objects']:
+        from prettytable import PrettyTable
+        table = PrettyTable(['name', 'pages', 'size', 'fragmentation'])
+        table.align['name'] = 'l'
+        table.align['size'] = 'r'
+        for obj in stats['objects']:
+            table.add_row([
+                obj['name'],
+                obj['pages'],
+                format_size(obj['size']),
+                f"{obj['out_of_order'] / obj['pages']:.1%}"
+            ])
+        lines.append(table.get_string())
+
+    return '\n'.join(lines)
+
+
+@groc_entrypoint.command('maintenance',
+                         short_help='Optimize and check the database')
+@click.option('--analyze/--no-analyze', default=True, show_default=True,
+              help='Gather query planner statistics.')
+@click.option('--vacuum/--no-vacuum', default=True, show_default=True,
+              help='Reclaim free pages incrementally.')
+@click.option('--full-vacuum', is_flag=True,
+              help='Rebuild the database file and enable incremental '
+                   'vacuum. Blocks other groc commands while running.')
+@click.option('--integrity', type=click.Choice(['quick', 'full', 'none']),
+              default='quick', show_default=True,
+              help='Integrity check to run.')
+@click.option('--time-budget', type=float, default=10.0, show_default=True,
+              help='Seconds each of analyze and vacuum may run.')
+def maintenance(analyze, vacuum, full_vacuum, integrity, time_budget):
+    """
+    Keep the database fast and healthy.
+
+    Gathers planner statistics (ANALYZE, PRAGMA optimize), reclaims free
+    pages in small steps and checks the database for corruption.
+    Database size, free pages, fragmentation and table/index sizes are
+    shown before and after.
+
+    Incremental vacuum needs a database created with (or rebuilt to)
+    auto_vacuum=INCREMENTAL; run once with --full-vacuum to switch.
+    \f
+    Args:
+        analyze (bool): Run ANALYZE and PRAGMA optimize.
+        vacuum (bool): Run incremental vacuum steps.
+        full_vacuum (bool): Rebuild the whole database file.
+        integrity (str): quick, full or no integrity check.
+        time_budget (float): Seconds per budgeted step.
+    """
+    g = get_groc()
+    click.echo(format_db_stats(g.db_stats(), 'Before maintenance'))
+
+    if analyze:
+        tables = g.analyze(time_budget)
+        click.echo(f'Analyzed {len(tables)} table(s).')
+
+    if full_vacuum:
+        g.vacuum(full=True)
+        click.echo('Database rebuilt, incremental vacuum enabled.')
+    elif vacuum:
+        pages = g.vacuum(time_budget)
+        click.echo(f'Reclaimed {pages} free page(s).')
+
+    if integrity != 'none':
+        problems = g.integrity_check(full=integrity == 'full')
+        if problems:
+            click.secho('Integrity check found problems:', fg='red')
+            for problem in problems:
+                click.echo(problem)
+        else:
+            click.echo('Integrity check ok.')
+
+    click.echo(format_db_stats(g.db_stats(), 'After maintenance'))
+
+
+@groc_entrypoint.command('archive',
+                         short_help='Move old purchases to the archive')
+@click.option('--before',
+              type=click.DateTime(formats=['%Y-%m-%d']),
+              required=True,
+              help='Archive purchases made before this date')
+@click.option('--chunk-size',
+              type=click.IntRange(min=1),
+              default=5000,
+              show_default=True,
+              help='Purchases moved per transaction.')
+@click.option('--dry-run', is_flag=True)
+def archive(before, chunk_size, dry_run):
+    """
+    Move purchases made before a date to the archive database.
+
+    The archive (archive.db in the groc directory) keeps old purchases
+    out of the way, so list and breakdown stay fast. Pass the
+    include-archive flag to those commands to see archived purchases.
+    Archived purchases are still detected as duplicates when adding.
+
+    Purchases are moved in chunks of short transactions, an interrupted
+    archive can simply be run again.
+    Use the dry-run flag to see how many purchases would be moved.
+    \f
+    Args:
+        before (datetime.datetime): Cutoff date.
+        chunk_size (int): Purchases per transaction.
+        dry_run (bool): Only count the purchases to archive.
+    """
+    g = get_groc()
+    before = before.date()
+    purchase_count = g.count_archivable(before)
+
+    click.echo(f'Archiving will move {purchase_count} purchase(s) '
+               f'made before {before.isoformat()}.')
+
+    if not dry_run and purchase_count:
+        moved = g.archive(before, chunk_size)
+        click.echo(f'Archived {moved} purchase(s).')
+
+
+def backup_progress():
+    """ Progress callback showing copied pages on one updating line. """
+    def progress(copied, total):
+        click.echo(f'\rCopied {copied}/{total} pages', nl=False, err=True)
+        if copied == total:
+            click.echo(err=True)
+    return progress
+
+
+def import_progress(interval=0.25):
+    """
+    Progress callback of csv imports (see db.insert_from_csv_dict)
+    showing throughput and ETA on one line, redrawn at most every
+    interval seconds, and a last time when the import finished. None
+    when stderr is not a terminal.
+    """
+    import time
+
+    if not sys.stderr.isatty():
+        return None
+    start = time.monotonic()
+    # Time, rows and bytes of the last line drawn
+    drawn = [start - interval, None, None]
+
+    def progress(rows, bytes_read, total_bytes, finished):
+        now = time.monotonic()
+        if now - drawn[0] < interval and not finished:
+            return
+        if finished and drawn[1:] == [rows, bytes_read]:
+            # Already drawn after the last file
+            click.echo(err=True)
+            return
+        drawn[:] = [now, rows, bytes_read]
+        line = format_import_progress(rows, bytes_read, total_bytes,
+                                      now - start)
+        click.echo(f'\r{line}\x1b[K', nl=finished, err=True)
+    return progress
+
+
+def format_import_progress(rows, bytes_read, total_bytes, seconds):
+    """ Format the progress of a csv import, see import_progress. """
+    percent = 100 * bytes_read / total_bytes if total_bytes else 100
+    line = (f'Importing {percent:5.1f}% ({format_size(bytes_read)} of '
+            f'{format_size(total_bytes)}), {rows:,} rows')
+    if seconds <= 0:
+        return line
+    bytes_per_second = bytes_read / seconds
+    line += (f', {rows / seconds:,.0f} rows/s, '
+             f'{bytes_per_second / 1024 ** 2:.1f} MB/s')
+    if bytes_per_second and bytes_read < total_bytes:
+        eta = datetime.timedelta(
+            seconds=round((total_bytes - bytes_read) / bytes_per_second))
+        line += f', ETA {eta}'
+    return line
+
+
+def format_backup_stats(stats):
+    """ Format the output of Groc.backup_db/restore_db. """
+    speed = stats['pages_per_second']
+    return (f"{stats['pages']} pages ({format_size(stats['size'])}) "
+            f"in {stats['seconds']:.2f}s"
+            + (f' ({speed:,.0f} pages/s)' if speed else ''))
+
+
+@groc_entrypoint.command('backup', short_help='Back up the database')
+@click.argument('dest', type=click.Path(dir_okay=False))
+@click.option('--gzip', 'compress', is_flag=True,
+              help='Compress the backup (default for .gz destinations).')
+@click.option('--pages',
+              type=click.IntRange(min=1),
+              default=256,
+              show_default=True,
+              help='Pages copied per step.')
+@click.option('--sleep',
+              type=click.FloatRange(min=0),
+              default=0.01,
+              show_default=True,
+              help='Seconds to pause between steps.')
+@click.option('--force', is_flag=True, help='Overwrite an existing file.')
+def backup(dest, compress, pages, sleep, force):
+    """
+    Back up the database to DEST while groc stays in use.
+
+    The backup is a consistent snapshot of the database when the command
+    started, even if purchases are added while it runs. Pages are copied
+    in small steps with a pause in between, so other groc commands are
+    not held up.
+    \f
+    Args:
+        dest (str): Path of the backup file.
+        compress (bool): Flag to gzip the backup.
+        pages (int): Pages per step.
+        sleep (float): Seconds between steps.
+        force (bool): Flag to overwrite dest.
+    """
+    g = get_groc()
+    stats = g.backup_db(dest, pages, sleep, compress or None, force,
+                        backup_progress())
+    click.echo(f'Backed up {format_backup_stats(stats)} to {dest}.')
+
+
+@groc_entrypoint.command('restore', short_help='Restore the database')
+@click.argument('src', type=click.Path(exists=True, dir_okay=False))
+@click.option('--pages',
+              type=click.IntRange(min=1),
+              default=256,
+              show_default=True,
+              help='Pages copied per step.')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def restore(src, pages, yes):
+    """
+    Replace the database with the backup SRC.
+
+    Backups created by groc backup, gzip compressed or not, can be
+    restored. All current purchases are replaced.
+    \f
+    Args:
+        src (str): Path of the backup file.
+        pages (int): Pages per step.
+        yes (bool): Flag to skip the confirmation.
+    """
+    g = get_groc()
+    purchase_count = g.select_purchase_count()
+
+    click.echo(f'Restore will replace {purchase_count} purchase entries.')
+    if not yes:
+        click.confirm('Continue?', abort=True)
+
+    stats = g.restore_db(src, pages, progress=backup_progress())
+    click.echo(f'Restored {format_backup_stats(stats)} from {src}.')
+
+
 def check_limit(ctx, param, value):
     return 100 if value > 100 else value
 
@@ -140,8 +645,10 @@ def check_limit(ctx, param, value):
               mutually_exclusive=['limit'],
               required_with=['month'],
               help='list all entries')
+@click.option('--include-archive', is_flag=True,
+              help='Include archived purchases.')
 @click.option('--verbose', is_flag=True)
-def list(limit, month, year, all, verbose):
+def list(limit, month, year, all, include_archive, verbose):
     """
     View a list of purchases. You have three options to do so:
 
@@ -153,60 +660,77 @@ def list(limit, month, year, all, verbose):
     If a month is passed, the year is default to current year.
     A year cannot be passed without a month.
     Pass the all flag to get all purchases for that month/year.
+    Pass the include-archive flag to also list archived purchases.
     \f
     Args:
         limit (int): Limit number for purchases.
         month (str): Two digit month.
         year (str): Four digit year.
         all (bool): Flag to show all purchases for a month/year.
-        verbose (bool): Flag to show purchase ids too.
+        include_archive (bool): Flag to include archived purchases.
+        verbose (bool): Flag to show purchase ids and cache stats too.
     """
-    g = Groc()
-
-    num_purchases = g.select_purchase_count()
-    output_msg = None
+    g = get_groc(include_archive=include_archive)
+
+    # Run all queries against one consistent snapshot
+    with g.read_snapshot():
+        num_purchases = g.select_purchase_count()
+        output_msg = None
+
+        # If there are purchases in db
+        if num_purchases:
+            purchases = None  # to hold cursor object
+            table_title = None  # to hold table title depending on query
+
+            # If month passed, get either all purchases for month/year
+            # or limited purchases for month/year depending on if 'all' flag
+            if month:
+                month = datetime.datetime.strftime(month, '%m')
+                year = datetime.datetime.strftime(year, '%Y')
+                if all:
+                    table_title = f'All purchases from {month}/{year}'
+                    purchases = g.list_purchases_date(month, year)
+                else:
+                    table_title = f'Last {limit} purchase(s) from {month}/{year}'
+                    purchases = g.list_purchases_date_limit(month, year, limit)
+            # Get latest purchases by limit amount
+            else:
+                table_title = f'Last {limit} purchase(s)'
+                purchases = g.list_purchases_limit(limit)
 
-    # If there are purchases in db
-    if num_purchases:
-        purchases = None  # to hold cursor object
-        table_title = None  # to hold table title depending on query
+            # Format output table
+            from prettytable import from_db_cursor
+            table = from_db_cursor(purchases)
+            table.title = table_title
+            table.align['store'] = 'r'
+            table.align['total'] = 'r'
+            table.align['description'] = 'l'
 
-        # If month passed, get either all purchases for month/year
-        # or limited purchases for month/year depending on if 'all' flag
-        if month:
-            month = datetime.datetime.strftime(month, '%m')
-            year = datetime.datetime.strftime(year, '%Y')
-            if all:
-                table_title = f'All purchases from {month}/{year}'
-                purchases = g.list_purchases_date(month, year)
+            # If verbose flag, show all table fields, else remove id field
+            if verbose:
+                output_msg = table.get_string()
             else:
-                table_title = f'Last {limit} purchase(s) from {month}/{year}'
-                purchases = g.list_purchases_date_limit(month, year, limit)
-        # Get latest purchases by limit amount
-        else:
-            table_title = f'Last {limit} purchase(s)'
-            purchases = g.list_purchases_limit(limit)
-
-        # Format output table
-        table = from_db_cursor(purchases)
-        table.title = table_title
-        table.align['store'] = 'r'
-        table.align['total'] = 'r'
-        table.align['description'] = 'l'
+                field_names = [name for name in table.field_names]
+                field_names.remove('id')
+                output_msg = table.get_string(fields=field_names)
 
-        # If verbose flag, show all table fields, else remove id field
-        if verbose:
-            output_msg = table.get_string()
+        # If no purchases in db
         else:
-            field_names = [name for name in table.field_names]
-            field_names.remove('id')
-            output_msg = table.get_string(fields=field_names)
-
-    # If no purchases in db
-    else:
-        output_msg = 'No purchase entries available. You should add some!\nSee groc add --help to add purchases.'
+            output_msg = 'No purchase entries available. You should add some!\nSee groc add --help to add purchases.'
 
     click.echo(output_msg)
+    stats = g.cache_stats() if verbose else None
+    if stats:
+        click.echo(format_cache_stats(stats))
+
+
+def format_cache_stats(stats):
+    """ Format result cache statistics (see Groc.cache_stats). """
+    message = f"Cache: {stats['hits']} hit(s), {stats['misses']} miss(es)"
+    if stats['entries'] is not None:
+        message += (f", {stats['entries']} entries "
+                    f"({stats['size'] / 1024:.1f} KiB)")
+    return message + '.'
 
 
 def format_month_year(ctx, param, value):
@@ -235,8 +759,10 @@ def format_month_year(ctx, param, value):
               multiple=True,
               help='year as a four digit number',
               callback=format_month_year)
+@click.option('--include-archive', is_flag=True,
+              help='Include archived purchases.')
 @click.option('--verbose', is_flag=True)
-def breakdown(month, year, verbose):
+def breakdown(month, year, include_archive, verbose):
     """
     View helpful stats for purchases grouped by month.
 
@@ -252,53 +778,58 @@ def breakdown(month, year, verbose):
     month and year pairs.
 
     Use the verbose flag to see extended stats.
+    Pass the include-archive flag to also count archived purchases.
     \f
     Args:
         month (str): Two digit month.
         year (str): Four digit year.
-        verbose (bool): Flag to show extended stats.
-    """
-    g = Groc()
-
-    num_purchases = g.select_purchase_count()
-    output_msg = None
-
-    # Format month and year params
-    if year and not month:
-        month = ['0'+str(x) if len(str(x)) == 1 else str(x)
-                 for x in range(1, 13)]
-    if not year:
-        year = [datetime.date.today().strftime('%Y')]
-    if not month:
-        month = [datetime.date.today().strftime('%m')]
-
-    # If there are purchases in db
-    if num_purchases:
-        data = g.breakdown(month, year)
-        table = from_db_cursor(data)
-        field_names = [name for name in table.field_names]
-
-        # Add a row with dashes if table empty
-        temp_str = table.get_string()
-        temp_table = copy.deepcopy(table)
-        temp_table.clear_rows()
-        if temp_str == temp_table.get_string():
-            table.add_row(['--' for x in field_names])
-
-        # Rmove columns used for db ordering
-        field_names.remove('num_month')
-        if not verbose:
-            field_names.remove('min purchase')
-            field_names.remove('max purchase')
-            field_names.remove('avg purchase')
-            field_names.remove('store count')
-        output_msg = table.get_string(fields=field_names)
-
-    # If no purchases in db
-    else:
-        output_msg = 'No purchase entries available. You should add some!\nSee groc add --help to add purchases.'
+        include_archive (bool): Flag to include archived purchases.
+        verbose (bool): Flag to show extended stats and cache stats.
+    """
+    g = get_groc(include_archive=include_archive)
+
+    # Run all queries against one consistent snapshot
+    with g.read_snapshot():
+        num_purchases = g.select_purchase_count()
+        output_msg = None
+
+        # Format month and year params
+        month, year = batch.default_month_year(month, year)
+
+        # If there are purchases in db
+        if num_purchases:
+            import copy
+
+            from prettytable import from_db_cursor
+
+            data = g.breakdown(month, year)
+            table = from_db_cursor(data)
+            field_names = [name for name in table.field_names]
+
+            # Add a row with dashes if table empty
+            temp_str = table.get_string()
+            temp_table = copy.deepcopy(table)
+            temp_table.clear_rows()
+            if temp_str == temp_table.get_string():
+                table.add_row(['--' for x in field_names])
+
+            # Rmove columns used for db ordering
+            field_names.remove('num_month')
+            if not verbose:
+                field_names.remove('min purchase')
+                field_names.remove('max purchase')
+                field_names.remove('avg purchase')
+                field_names.remove('store count')
+            output_msg = table.get_string(fields=field_names)
+
+        # If no purchases in db
+        else:
+            output_msg = 'No purchase entries available. You should add some!\nSee groc add --help to add purchases.'
 
     click.echo(output_msg)
+    stats = g.cache_stats() if verbose else None
+    if stats:
+        click.echo(format_cache_stats(stats))
 
 
 @groc_entrypoint.command('delete', short_help='Delete purchases')
@@ -321,7 +852,7 @@ def delete(dry_run, id, verbose):
         dry_run (bool): See purchases that would be deleted.
         verbose (bool): See purchase details.
     """
-    g = Groc()
+    g = get_groc()
     purchase_ids = g.select_purchase_ids(id).fetchall()
 
     # If any of the purchases exist
@@ -329,6 +860,7 @@ def delete(dry_run, id, verbose):
 
         # Format an output table with purchase details
         if verbose:
+            from prettytable import from_db_cursor
             purchases = g.select_by_id(id)
             table = from_db_cursor(purchases)
             table.align['store'] = 'r'
@@ -403,10 +935,18 @@ def add(date, total, store, description, source, ignore_duplicate):
         total (float): Purchase total.
         store (str): Purchase store.
     """
-    g = Groc()
+    g = get_groc()
 
     if source:
-        count = g.add_purchase_path(source, ignore_duplicate)
+        progress = import_progress()
+        try:
+            count = g.add_purchase_path(source, ignore_duplicate,
+                                        progress=progress)
+        except BaseException:
+            if progress is not None:
+                # Clear the progress line, the error is shown next
+                click.echo('\r\x1b[K', nl=False, err=True)
+            raise
         click.echo(f'Added {count} purchase(s) successfully.')
 
     # if one of required fields from (store, total, description, date)
@@ -427,9 +967,435 @@ def add(date, total, store, description, source, ignore_duplicate):
         ''')
 
 
+@groc_entrypoint.command('export', short_help='Export purchases as CSV')
+@click.option('--month', '-m',
+              type=click.DateTime(formats=['%m']),
+              help='month as a two digit number')
+@click.option('--year', '-y',
+              type=click.DateTime(formats=['%Y']),
+              default=(datetime.date.today().strftime('%Y')),
+              show_default=True,
+              help='year as a four digit number',
+              cls=MutuallyExclusiveOption,
+              required_with=['month'])
+@click.option('--include-archive', is_flag=True,
+              help='Include archived purchases.')
+def export(month, year, include_archive):
+    """
+    Export purchases as CSV, in the format groc add --source reads.
+
+    All purchases are exported, or those of a month and year pair if
+    a month is passed (the year defaults to the current year).
+    \f
+    Args:
+        month (str): Two digit month.
+        year (str): Four digit year.
+        include_archive (bool): Flag to include archived purchases.
+    """
+    import csv
+
+    g = get_groc(include_archive=include_archive)
+    month = month and datetime.datetime.strftime(month, '%m')
+    year = year and datetime.datetime.strftime(year, '%Y')
+
+    writer = csv.DictWriter(
+        sys.stdout,
+        [field.capitalize() for field in batch.EXPORT_FIELDS],
+        lineterminator='\n')
+    writer.writeheader()
+    with g.read_snapshot():
+        for record in batch.export_purchases(g, month, year):
+            writer.writerow({key.capitalize(): value
+                             for key, value in record.items()})
+
+
+@groc_entrypoint.command('search', short_help='Search purchases by text')
+@click.argument('query', required=False)
+@click.option('--since',
+              type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Only purchases made on or after this date.')
+@click.option('--until',
+              type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Only purchases made on or before this date.')
+@click.option('--limit', '-l',
+              type=click.IntRange(min=1),
+              default=50,
+              show_default=True,
+              help='Number of purchases shown.',
+              cls=MutuallyExclusiveOption,
+              mutually_exclusive=['all'])
+@click.option('--all', '-a', is_flag=True,
+              cls=MutuallyExclusiveOption,
+              mutually_exclusive=['limit'],
+              help='Show all matching purchases.')
+@click.option('--newest', is_flag=True,
+              help='Newest purchases first instead of best matches.')
+@click.option('--raw', is_flag=True,
+              help='QUERY is an SQLite FTS5 query (OR, NOT, NEAR, '
+                   'store:..., "phrases").')
+@click.option('--csv', 'as_csv', is_flag=True,
+              help='Stream the purchases as CSV instead of a table.')
+@click.option('--build', is_flag=True,
+              help='Create the search index, or finish building it.')
+@click.option('--drop', is_flag=True,
+              help='Remove the search index.')
+@click.option('--verbose', is_flag=True)
+def search(query, since, until, limit, all, newest, raw, as_csv, build,
+           drop, verbose):
+    """
+    Search purchases by store name and description.
+
+    Purchases matching all words of the query are shown, best
+    matches first; end a word with * to match words starting with it.
+    Searching needs a search index, create it once with the build
+    flag. It is then kept up to date as purchases are added and
+    deleted. Building indexes existing purchases in chunks of short
+    transactions, an interrupted build resumes where it stopped.
+    \f
+    Args:
+        query (str): Words to search for.
+        since (datetime.datetime): First purchase date.
+        until (datetime.datetime): Last purchase date.
+        limit (int): Number of purchases shown.
+        all (bool): Flag to show all matching purchases.
+        newest (bool): Flag to order by date instead of rank.
+        raw (bool): Flag to pass the query to FTS5 as is.
+        as_csv (bool): Flag to stream CSV rows.
+        build (bool): Flag to build the search index first.
+        drop (bool): Flag to remove the search index.
+        verbose (bool): Flag to show purchase ids too.
+    """
+    g = get_groc()
+
+    if drop:
+        g.drop_search_index()
+        click.echo('Search index removed.')
+        return
+
+    if build:
+        def progress(indexed):
+            progress.total += indexed
+            click.echo(f'\rIndexed {progress.total} purchase(s)', nl=False,
+                       err=True)
+        progress.total = 0
+        indexed = g.build_search_index(progress=progress)
+        if indexed:
+            click.echo(err=True)
+        click.echo(f'Search index ready, {indexed} purchase(s) indexed.')
+
+    if query is None:
+        if build:
+            return
+        raise click.UsageError('Missing argument "QUERY".')
+
+    status = g.search_index_status()
+    if status and status['pending']:
+        click.secho(f"Search index incomplete, {status['pending']} "
+                    f"purchase(s) not indexed yet. Run groc search --build.",
+                    fg='yellow', err=True)
+
+    purchases = g.search(query,
+                         since and since.strftime('%Y-%m-%d'),
+                         until and until.strftime('%Y-%m-%d'),
+                         -1 if all else limit,
+                         'newest' if newest else 'rank',
+                         raw)
+    columns = [column[0] for column in purchases.description]
+    if not verbose:
+        columns.remove('id')
+
+    if as_csv:
+        import csv
+        from . import db
+
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerow(columns)
+        for row in db.iter_rows(purchases):
+            writer.writerow([row[column] for column in columns])
+        return
+
+    from prettytable import PrettyTable
+
+    table = PrettyTable(columns)
+    for row in purchases:
+        table.add_row([row[column] for column in columns])
+    if not table.rowcount:
+        click.echo(f'No purchases found for {query!r}.')
+        return
+    table.title = f'{table.rowcount} purchase(s) matching {query!r}'
+    table.align['store'] = 'r'
+    table.align['total'] = 'r'
+    table.align['description'] = 'l'
+    click.echo(table.get_string())
+
+
+@groc_entrypoint.command('gen', short_help='Generate purchases for load testing')
+@click.option('--rows', '-n',
+              type=click.IntRange(min=0),
+              default=10000,
+              show_default=True,
+              help='Number of purchases.')
+@click.option('--seed', type=int, default=0, show_default=True,
+              help='Seed, the same seed generates the same purchases.')
+@click.option('--start',
+              type=click.DateTime(formats=['%Y-%m-%d']),
+              default='2015-01-01',
+              show_default=True,
+              help='First purchase date.')
+@click.option('--end',
+              type=click.DateTime(formats=['%Y-%m-%d']),
+              default='2019-12-31',
+              show_default=True,
+              help='Last purchase date.')
+@click.option('--stores',
+              type=click.IntRange(min=1),
+              default=200,
+              show_default=True,
+              help='Number of distinct stores.')
+@click.option('--duplicates',
+              type=click.FloatRange(0, 1),
+              default=0.0,
+              show_default=True,
+              help='Share of purchases repeating an earlier purchase.')
+@click.option('--null-descriptions',
+              type=click.FloatRange(0, 1),
+              default=0.3,
+              show_default=True,
+              help='Share of purchases without a description.')
+@click.option('--unicode',
+              type=click.FloatRange(0, 1),
+              default=0.1,
+              show_default=True,
+              help='Share of store names and descriptions with non-ascii '
+                   'characters.')
+@click.option('--output', '-o',
+              type=click.Path(dir_okay=False, allow_dash=True),
+              default='-',
+              show_default=True,
+              help='CSV file to write.')
+@click.option('--insert', is_flag=True,
+              help='Add the purchases to the database instead of writing '
+                   'CSV, skipping duplicates.')
+def gen(rows, seed, start, end, stores, duplicates, null_descriptions,
+        unicode, output, insert):
+    """
+    Generate realistic purchases for load testing, as CSV in the format
+    groc add --source reads, or added straight to the database.
+
+    Purchases are written as they are generated, so any number of rows
+    can be generated in constant memory.
+    \f
+    Args:
+        rows (int): Number of purchases.
+        seed (int): Random seed.
+        start (datetime.datetime): First purchase date.
+        end (datetime.datetime): Last purchase date.
+        stores (int): Number of stores.
+        duplicates (float): Share of duplicate purchases.
+        null_descriptions (float): Share of purchases without description.
+        unicode (float): Share of non-ascii names and descriptions.
+        output (str): CSV file, - for stdout.
+        insert (bool): Flag to add the purchases to the database.
+    """
+    from . import generate
+
+    try:
+        generator = generate.PurchaseGenerator(
+            seed, start.date(), end.date(), stores, duplicates,
+            null_descriptions, unicode)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="'--end'")
+
+    if insert:
+        g = get_groc()
+        added = 0
+        for chunk in generator.purchases(rows):
+            if g.is_partitioned():
+                added += g.add_purchases(chunk, True)
+            else:
+                # One transaction per chunk instead of per purchase
+                with g.transaction():
+                    added += g.add_purchases(chunk, True)
+        click.echo(f'{added} purchase(s) added')
+    elif output == '-':
+        generator.write_csv(sys.stdout, rows)
+    else:
+        with open(output, 'w', newline='', encoding='utf-8') as file:
+            count = generator.write_csv(file, rows)
+        click.echo(f'{count} purchase(s) written to {output}')
+
+
+@groc_entrypoint.command('batch',
+                         short_help='Run many commands in one process')
+@click.argument('file', type=click.File('r'))
+@click.option('--transaction', is_flag=True,
+              help='Run all commands in a single transaction, '
+                   'rolled back entirely on the first error.')
+@click.option('--stop-on-error', is_flag=True,
+              help='Stop at the first command that fails.')
+@click.pass_context
+def run_batch(ctx, file, transaction, stop_on_error):
+    """
+    Run add, delete, list, breakdown and export commands read from
+    FILE (- for stdin), one per line, in a single process and on a
+    single database connection.
+
+    A line is a command with its usual options, e.g.
+    add --store "Store Foo" --total 20.00, or a JSON object like
+    {"command": "delete", "id": [3, 4]}.
+
+    Prints one JSON object per command: its line number, command,
+    ok, and the result or error. With the transaction flag, the batch
+    stops at the first error and a last line tells whether the
+    transaction was committed or rolled back.
+    Exits with status 1 if any command failed.
+    \f
+    Args:
+        file (file): Batch file.
+        transaction (bool): Flag to run all commands in one transaction.
+        stop_on_error (bool): Flag to stop at the first failed command.
+    """
+    g = get_groc()
+    stop_on_error = stop_on_error or transaction
+
+    def run_lines():
+        """ Run the lines of the file, returning False on a failure. """
+        ok = True
+        for number, line in enumerate(file, 1):
+            name = None
+            try:
+                parsed = batch.parse_line(line)
+                if parsed is None:
+                    continue
+                name, args = parsed
+                params = batch.parse_params(groc_entrypoint, name, args, ctx)
+                result = batch.run(g, name, params)
+            except (click.ClickException, exceptions.GrocException) as e:
+                ok = False
+                message = (e.format_message()
+                           if isinstance(e, click.ClickException) else str(e))
+                click.echo(batch.result_line(number, name, error=message))
+                if stop_on_error:
+                    break
+            else:
+                click.echo(batch.result_line(number, name, result))
+        return ok
+
+    if transaction:
+        with g.transaction():
+            ok = run_lines()
+            if not ok:
+                raise exceptions.RollbackTransaction()
+        click.echo(batch.transaction_line(ok))
+    else:
+        ok = run_lines()
+
+    if not ok:
+        ctx.exit(1)
+
+
+@groc_entrypoint.command('explain',
+                         short_help='Show the query plans of a command',
+                         context_settings={'ignore_unknown_options': True})
+@click.argument('command')
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+@click.pass_context
+def explain(ctx, command, args):
+    """
+    Run COMMAND (add, delete, list, breakdown or export) with its ARGS
+    and show the query plan of every SQL statement it issued.
+    Steps reading the whole purchase table are marked.
+
+    The command runs in a transaction that is rolled back, so add and
+    delete do not change the database.
+
+        groc explain breakdown -m 01 -y 2019
+    \f
+    Args:
+        command (str): Command to explain.
+        args (tuple): Arguments of the command.
+    """
+    from . import explain as query_plans
+
+    g = get_groc(cache=False)
+    try:
+        plans = query_plans.explain_command(g, groc_entrypoint, command,
+                                            [*args])
+    except exceptions.BatchError as e:
+        raise click.BadParameter(str(e), param_hint="'COMMAND'")
+
+    for number, (sql, plan) in enumerate(plans, 1):
+        click.echo(f'{number}. {sql}')
+        click.echo(query_plans.format_plan(plan, sql))
+        click.echo()
+
+
+@groc_entrypoint.command('serve', short_help='Serve groc over a local socket')
+@click.option('--socket', 'socket_path',
+              type=click.Path(dir_okay=False),
+              help='Unix socket to listen on, groc.sock next to the '
+                   'database by default.')
+@click.option('--port', type=int,
+              help='Listen on a localhost TCP port instead of a socket.')
+@click.option('--host', default='127.0.0.1', show_default=True,
+              help='Address to listen on with --port.')
+@click.option('--include-archive', is_flag=True,
+              help='Include archived purchases in reports.')
+@click.option('--verbose', is_flag=True, help='Log requests.')
+def serve(socket_path, port, host, include_archive, verbose):
+    """
+    Serve add, bulk_add, delete, list, breakdown and export as JSON
+    requests over a Unix socket (or localhost HTTP with --port), keeping
+    the database connections open between requests.
+
+    POST /<command> with the command options as a JSON object, e.g.
+    POST /list {"limit": 10}. See groc.client for a Python client.
+    Concurrent writes are committed together in one transaction.
+    \f
+    Args:
+        socket_path (str): Unix socket path.
+        port (int): TCP port.
+        host (str): TCP address.
+        include_archive (bool): Flag to include archived purchases.
+        verbose (bool): Flag to log requests.
+    """
+    from . import db, server
+
+    g = get_groc(include_archive=include_archive, read_only_reports=True)
+    if port is None and socket_path is None:
+        socket_path = db.sidecar_path(g.disk_url, 'sock', server.SOCKET_NAME)
+
+    service = server.GrocService(g, groc_entrypoint)
+    try:
+        httpd = server.make_server(service, socket_path, host, port, verbose)
+    except BaseException:
+        service.close()
+        raise
+    if port is None:
+        address = socket_path
+    else:
+        address = f'http://{host}:{httpd.server_address[1]}'
+    click.echo(f'Serving groc on {address}, press Ctrl+C to stop.')
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
+
+
 def safe_entry_point():
     try:
         groc_entrypoint()
+    except exceptions.DatabaseLockedError as e:
+        # Lock contention is temporary, let scripts tell it apart and retry
+        click.secho(str(e), fg='yellow', err=True)
+        sys.exit(75)  # EX_TEMPFAIL
     except Exception as e:
         # Echo the exception message
         click.secho(str(e), fg='red')
@@ -0,0 +1,130 @@
+import http.client
+import json
+import os
+import socket
+
+from . import exceptions
+
+
+""" Client of groc serve
+
+    client = GrocClient('~/.groc/groc.sock')
+    client.add(store='Store Foo', total=20, date='2019-01-01')
+    client.breakdown(month=['01'], year=['2019'])
+
+Options are passed like the command line options (dry_run=True for
+--dry-run, lists for repeated options). A client keeps one connection
+open, so it should not be shared by threads; create one per thread.
+"""
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """ HTTP connection over a Unix domain socket. """
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class GrocClient:
+    """ Calls a groc server over a Unix socket or localhost HTTP. """
+
+    def __init__(self, socket_path=None, host='127.0.0.1', port=None,
+                 timeout=60):
+        """
+        Args:
+            socket_path (str): Unix socket of the server, unless port is given.
+            host (str): address of the server with port.
+            port (int): TCP port of the server.
+            timeout (float): seconds to wait for a response.
+        """
+        if port is not None:
+            self._conn = http.client.HTTPConnection(host, port,
+                                                    timeout=timeout)
+        else:
+            self._conn = UnixHTTPConnection(
+                os.path.expanduser(socket_path), timeout=timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def _request(self, method, path, body=None):
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        headers = {'Content-Type': 'application/json'} if data else {}
+        try:
+            self._conn.request(method, path, data, headers)
+            response = self._conn.getresponse()
+            reply = json.loads(response.read())
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            self._conn.close()
+            raise exceptions.ServerError(f'groc server request failed: {e}')
+        if not reply.get('ok'):
+            raise exceptions.ServerError(reply.get('error'))
+        return reply.get('result')
+
+    def call(self, command, **options):
+        """
+        Run a command on the server.
+
+        Args:
+            command (str): add, bulk_add, delete, list, breakdown or export.
+            options: command options.
+
+        Returns:
+            The command result, see batch.
+
+        Raises:
+            exceptions.ServerError: if the request or the command failed.
+        """
+        return self._request('POST', f'/{command}', options)
+
+    def health(self):
+        """ Check that the server is up, raising ServerError if not. """
+        self._request('GET', '/health')
+        return True
+
+    def add(self, **options):
+        """ Add a purchase, see groc add. """
+        return self.call('add', **options)['added']
+
+    def bulk_add(self, purchases, ignore_duplicate=False):
+        """
+        Add purchases in a single transaction.
+
+        Args:
+            purchases (list): dicts with date, store, total, description.
+            ignore_duplicate (bool): skip duplicate purchases.
+
+        Returns:
+            int: count of purchases added.
+        """
+        return self.call('bulk_add', purchases=purchases,
+                         ignore_duplicate=ignore_duplicate)['added']
+
+    def delete(self, ids, dry_run=False):
+        """ Delete purchases by id, returning the ids found. """
+        return self.call('delete', id=list(ids), dry_run=dry_run)['deleted']
+
+    def list(self, **options):
+        """ List purchases, see groc list. """
+        return self.call('list', **options)['purchases']
+
+    def breakdown(self, **options):
+        """ Monthly purchase stats, see groc breakdown. """
+        return self.call('breakdown', **options)['months']
+
+    def export(self, **options):
+        """ Purchases in the CSV import format, see groc export. """
+        return self.call('export', **options)['purchases']
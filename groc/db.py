@@ -1,8 +1,34 @@
+import contextlib
 import csv
 import datetime
+import functools
+import os
+import random
 import sqlite3
+import threading
+import time
 
-from . import exceptions, utils
+from . import exceptions, metrics, trace, utils
+
+
+""" Concurrency settings """
+# Seconds a connection waits on a locked database before giving up.
+DEFAULT_BUSY_TIMEOUT = 5.0
+
+# Extra attempts made by write functions when the database stays locked,
+# sleeping LOCK_RETRY_BACKOFF * 2 ** attempt seconds (plus jitter) in between.
+LOCK_RETRIES = 5
+LOCK_RETRY_BACKOFF = 0.05
+
+LOCKED_MESSAGE = ('The database is locked by another groc process. '
+                  'Try again once it has finished.')
+
+# Database name of a private in-memory database.
+MEMORY_DB = ':memory:'
+
+# Csv rows imported between calls of a progress callback
+# (see insert_from_csv_dict)
+PROGRESS_ROWS = 1000
 
 
 """ SQLite specific statements """
@@ -38,6 +64,78 @@ BEGIN
     END;
 END;"""
 
+# Integer year/month of purchase_date, computed by SQLite (virtual
+# generated columns take no space in the table) and stored only in the
+# narrow (year, month) index below. Month filters search the index,
+# the purchase rows are then read by rowid.
+sqlite_add_purchase_year_column = """ALTER TABLE purchase ADD COLUMN
+purchase_year INTEGER
+GENERATED ALWAYS AS (CAST(strftime('%Y', purchase_date) AS INTEGER)) VIRTUAL;"""
+
+sqlite_add_purchase_month_column = """ALTER TABLE purchase ADD COLUMN
+purchase_month INTEGER
+GENERATED ALWAYS AS (CAST(strftime('%m', purchase_date) AS INTEGER)) VIRTUAL;"""
+
+sqlite_create_purchase_year_month_index = """CREATE INDEX IF NOT EXISTS
+purchase_year_month_idx ON purchase (
+    purchase_year,
+    purchase_month
+);"""
+
+sqlite_drop_purchase_year_month_index = """DROP INDEX IF EXISTS
+purchase_year_month_idx;"""
+
+# Database id and a data version bumped once by every write function
+# or transaction changing purchases (see bump_data_version), used to
+# invalidate cached report results (see cache.py). PRAGMA data_version
+# only tracks changes seen by one connection, this counter is persistent.
+sqlite_create_meta_table = """CREATE TABLE IF NOT EXISTS groc_meta (
+    key TEXT PRIMARY KEY,
+    value NOT NULL
+) WITHOUT ROWID;"""
+
+sqlite_init_meta = """INSERT OR IGNORE INTO groc_meta (key, value) VALUES
+    ('db_id', lower(hex(randomblob(8)))),
+    ('data_version', 0);"""
+
+sqlite_reset_db_id = """UPDATE groc_meta
+SET value = lower(hex(randomblob(8)))
+WHERE key = 'db_id';"""
+
+# Bumped the data version on every changed row, replaced by
+# bump_data_version.
+sqlite_data_version_trigger = """CREATE TRIGGER IF NOT EXISTS
+purchase_{event}_data_version
+AFTER {event}
+ON purchase
+BEGIN
+    UPDATE groc_meta SET value = value + 1 WHERE key = 'data_version';
+END;"""
+
+sqlite_drop_data_version_trigger = """DROP TRIGGER IF EXISTS
+purchase_{event}_data_version;"""
+
+sqlite_bump_data_version = """UPDATE {schema}.groc_meta
+SET value = value + 1
+WHERE key = 'data_version';"""
+
+sqlite_select_data_version = """SELECT
+    (SELECT value FROM {schema}.groc_meta WHERE key = 'db_id') AS db_id,
+    (SELECT value FROM {schema}.groc_meta WHERE key = 'data_version')
+        AS data_version;"""
+
+# Duplicate check against purchases moved to the archive database
+# (see archive.py), served by the archive's store name and purchase
+# UNIQUE indexes.
+sqlite_select_archived_purchase = """SELECT 1
+FROM archive.purchase p
+INNER JOIN archive.store s ON p.store_id = s.id
+WHERE
+    s.name = ?
+    AND p.purchase_date = ?
+    AND p.total = ?
+    AND p.description IS ?;"""
+
 sqlite_list_tables = """SELECT name FROM sqlite_master WHERE type='table';"""
 
 sqlite_count_tables = """SELECT COUNT(*) FROM sqlite_master WHERE type='table';"""
@@ -62,7 +160,7 @@ WHERE id IN (%s);"""
 sqlite_select_purchase_ids_by_month = """SELECT
     id
 FROM purchase
-WHERE strftime('%%m', purchase_date) IN (%s);"""
+WHERE purchase_month IN (%s);"""
 
 sqlite_list_purchase_date_limit = """SELECT
     p.id,
@@ -73,8 +171,8 @@ sqlite_list_purchase_date_limit = """SELECT
 FROM purchase p
 INNER JOIN store s ON p.store_id = s.id
 WHERE
-    strftime ('%m', date) = ?
-    AND strftime ('%Y', date) = ?
+    p.purchase_month = ?
+    AND p.purchase_year = ?
 ORDER BY date DESC
 LIMIT ?;"""
 
@@ -98,26 +196,27 @@ sqlite_list_purchase_date = """SELECT
 FROM purchase p
 INNER JOIN store s ON p.store_id = s.id
 WHERE
-    strftime ('%m', date) = ?
-    AND strftime ('%Y', date) = ?
+    p.purchase_month = ?
+    AND p.purchase_year = ?
 ORDER BY date DESC;"""
 
 sqlite_select_purchase_count_and_total_per_month = """SELECT
-    strftime ('%%m',p.purchase_date) AS num_month,
-    strftime('%%Y', p.purchase_date) AS year,
-    p.purchase_date as "month [purchase_month_abbreviated]",
+    printf('%%02d', p.purchase_month) AS num_month,
+    CAST(p.purchase_year AS TEXT) AS year,
+    printf('%%04d-%%02d-01', p.purchase_year, p.purchase_month)
+        AS "month [purchase_month_abbreviated]",
     SUM(p.total) as "total [total_money]",
-    COUNT(p.id) AS "purchase count",
+    COUNT(*) AS "purchase count",
     MIN(p.total) as "min purchase [total_money]",
     MAX(p.total) as "max purchase [total_money]",
     round(avg(p.total)) as "avg purchase [total_money]",
     COUNT(DISTINCT p.store_id) as "store count"
 FROM purchase p
-WHERE num_month IN (%s) AND year IN (%s)
+WHERE p.purchase_month IN (%s) AND p.purchase_year IN (%s)
 GROUP BY
-    num_month,
-    year
-ORDER BY year DESC, num_month DESC;"""
+    p.purchase_year,
+    p.purchase_month
+ORDER BY p.purchase_year DESC, p.purchase_month DESC;"""
 
 # SQL general statements
 sql_count_store_table = """SELECT COUNT(*) FROM store;"""
@@ -176,6 +275,73 @@ def total_to_float(bytes_string):
 """ Db methods """
 
 
+def is_lock_error(exc):
+    """
+    Check whether a SQLite exception was caused by lock contention.
+
+    Args:
+        exc (Exception): exception raised by the sqlite3 module.
+
+    Returns:
+        bool: True if the database (or a table) was locked or busy.
+    """
+    msg = str(exc).lower()
+    return isinstance(exc, sqlite3.OperationalError) and (
+        'locked' in msg or 'busy' in msg)
+
+
+def retry_on_lock(func):
+    """
+    Decorator retrying a write function while the database is locked.
+
+    The wrapped function must leave the database untouched when it raises
+    exceptions.DatabaseLockedError (e.g. by running in a `with conn:` block),
+    so it can safely be called again. Retries LOCK_RETRIES times with
+    exponential backoff before letting the exception propagate.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except exceptions.DatabaseLockedError:
+                if attempt >= LOCK_RETRIES:
+                    raise
+                delay = LOCK_RETRY_BACKOFF * 2 ** attempt
+                time.sleep(delay + random.uniform(0, delay))
+                attempt += 1
+    return wrapper
+
+
+def timed(execute):
+    """
+    Wrap an execute(sql, values) function to be timed by the SQL tracer
+    and the metrics collector, when enabled (see trace and metrics).
+    """
+    if trace.active is not None:
+        execute = trace.active.timed(execute)
+    if metrics.active is not None:
+        execute = metrics.active.timed(execute)
+    return execute
+
+
+def statement_callback():
+    """
+    Trace callback of new connections, reporting their statements to
+    the SQL tracer and the metrics collector. None if both are off.
+    """
+    callbacks = [observer.on_statement for observer in
+                 (trace.active, metrics.active) if observer is not None]
+    if len(callbacks) < 2:
+        return callbacks[0] if callbacks else None
+
+    def callback(sql):
+        for observer_callback in callbacks:
+            observer_callback(sql)
+    return callback
+
+
 def execute_sql(conn, sql_stmt, values=()):
     """
     Execute a sql statement via connection cursor.
@@ -189,27 +355,21 @@ def execute_sql(conn, sql_stmt, values=()):
         cursor: SQLite cursor object.
 
     Raises:
+        exceptions.DatabaseLockedError: if the database stayed locked.
         exceptions.DatabaseError.
     """
-    with conn:
-        try:
+    try:
+        with conn:
             cursor = conn.cursor()
-            return cursor.execute(sql_stmt, values)
-        except sqlite3.DatabaseError:
-            raise exceptions.DatabaseError('Something went wrong with the database!')
-
-
-def create_connection(cnxn_str):
-    """
-    Create and return a SQLite connection.
+            return timed(cursor.execute)(sql_stmt, values)
+    except sqlite3.DatabaseError as e:
+        if is_lock_error(e):
+            raise exceptions.DatabaseLockedError(LOCKED_MESSAGE)
+        raise exceptions.DatabaseError('Something went wrong with the database!')
 
-    Args:
-        cnxn_str (str): path to create db.
 
-    Returns:
-        connection: SQLite connection object.
-    """
-    # Register sqlite converters
+def register_converters():
+    """ Register the column converters used by groc queries. """
     sqlite3.register_converter("purchase_date",
                                datetime_worded_full)
     sqlite3.register_converter("purchase_date_abbreviated",
@@ -222,29 +382,363 @@ def create_connection(cnxn_str):
         "purchase_month_year", datetime_month_year_numeric)
     sqlite3.register_converter("total_money", total_to_float)
 
+
+def query(conn, sql_stmt, values=()):
+    """
+    Execute a read-only sql statement without transaction handling.
+
+    Unlike execute_sql, no commit is issued, so several queries can
+    share one read snapshot (see read_snapshot). The returned cursor
+    is a lazy iterator over the result rows.
+
+    Args:
+        conn: SQLite connection object.
+        sql_stmt (str): a SELECT statement.
+        values (list): values to use in sql statement.
+
+    Returns:
+        cursor: SQLite cursor object.
+
+    Raises:
+        exceptions.DatabaseLockedError: if the database stayed locked.
+        exceptions.DatabaseError.
+    """
+    try:
+        return timed(conn.execute)(sql_stmt, values)
+    except sqlite3.DatabaseError as e:
+        if is_lock_error(e):
+            raise exceptions.DatabaseLockedError(LOCKED_MESSAGE)
+        raise exceptions.DatabaseError('Something went wrong with the database!')
+
+
+@contextlib.contextmanager
+def read_snapshot(conn):
+    """
+    Context manager running queries inside a single read transaction.
+
+    All queries issued on the connection inside the block see the same
+    consistent view of the database, even while another process imports.
+    The transaction only ever reads, so it is ended with a (free) rollback
+    instead of a commit. If the connection is already in a transaction,
+    that transaction is reused and left open.
+
+    Args:
+        conn: SQLite connection object.
+    """
+    if conn.in_transaction:
+        yield conn
+        return
+
+    query(conn, 'BEGIN DEFERRED;')
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+
+
+class TransactionConnection:
+    """
+    Connection handed out inside transaction(). The `with conn:` blocks
+    and commits of the db functions join the surrounding transaction
+    instead of committing it; everything else is the wrapped connection.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # An error aborts the whole transaction, see transaction()
+        return False
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+@contextlib.contextmanager
+def transaction(conn):
+    """
+    Context manager running all writes issued inside it in a single
+    transaction: committed when the block ends, rolled back entirely
+    if it raises. Raise exceptions.RollbackTransaction to roll it back
+    without an error.
+
+        with transaction(conn) as tx:
+            insert_row(tx, row)
+            delete_from_db(tx, ids)
+
+    Databases must be attached before, ATTACH fails inside a transaction.
+
+    Args:
+        conn: SQLite connection object, not inside a transaction.
+
+    Yields:
+        TransactionConnection: the connection to pass to db functions.
+
+    Raises:
+        exceptions.DatabaseLockedError: if the database stayed locked.
+    """
+    try:
+        conn.execute('BEGIN IMMEDIATE;')
+    except sqlite3.OperationalError as e:
+        if is_lock_error(e):
+            raise exceptions.DatabaseLockedError(LOCKED_MESSAGE)
+        raise exceptions.DatabaseError(str(e))
+
+    try:
+        yield TransactionConnection(conn)
+    except exceptions.RollbackTransaction:
+        conn.rollback()
+        return
+    except BaseException:
+        conn.rollback()
+        raise
+    try:
+        # Once for all writes of the transaction, see bump_data_version
+        bump_data_version(conn)
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        conn.rollback()
+        if is_lock_error(e):
+            raise exceptions.DatabaseLockedError(LOCKED_MESSAGE)
+        raise exceptions.DatabaseError(str(e))
+
+
+@contextlib.contextmanager
+def savepoint(conn, name='groc'):
+    """
+    Context manager undoing the writes issued inside it if it raises,
+    without ending the surrounding transaction (see transaction()).
+
+    Args:
+        conn: SQLite connection object, inside a transaction.
+        name (str): savepoint name.
+    """
+    conn.execute(f'SAVEPOINT {name};')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute(f'ROLLBACK TO {name};')
+        conn.execute(f'RELEASE {name};')
+        raise
+    conn.execute(f'RELEASE {name};')
+
+
+def iter_rows(cursor, batch_size=500):
+    """
+    A generator yielding rows from a cursor, fetched in batches.
+
+    Args:
+        cursor: SQLite cursor object.
+        batch_size (int): number of rows fetched at a time.
+
+    Yields:
+        sqlite3.Row objects.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield row
+
+
+def default_db_path():
+    """ Path of the default database, ~/.groc/groc.db. """
+    return os.path.join(os.path.expanduser('~/.groc/'), 'groc.db')
+
+
+def sidecar_path(db_path, name, default_name=None):
+    """
+    Path of a file kept next to a database (archive, lock file, cache,
+    partitions, ...). Next to the default database it is default_name,
+    next to others <stem>.name, so databases sharing a directory never
+    share their files.
+
+    Args:
+        db_path (str): absolute path of the database, None for the
+                       default one.
+        name (str): suffix of the file name.
+        default_name (str): file name next to the default database,
+                            name if not given.
+
+    Returns:
+        str: absolute path.
+    """
+    path = os.path.normpath(db_path or default_db_path())
+    directory, file_name = os.path.split(path)
+    if path != os.path.normpath(default_db_path()):
+        stem = os.path.splitext(file_name)[0]
+        return os.path.join(directory, f'{stem}.{name}')
+    return os.path.join(directory, default_name or name)
+
+
+def shared_memory_url(name):
+    """
+    URI of a named in-memory database shared by all connections of the
+    process (shared cache), unlike ':memory:' which is private to one
+    connection. The database lives as long as one connection is open.
+
+    Args:
+        name (str): database name, unique per database.
+
+    Returns:
+        str: SQLite URI filename.
+    """
+    return f'file:{name}?mode=memory&cache=shared'
+
+
+def create_connection(cnxn_str, busy_timeout=DEFAULT_BUSY_TIMEOUT,
+                      read_only=False, check_same_thread=True, migrate=True):
+    """
+    Create and return a SQLite connection.
+
+    File databases are switched to WAL journaling so that readers
+    do not block the writer (and vice versa).
+
+    Args:
+        cnxn_str (str): path to create db, or a 'file:' URI
+                        (see shared_memory_url).
+        busy_timeout (float): seconds to wait for a lock held by
+                              another connection.
+        read_only (bool): open an existing db file with a mode=ro URI.
+        check_same_thread (bool): restrict use of the connection to the
+                                  creating thread (see ConnectionPool).
+        migrate (bool): apply pending schema migrations to an
+                        initialized database.
+
+    Returns:
+        connection: SQLite connection object.
+    """
+    uri = str(cnxn_str).startswith('file:')
+    if read_only and not uri and str(cnxn_str) != MEMORY_DB:
+        # urllib.request is slow to import, only needed here
+        from urllib.request import pathname2url
+        cnxn_str = 'file:{}?mode=ro'.format(
+            pathname2url(os.path.abspath(cnxn_str)))
+        uri = True
+
     connection = sqlite3.connect(
-        cnxn_str, detect_types=sqlite3.PARSE_COLNAMES)
+        cnxn_str, detect_types=sqlite3.PARSE_COLNAMES, timeout=busy_timeout,
+        uri=uri, check_same_thread=check_same_thread)
 
     # Set pragms and row_factory
     connection.execute('PRAGMA foreign_keys = ON;')
+    if not uri:
+        connection.execute('PRAGMA journal_mode = WAL;')
     connection.row_factory = sqlite3.Row
+    callback = statement_callback()
+    if callback is not None:
+        connection.set_trace_callback(callback)
+
+    if migrate and not read_only:
+        # Imported here, migrations depends on this module
+        from . import migrations
+        if (migrations.is_initialized(connection) and
+                migrations.pending_migrations(connection)):
+            migrations.migrate(connection)
 
     return connection
 
 
+register_converters()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool handing out one SQLite connection per thread.
+
+    A thread keeps its connection until it calls release() or exits,
+    so cursors returned by db functions stay valid while they are
+    consumed. Connections of released or finished threads are reused
+    by the next thread asking for one, which is why the factory must
+    create connections with check_same_thread=False.
+    """
+
+    def __init__(self, factory):
+        """
+        Args:
+            factory (callable): creates a new connection.
+        """
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._in_use = {}  # thread ident -> connection
+        self._idle = []
+
+    def _reap(self):
+        """ Return connections of finished threads to the idle list. """
+        alive = {thread.ident for thread in threading.enumerate()}
+        for ident in [i for i in self._in_use if i not in alive]:
+            self._idle.append(self._in_use.pop(ident))
+
+    def peek(self):
+        """ Connection held by the calling thread, or None. """
+        return self._in_use.get(threading.get_ident())
+
+    def get(self):
+        """
+        Connection for the calling thread, connecting on first use.
+
+        Returns:
+            connection: SQLite connection object.
+        """
+        ident = threading.get_ident()
+        with self._lock:
+            conn = self._in_use.get(ident)
+            if conn is not None:
+                return conn
+            self._reap()
+            conn = self._idle.pop() if self._idle else None
+
+        if conn is None:
+            conn = self._factory()
+
+        with self._lock:
+            self._in_use[ident] = conn
+        return conn
+
+    def release(self):
+        """ Hand the calling thread's connection back for reuse. """
+        with self._lock:
+            conn = self._in_use.pop(threading.get_ident(), None)
+            if conn is not None:
+                self._idle.append(conn)
+
+    def close(self):
+        """ Close every connection of the pool. """
+        with self._lock:
+            connections = list(self._in_use.values()) + self._idle
+            self._in_use.clear()
+            self._idle = []
+        for conn in connections:
+            conn.close()
+
+    def __len__(self):
+        return len(self._in_use) + len(self._idle)
+
+
 def setup_db(conn):
     """
-    Set up the sqlite database with store and puchase tables.
+    Set up the sqlite database with store and puchase tables,
+    applying all schema migrations.
 
     Args:
         conn: SQLite connection object.
 
     Returns: None.
     """
-    with conn:
-        execute_sql(conn, sqlite_create_store_table)
-        execute_sql(conn, sqlite_create_purchase_table)
-        execute_sql(conn, sqlite_insert_purchase_trigger)
+    # Imported here, migrations depends on this module
+    from . import migrations
+    migrations.migrate(conn)
 
 
 def select_by_id(conn, ids):
@@ -256,13 +750,13 @@ def select_by_id(conn, ids):
         ids (list/tuple): purchase ids.
 
     Returns:
-        A SQLite cursor object (return value of execute_sql).
+        A SQLite cursor object (return value of query).
     """
     sql_select = multiple_parameter_substitution(
         sqlite_select_purchase_by_id,
         [len(ids)]
     )
-    return execute_sql(conn, sql_select, values=ids)
+    return query(conn, sql_select, values=ids)
 
 
 def select_purchase_ids(conn, ids):
@@ -274,13 +768,13 @@ def select_purchase_ids(conn, ids):
         ids (list/tuple): purchase ids.
 
     Returns:
-        A SQLite cursor object (return value of execute_sql).
+        A SQLite cursor object (return value of query).
     """
     sql_select = multiple_parameter_substitution(
         sqlite_select_purchase_ids,
         [len(ids)]
     )
-    return execute_sql(conn, sql_select, values=ids)
+    return query(conn, sql_select, values=ids)
 
 
 def select_ids_by_month(conn, months):
@@ -292,13 +786,13 @@ def select_ids_by_month(conn, months):
         months (list/tuple): two digit month strings.
 
     Returns:
-        A SQLite cursor object (return value of execute_sql).
+        A SQLite cursor object (return value of query).
     """
     sql_select = multiple_parameter_substitution(
         sqlite_select_purchase_ids_by_month,
         [len(months)]
     )
-    return execute_sql(conn, sql_select, values=months)
+    return query(conn, sql_select, values=[int(m) for m in months])
 
 
 def select_purchase_count(conn):
@@ -309,9 +803,71 @@ def select_purchase_count(conn):
         conn: SQLite connection object.
 
     Returns:
-        A SQLite cursor object (return value of execute_sql).
+        A SQLite cursor object (return value of query).
+    """
+    return query(conn, sql_count_purchase_table)
+
+
+def select_data_version(conn, schema='main'):
+    """
+    Get the database id and data version (see groc_meta).
+
+    Args:
+        conn: SQLite connection object.
+        schema (str): schema of the database on the connection.
+
+    Returns:
+        tuple: (db_id, data_version).
+
+    Raises:
+        exceptions.DatabaseError: if the database predates groc_meta.
+    """
+    row = query(conn, sqlite_select_data_version.format(schema=schema)
+                ).fetchone()
+    return row['db_id'], row['data_version']
+
+
+def bump_data_version(conn, schema='main'):
     """
-    return execute_sql(conn, sql_count_purchase_table)
+    Bump the data version (see groc_meta) in the open transaction of a
+    write function changing purchases, once per write. Nothing is done
+    inside transaction(), which bumps it once when committing.
+
+    Args:
+        conn: SQLite connection object.
+        schema (str): schema of the changed database on the connection.
+    """
+    if isinstance(conn, TransactionConnection):
+        return
+    try:
+        timed(conn.execute)(sqlite_bump_data_version.format(schema=schema))
+    except sqlite3.OperationalError as e:
+        # Databases older than schema version 4 have no groc_meta
+        if 'no such table' not in str(e):
+            raise
+
+
+@retry_on_lock
+def commit_data_version(conn, schema='main'):
+    """
+    Bump the data version in its own transaction, once after purchases
+    were changed by several transactions, e.g. the rows of a csv import.
+
+    Args:
+        conn: SQLite connection object.
+        schema (str): schema of the changed database on the connection.
+
+    Raises:
+        exceptions.DatabaseLockedError: if the database stayed locked.
+        exceptions.DatabaseError.
+    """
+    try:
+        with conn:
+            bump_data_version(conn, schema)
+    except sqlite3.DatabaseError as e:
+        if is_lock_error(e):
+            raise exceptions.DatabaseLockedError(LOCKED_MESSAGE)
+        raise exceptions.DatabaseError(str(e))
 
 
 def select_count_total_per_month(conn, months, years):
@@ -324,15 +880,17 @@ def select_count_total_per_month(conn, months, years):
         years (list/tuple): four digit year strings.
 
     Returns:
-        A SQLite cursor object (return value of execute_sql).
+        A SQLite cursor object (return value of query).
     """
     sql_select = multiple_parameter_substitution(
         sqlite_select_purchase_count_and_total_per_month,
         [len(months), len(years)]
     )
-    return execute_sql(conn, sql_select, values=tuple(months + years))
+    values = [int(m) for m in months] + [int(y) for y in years]
+    return query(conn, sql_select, values=values)
 
 
+@retry_on_lock
 def delete_from_db(conn, ids):
     """
     Deletes rows from the purchase table given
@@ -343,13 +901,25 @@ def delete_from_db(conn, ids):
         ids (list/tuple): purchase ids.
 
     Returns:
-        A SQLite cursor object (return value of execute_sql).
+        A SQLite cursor object.
+
+    Raises:
+        exceptions.DatabaseLockedError: if the database stayed locked.
+        exceptions.DatabaseError.
     """
     sql_delete = multiple_parameter_substitution(
         sqlite_delete_purchase_by_id,
         [len(ids)]
     )
-    return execute_sql(conn, sql_delete, values=ids)
+    try:
+        with conn:
+            cursor = timed(conn.cursor().execute)(sql_delete, ids)
+            bump_data_version(conn)
+            return cursor
+    except sqlite3.DatabaseError as e:
+        if is_lock_error(e):
+            raise exceptions.DatabaseLockedError(LOCKED_MESSAGE)
+        raise exceptions.DatabaseError('Something went wrong with the database!')
 
 
 def get_purchases_date_limit(conn, month, year, limit):
@@ -363,10 +933,10 @@ def get_purchases_date_limit(conn, month, year, limit):
         limit (int): Integer value for purchase limit.
 
     Returns:
-        A SQLite cursor object (return value of execute_sql).
+        A SQLite cursor object (return value of query).
     """
-    return execute_sql(conn, sqlite_list_purchase_date_limit,
-                       values=(month, year, limit,))
+    return query(conn, sqlite_list_purchase_date_limit,
+                 values=(int(month), int(year), limit,))
 
 
 def get_purchases_date(conn, month, year):
@@ -379,9 +949,10 @@ def get_purchases_date(conn, month, year):
         year (str): four digit year string.
 
     Returns:
-        A SQLite cursor object (return value of execute_sql).
+        A SQLite cursor object (return value of query).
     """
-    return execute_sql(conn, sqlite_list_purchase_date, values=(month, year,))
+    return query(conn, sqlite_list_purchase_date,
+                 values=(int(month), int(year),))
 
 
 def get_purchases_limit(conn, limit):
@@ -393,11 +964,12 @@ def get_purchases_limit(conn, limit):
         limit (int): limit (int): Integer value for purchase limit.
 
     Returns:
-        A SQLite cursor object (return value of execute_sql).
+        A SQLite cursor object (return value of query).
     """
-    return execute_sql(conn, sqlite_list_purchase_limit, values=(limit,))
+    return query(conn, sqlite_list_purchase_limit, values=(limit,))
 
 
+@retry_on_lock
 def clear_db(conn):
     """
     Delete all data from the store and purchase tables.
@@ -409,18 +981,23 @@ def clear_db(conn):
         A SQLite cursor object.
 
     Raises:
+        exceptions.DatabaseLockedError: if the database stayed locked.
         exceptions.DatabaseError
 
     """
-    with conn:
-        try:
+    try:
+        with conn:
             cursor = conn.cursor()
-            return cursor.executescript('{} {}'.format(
+            cursor.executescript('{} {}'.format(
                 sql_clear_purchase_table,
                 sql_clear_store_table
             ))
-        except sqlite3.DatabaseError as e:
-            raise exceptions.DatabaseError(str(e))
+            bump_data_version(conn)
+            return cursor
+    except sqlite3.DatabaseError as e:
+        if is_lock_error(e):
+            raise exceptions.DatabaseLockedError(LOCKED_MESSAGE)
+        raise exceptions.DatabaseError(str(e))
 
 
 def multiple_parameter_substitution(sql_stmt, lengths):
@@ -457,13 +1034,25 @@ def multiple_parameter_substitution(sql_stmt, lengths):
     return sql_stmt % string_placements
 
 
-def insert_row_sqlite(cursor, row):
+def duplicate_message(row):
+    """ Error message for a duplicate purchase row (total in cents). """
+    total = float(row['total'])/100
+    return f'Duplicate purchase detected -- (' \
+           f'date: {row["date"]}, ' \
+           f'store: {row["store"]}, ' \
+           f'total: {total:.2f}, ' \
+           f'description: {row["description"]})'
+
+
+def insert_row_sqlite(cursor, row, check_archive=False):
     """
     Insert purchase data from into SQLite db.
 
     Args:
         cursor: A SQLite cursor object.
         row (dict): A dictionary with keys (date, store, total, description).
+        check_archive (bool): also reject purchases found in the attached
+                              archive database.
 
     Returns: None
 
@@ -471,40 +1060,47 @@ def insert_row_sqlite(cursor, row):
         exceptions.DatabaseInsertError: if required value missing or some other
                                         SQLite exception.
         exceptions.DuplicateRow: if attempting to insert a duplicate purchase.
+        exceptions.DatabaseLockedError: if the database stayed locked.
     """
     purchase_date = row['date']
     store = row['store']
     total = row['total']
     description = row['description']
+    execute = timed(cursor.execute)
 
     try:
+        if check_archive and execute(
+                sqlite_select_archived_purchase,
+                (store, purchase_date, total, description,)).fetchone():
+            raise exceptions.DuplicateRow(duplicate_message(row))
+
         # Insert store and get store_id
-        cursor.execute('INSERT OR IGNORE INTO store(name) VALUES (?)',
-                       (store,))
-        store_id = cursor.execute('SELECT id FROM store WHERE name = ?',
-                                  (store,)).fetchone()[0]
+        execute('INSERT OR IGNORE INTO store(name) VALUES (?)', (store,))
+        store_id = execute('SELECT id FROM store WHERE name = ?',
+                           (store,)).fetchone()[0]
 
         # Insert purchase details
-        cursor.execute(
+        execute(
             """
                 INSERT INTO purchase
                     (purchase_date, total, description, store_id)
                 VALUES (?, ?, ?, ?);
             """, (purchase_date, total, description, store_id,))
 
+    except exceptions.DuplicateRow:
+        raise
+
     except (sqlite3.IntegrityError, sqlite3.DatabaseError, Exception) as e:
+        if is_lock_error(e):
+            raise exceptions.DatabaseLockedError(LOCKED_MESSAGE)
+
         exc = exceptions.DatabaseInsertError
         msg = 'Error saving purchase to database.'
 
         if (('UNIQUE constraint' in e.__str__()) or
            ('Purchase entry already exists' in e.__str__())):
             exc = exceptions.DuplicateRow
-            total = float(total)/100
-            msg = f'Duplicate purchase detected -- (' \
-                  f'date: {purchase_date}, ' \
-                  f'store: {store}, ' \
-                  f'total: {total:.2f}, ' \
-                  f'description: {description})'
+            msg = duplicate_message(row)
 
         if 'NOT NULL constraint' in e.__str__():
             msg = 'Received incorrect value for required field(s).'
@@ -538,7 +1134,53 @@ def open_files(file_paths):
             raise exceptions.GrocException(f'Error reading file: {file}')
 
 
-def validate_insert_row(conn, row, ignore_duplicate=False):
+@retry_on_lock
+def insert_row(conn, row, ignore_duplicate=False, check_archive=False,
+               bump_version=True):
+    """
+    Adds a single validated purchase to database in its own transaction.
+
+    Args:
+        conn: A SQLite connection object.
+        row (dict): Dictionary with purchase details,
+            as returned by utils.validate_row.
+        ignore_duplicate (bool): Flag to indicate whether
+            to ignore exceptions thrown when a duplicate
+            purchase entered. Default is False.
+        check_archive (bool): Flag to also look for duplicates in the
+            archive database attached to conn.
+        bump_version (bool): Flag to bump the data version in the same
+            transaction, False if the caller bumps it once for many rows
+            (see commit_data_version).
+
+    Returns:
+        bool: True if successful
+
+    Raises:
+        exceptions.DuplicateRow: if duplicate row detected.
+        exceptions.DatabaseLockedError: if the database stayed locked.
+    """
+    try:
+        with conn:
+            cursor = conn.cursor()
+            try:
+                insert_row_sqlite(cursor, row, check_archive)
+                if bump_version:
+                    bump_data_version(conn)
+                return True
+
+            except exceptions.DuplicateRow:
+                if not ignore_duplicate:
+                    raise
+    except sqlite3.OperationalError as e:
+        # The commit itself can hit a lock held by another connection.
+        if is_lock_error(e):
+            raise exceptions.DatabaseLockedError(LOCKED_MESSAGE)
+        raise
+
+
+def validate_insert_row(conn, row, ignore_duplicate=False,
+                        check_archive=False, bump_version=True):
     """
     Adds a single purchase to database.
 
@@ -548,35 +1190,45 @@ def validate_insert_row(conn, row, ignore_duplicate=False):
         ignore_duplicate (bool): Flag to indicate whether
             to ignore exceptions thrown when a duplicate
             purchase entered. Default is False.
+        check_archive (bool): Flag to also look for duplicates in the
+            archive database attached to conn.
+        bump_version (bool): see insert_row.
 
     Returns:
         bool: True if successful
 
     Raises:
+        exceptions.InvalidRowException: if row data is invalid.
         exceptions.DuplicateRow: if duplicate row detected.
+        exceptions.DatabaseLockedError: if the database stayed locked.
     """
-    with conn:
-        cursor = conn.cursor()
-        try:
-            row = utils.validate_row(row)
-            insert_row_sqlite(cursor, row)
-            return True
-
-        except exceptions.DuplicateRow:
-            if not ignore_duplicate:
-                raise
+    return insert_row(conn, utils.validate_row(row), ignore_duplicate,
+                      check_archive, bump_version)
 
 
-def insert_from_csv_dict(conn, file_paths, ignore_duplicate=False):
+def insert_from_csv_dict(conn, file_paths, ignore_duplicate=False,
+                         row_inserter=None, progress=None):
     """
     Read contents of a csv file and insert purchase data to db.
 
     Args:
-        conn: A SQLite connection object.
+        conn: A SQLite connection object, None if row_inserter stores
+            the rows elsewhere.
         file_paths (list): file path strings
         ignore_duplcate (bool): Flag to indicate whether
             to ignore exceptions thrown when a duplicate
             purchase entered. Default is False.
+        row_inserter (callable): optional, called as
+            row_inserter(row, ignore_duplicate) to store each raw csv row
+            instead of validate_insert_row on conn. The data version of
+            conn is bumped once at the end of the import, so inserters
+            should not bump it per row (see insert_row).
+        progress (callable): optional, called as
+            progress(rows, bytes_read, total_bytes, finished) every
+            PROGRESS_ROWS rows and after each file, with the rows and
+            bytes read from all files so far, and once more with
+            finished True after the last file. Replaces the per file
+            messages.
 
     Returns:
         int: Count of how many purchases were added.
@@ -586,20 +1238,91 @@ def insert_from_csv_dict(conn, file_paths, ignore_duplicate=False):
         FileNotFoundError: if file not found.
         Exception: if another error happens while opening file.
     """
+    if row_inserter is None:
+        row_inserter = functools.partial(validate_insert_row, conn,
+                                         bump_version=False)
+    collector = metrics.active
+    try:
+        if collector is None:
+            return _insert_csv_files(file_paths, ignore_duplicate,
+                                     row_inserter, progress)
+
+        with collector.timed_import():
+            return _insert_csv_files(file_paths, ignore_duplicate,
+                                     counted(row_inserter, collector),
+                                     progress, collector)
+    finally:
+        # Rows inserted before an error are committed as well
+        if conn is not None:
+            commit_data_version(conn)
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        # Reported by open_files
+        return 0
+
+
+def _insert_csv_files(file_paths, ignore_duplicate, row_inserter,
+                      progress=None, collector=None):
     files = open_files(file_paths)
     count = 0
+    rows = 0
+    done_bytes = 0
+    total_bytes = (sum(_file_size(path) for path in file_paths)
+                   if progress is not None else 0)
 
     for file in files:
-        print(f'Importing data from {file.name}')
+        if progress is None:
+            print(f'Importing data from {file.name}')
+        if collector is not None:
+            collector.count('bytes_read', _file_size(file.name))
         dict_reader = csv.DictReader(file)
         dict_reader.fieldnames = [name.lower()
                                   for name in dict_reader.fieldnames]
 
         row_count = 0
         for row in dict_reader:
-            if validate_insert_row(conn, row, ignore_duplicate):
+            if row_inserter(row, ignore_duplicate):
                 row_count += 1
                 count += 1
-        print(f'{row_count} purchase(s) added')
-
+            if progress is not None:
+                rows += 1
+                if not rows % PROGRESS_ROWS:
+                    # Bytes handed to the csv reader, read ahead in blocks
+                    progress(rows, done_bytes + file.buffer.tell(),
+                             total_bytes, False)
+
+        if progress is None:
+            print(f'{row_count} purchase(s) added')
+        else:
+            done_bytes += _file_size(file.name)
+            progress(rows, done_bytes, total_bytes, False)
+
+    if progress is not None:
+        progress(rows, done_bytes, total_bytes, True)
     return count
+
+
+def counted(row_inserter, collector):
+    """
+    Wrap a row inserter (see insert_from_csv_dict) to count the rows it
+    reads, inserts, finds duplicate or rejects in a metrics collector.
+    """
+    def insert(row, ignore_duplicate):
+        collector.count('rows_read')
+        try:
+            inserted = row_inserter(row, ignore_duplicate)
+        except exceptions.DuplicateRow:
+            collector.count('rows_duplicate')
+            raise
+        except (exceptions.InvalidRowException, exceptions.RowIntegrityError,
+                exceptions.RowValueError, exceptions.DatabaseInsertError):
+            collector.count('rows_rejected')
+            raise
+        # Ignored duplicates are not inserted
+        collector.count('rows_inserted' if inserted else 'rows_duplicate')
+        return inserted
+    return insert
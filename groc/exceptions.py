@@ -31,3 +31,28 @@ class DatabaseInsertError(DatabaseError):
 class DuplicateRow(DatabaseInsertError):
     """A duplicate row was detected."""
     pass
+
+
+class DatabaseLockedError(DatabaseError):
+    """The database stayed locked by another connection for too long."""
+    pass
+
+
+class BatchError(GrocException):
+    """A batch command could not be parsed or run."""
+    pass
+
+
+class RollbackTransaction(GrocException):
+    """Raised inside a transaction to roll it back without an error."""
+    pass
+
+
+class ServerError(GrocException):
+    """The groc server could not be reached or returned an error."""
+    pass
+
+
+class ImportCancelled(GrocException):
+    """An import was cancelled before it finished."""
+    pass
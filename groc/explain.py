@@ -0,0 +1,167 @@
+import contextlib
+import re
+
+from . import batch, db, exceptions
+
+
+""" Query plans
+
+Collects the SQL statements groc issues and explains them with
+EXPLAIN QUERY PLAN, to spot queries that stopped using an index:
+
+    with trace_statements(conn) as statements:
+        g.breakdown(['01'], ['2019'])
+    for sql in statements:
+        print(format_plan(query_plan(conn, sql)))
+
+A plan step 'SCAN purchase' (without an index) reads the whole purchase
+table, which gets slow as purchases pile up; see full_scans. Filters
+on month and year should SEARCH an index instead, see index_searches.
+tests/test_query_plans.py asserts that groc commands avoid them.
+"""
+# Statements without a query plan worth showing
+SKIPPED_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE',
+                      'PRAGMA', 'ATTACH', 'DETACH', 'ANALYZE', 'VACUUM',
+                      '--')
+
+# Plan steps reading a whole table, e.g. 'SCAN purchase' or
+# 'SCAN TABLE purchase AS p' on SQLite before 3.36
+full_scan_re = re.compile(
+    r'^SCAN (?:TABLE )?(?P<table>\w+)(?: AS (?P<alias>\w+))?$')
+alias_re = r'\b(?:\w+\.)?{table}\s+(?:AS\s+)?(\w+)'
+subquery_re = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\w+)$')
+index_search_re = re.compile(
+    r'^SEARCH .*USING (?:COVERING )?INDEX (\w+)')
+
+
+def normalize(sql):
+    """ Collapse the whitespace of a statement to single spaces. """
+    return ' '.join(sql.split())
+
+
+@contextlib.contextmanager
+def trace_statements(conn):
+    """
+    Context manager collecting the statements executed on a connection.
+
+    Yields:
+        list: distinct statements in order of first execution, filled
+              when the block exits.
+    """
+    executed = []
+    conn.set_trace_callback(executed.append)
+    statements = []
+    try:
+        yield statements
+    finally:
+        # Back to the SQL tracer and metrics collector, if any
+        conn.set_trace_callback(db.statement_callback())
+        seen = set()
+        for sql in executed:
+            sql = normalize(sql)
+            if sql.upper().startswith(SKIPPED_STATEMENTS) or sql in seen:
+                continue
+            seen.add(sql)
+            statements.append(sql)
+
+
+def query_plan(conn, sql):
+    """
+    Explain a statement.
+
+    Args:
+        conn: SQLite connection, with the databases of the statement.
+        sql (str): statement, with values or ? placeholders
+                   (explained as NULL).
+
+    Returns:
+        list: (id, parent, detail) plan steps.
+    """
+    # Placeholders outside of string literals
+    values = [None] * re.sub(r"'(?:[^']|'')*'", '', sql).count('?')
+    return [tuple(row)[:2] + (tuple(row)[3],) for row in
+            conn.execute(f'EXPLAIN QUERY PLAN {sql}', values)]
+
+
+def full_scans(plan, sql, table='purchase'):
+    """
+    Plan steps reading all rows of a table without an index.
+
+    Args:
+        plan (list): output of query_plan.
+        sql (str): the explained statement, to resolve table aliases.
+        table (str): table name.
+
+    Returns:
+        list: details of the full scan steps.
+    """
+    names = {table}
+    names.update(re.findall(alias_re.format(table=table), sql, re.I))
+    # Subqueries aliased like the table are scanned as well
+    names -= {match.group(1) for match in
+              (subquery_re.match(detail) for _, _, detail in plan) if match}
+    scans = []
+    for _, _, detail in plan:
+        match = full_scan_re.match(detail)
+        if match and names & set(match.groups()):
+            scans.append(detail)
+    return scans
+
+
+def index_searches(plan):
+    """ Names of the indexes searched (not scanned) by plan steps. """
+    return [match.group(1) for match in
+            (index_search_re.match(detail) for _, _, detail in plan) if match]
+
+
+def format_plan(plan, sql=None):
+    """ Format plan steps as an indented tree, marking full scans. """
+    depths = {0: -1}
+    scans = set(full_scans(plan, sql)) if sql else set()
+    lines = [] if plan else ['  (no query plan)']
+    for step_id, parent, detail in plan:
+        depths[step_id] = depths.get(parent, -1) + 1
+        mark = '  <-- full table scan' if detail in scans else ''
+        lines.append('  ' * (depths[step_id] + 1) + detail + mark)
+    return '\n'.join(lines)
+
+
+def explain_command(g, group, name, args):
+    """
+    Run a command and explain the statements it issued.
+    The command runs in a transaction that is rolled back, so write
+    commands do not change the database.
+
+    Args:
+        g: Groc instance.
+        group (click.Group): the groc command group, parsing args.
+        name (str): command name, see batch.COMMANDS.
+        args (list): command line arguments of the command.
+
+    Returns:
+        list: (statement, plan) pairs.
+
+    Raises:
+        exceptions.BatchError: if the command is unknown.
+        exceptions.DatabaseError: for write commands on a
+                                  partitioned database.
+        click.ClickException: if the arguments are invalid.
+    """
+    if name not in batch.COMMANDS:
+        raise exceptions.BatchError(f'Unknown command {name!r}.')
+    params = batch.parse_params(group, name, args)
+
+    if g.is_partitioned():
+        # Partitions have no shared transaction to roll back
+        if name not in ['list', 'breakdown', 'export']:
+            raise exceptions.DatabaseError(
+                f'Cannot explain {name} on a partitioned database.')
+        with g.read_snapshot() as conn:
+            with trace_statements(conn) as statements:
+                batch.run(g, name, params)
+    else:
+        with g.transaction() as conn:
+            with trace_statements(conn) as statements:
+                batch.run(g, name, params)
+            raise exceptions.RollbackTransaction()
+    return [(sql, query_plan(conn, sql)) for sql in statements]
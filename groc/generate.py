@@ -0,0 +1,221 @@
+import csv
+import datetime
+import itertools
+import random
+
+from .records import Purchase
+from .utils import format_cents
+
+
+""" Synthetic purchases for load testing
+
+    generator = PurchaseGenerator(seed=42, stores=500)
+    with open('purchases.csv', 'w', newline='') as file:
+        generator.write_csv(file, 1000000)
+
+Purchases are generated in chunks from precomputed pools of dates,
+stores, totals and descriptions, so memory use does not grow with the
+row count and output is streamed as it is generated. Chunks are drawn
+column by column (random.choices), the CSV rows are formatted from
+pooled strings. The same arguments,
+seed and chunk size always produce the same purchases.
+
+Store popularity follows a Zipf-like distribution and totals a
+log-normal one, like real purchase histories. Duplicates repeat an
+earlier purchase of the same chunk; purchases can also coincide by
+chance, more often with few stores and a short date span.
+"""
+DEFAULT_ROWS = 10000
+DEFAULT_START = datetime.date(2015, 1, 1)
+DEFAULT_END = datetime.date(2019, 12, 31)
+DEFAULT_STORES = 200
+DEFAULT_NULL_RATIO = 0.3
+DEFAULT_UNICODE_RATIO = 0.1
+
+# Purchases generated (and written) at a time
+DEFAULT_CHUNK_SIZE = 10000
+
+# Distinct totals and descriptions drawn from
+TOTAL_POOL_SIZE = 100000
+DESCRIPTION_POOL_SIZE = 1000
+
+CSV_FIELDS = ['Date', 'Store', 'Total', 'Description']
+
+ASCII_SYLLABLES = [
+    'al', 'ba', 'co', 'de', 'fi', 'go', 'ha', 'ki', 'lo', 'ma', 'ne', 'or',
+    'pa', 'qui', 'ro', 'sa', 'ta', 'un', 'va', 'wel', 'xo', 'yu', 'zen']
+# Accented latin, cyrillic, greek and CJK syllables and some emoji,
+# exercising the unicode cleaning of imports
+UNICODE_SYLLABLES = [
+    'é', 'ñá', 'çö', 'ßü', 'øå', 'łę', 'жа', 'ми', 'στο', 'λα', '東', '京',
+    '市', '場', 'カ', 'フェ', '서울', '마트', '🍰', '🛒', '☕']
+STORE_KINDS = ['Market', 'Bakery', 'Deli', 'Grocery', 'Cafe', 'Pharmacy',
+               'Hardware', 'Books', 'Shop', 'Foods']
+DESCRIPTION_WORDS = [
+    'milk', 'bread', 'eggs', 'coffee', 'birthday', 'cake', 'groceries',
+    'lunch', 'dinner', 'snacks', 'gift', 'weekly', 'refill', 'supplies',
+    'vegetables', 'fruit', 'café au lait', 'crème brûlée', 'jalapeño']
+
+
+def _word(rng, syllables, count):
+    return ''.join(rng.choice(syllables) for _ in range(count))
+
+
+def store_names(count, rng, unicode_ratio=DEFAULT_UNICODE_RATIO):
+    """
+    Generate distinct store names.
+
+    Args:
+        count (int): number of names.
+        rng (random.Random): random generator.
+        unicode_ratio (float): share of names with non-ascii characters.
+
+    Returns:
+        list: store names.
+    """
+    names = []
+    seen = set()
+    while len(names) < count:
+        syllables = (UNICODE_SYLLABLES if rng.random() < unicode_ratio
+                     else ASCII_SYLLABLES)
+        name = (_word(rng, syllables, rng.randint(2, 3)).capitalize() +
+                ' ' + rng.choice(STORE_KINDS))
+        if name in seen:
+            # Few syllables give few combinations, number the repeats
+            name = f'{name} {len(names)}'
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def _descriptions(rng, unicode_ratio):
+    descriptions = []
+    for _ in range(DESCRIPTION_POOL_SIZE):
+        words = rng.sample(DESCRIPTION_WORDS, rng.randint(1, 3))
+        if rng.random() < unicode_ratio:
+            words.append(_word(rng, UNICODE_SYLLABLES, 2))
+        descriptions.append(' '.join(words))
+    return descriptions
+
+
+def _totals(rng):
+    # Median purchase around $25, rarely above $1,000
+    return [max(1, int(rng.lognormvariate(7.8, 1.0)))
+            for _ in range(TOTAL_POOL_SIZE)]
+
+
+class PurchaseGenerator:
+    """
+    Generates purchases from pools of dates, stores, totals and
+    descriptions drawn once from the seed.
+    """
+
+    def __init__(self, seed=0, start=DEFAULT_START, end=DEFAULT_END,
+                 stores=DEFAULT_STORES, duplicate_ratio=0.0,
+                 null_ratio=DEFAULT_NULL_RATIO,
+                 unicode_ratio=DEFAULT_UNICODE_RATIO):
+        """
+        Args:
+            seed (int): seed of the random generator.
+            start (datetime.date): first purchase date.
+            end (datetime.date): last purchase date.
+            stores (int): number of distinct stores.
+            duplicate_ratio (float): share of purchases repeating an
+                                     earlier one.
+            null_ratio (float): share of purchases without a description.
+            unicode_ratio (float): share of store names and descriptions
+                                   with non-ascii characters.
+
+        Raises:
+            ValueError: if end is before start.
+        """
+        if end < start:
+            raise ValueError('The end date must not be before the start date.')
+
+        self.rng = random.Random(seed)
+        self.duplicate_ratio = duplicate_ratio
+        self.dates = [start + datetime.timedelta(days=days)
+                      for days in range((end - start).days + 1)]
+        self.stores = store_names(stores, self.rng, unicode_ratio)
+        self.store_weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, stores + 1)))
+        self.totals = _totals(self.rng)
+        self.descriptions = _descriptions(self.rng, unicode_ratio) + [None]
+        # The descriptions share 1 - null_ratio, None takes null_ratio
+        share = (1 - null_ratio) / DESCRIPTION_POOL_SIZE
+        self.description_weights = [
+            share * (i + 1) for i in range(DESCRIPTION_POOL_SIZE)] + [1.0]
+
+    def columns(self, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Generate purchases in chunks of columns.
+
+        Args:
+            rows (int): number of purchases.
+            chunk_size (int): purchases per chunk.
+
+        Yields:
+            tuple: lists of dates, stores, totals (cents) and descriptions.
+        """
+        rng = self.rng
+        remaining = rows
+        while remaining > 0:
+            n = min(chunk_size, remaining)
+            remaining -= n
+            columns = (
+                rng.choices(self.dates, k=n),
+                rng.choices(self.stores, cum_weights=self.store_weights, k=n),
+                rng.choices(self.totals, k=n),
+                rng.choices(self.descriptions,
+                            cum_weights=self.description_weights, k=n))
+
+            duplicates = min(int(n * self.duplicate_ratio + rng.random()),
+                             n - 1)
+            if duplicates > 0:
+                # In order, so every copy is of a purchase kept in the chunk
+                for i in sorted(rng.sample(range(1, n), duplicates)):
+                    j = rng.randrange(i)
+                    for column in columns:
+                        column[i] = column[j]
+            yield columns
+
+    def purchases(self, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Generate purchases in chunks of records.
+
+        Args:
+            rows (int): number of purchases.
+            chunk_size (int): purchases per chunk.
+
+        Yields:
+            list: records.Purchase records without ids.
+        """
+        for dates, stores, totals, descriptions in self.columns(
+                rows, chunk_size):
+            yield list(map(Purchase._make, zip(
+                itertools.repeat(None), dates, stores, totals, descriptions)))
+
+    def write_csv(self, file, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Write purchases as CSV, in the format of groc add --source.
+
+        Args:
+            file: text file opened with newline=''.
+            rows (int): number of purchases.
+            chunk_size (int): purchases per chunk.
+
+        Returns:
+            int: number of purchases written.
+        """
+        # Format every pooled value once instead of once per row
+        dates = {date: date.isoformat() for date in self.dates}
+        totals = {total: format_cents(total) for total in self.totals}
+
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(CSV_FIELDS)
+        count = 0
+        for chunk in self.columns(rows, chunk_size):
+            writer.writerows(zip(map(dates.__getitem__, chunk[0]), chunk[1],
+                                 map(totals.__getitem__, chunk[2]), chunk[3]))
+            count += len(chunk[0])
+        return count
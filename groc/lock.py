@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+
+from . import exceptions
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+# Suffix of lock files, see db.sidecar_path
+LOCK_NAME = 'lock'
+
+# Seconds a writer waits for the advisory lock before giving up.
+DEFAULT_LOCK_TIMEOUT = 60.0
+
+
+class WriterLock:
+    """
+    Advisory inter-process lock that serializes groc writers.
+
+    SQLite only allows a single writer at a time; instead of letting
+    parallel `groc add` processes fail with "database is locked",
+    writers take this lock first and queue up behind each other.
+    Readers never take it.
+
+    Threads sharing a WriterLock also queue up: the thread holding it
+    owns the file lock until its outermost release.
+
+    Usage:
+        with WriterLock('~/.groc/groc.lock'):
+            ...write to database...
+    """
+
+    def __init__(self, path, timeout=DEFAULT_LOCK_TIMEOUT, poll_interval=0.05):
+        """
+        Args:
+            path (str): path of the lock file, created if missing.
+            timeout (float): seconds to wait for the lock. None waits forever.
+            poll_interval (float): seconds between attempts to take the lock.
+        """
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd = None
+        # Re-entrant within the owning thread, so nested write methods
+        # don't deadlock; other threads wait on _thread_lock.
+        self._thread_lock = threading.RLock()
+        self._owner = None
+        self._depth = 0
+
+    _timeout_message = ('Timed out waiting for another groc process '
+                        'to finish writing to the database.')
+
+    def _try_lock(self):
+        """ Attempt to take the lock without blocking. """
+        try:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            elif msvcrt:
+                msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(self):
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        elif msvcrt:
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    def acquire(self):
+        """
+        Block until the lock is held.
+
+        Raises:
+            exceptions.DatabaseLockedError: if timeout elapsed first.
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        if not self._thread_lock.acquire(
+                timeout=-1 if deadline is None else self.timeout):
+            raise exceptions.DatabaseLockedError(self._timeout_message)
+        if self._depth:
+            self._depth += 1
+            return
+
+        try:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            while not self._try_lock():
+                if deadline is not None and time.monotonic() >= deadline:
+                    os.close(self._fd)
+                    self._fd = None
+                    raise exceptions.DatabaseLockedError(
+                        self._timeout_message)
+                time.sleep(self.poll_interval)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+        self._owner = threading.get_ident()
+        self._depth = 1
+
+    def release(self):
+        """ Release the lock if held by the calling thread. """
+        if not self._depth or self._owner != threading.get_ident():
+            return
+        self._depth -= 1
+        if not self._depth:
+            self._unlock()
+            os.close(self._fd)
+            self._fd = None
+            self._owner = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
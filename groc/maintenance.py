@@ -0,0 +1,215 @@
+import sqlite3
+import time
+
+from . import db, exceptions
+
+
+""" SQLite specific statements """
+sqlite_object_sizes = """SELECT
+    name,
+    COUNT(*) AS pages,
+    SUM(pgsize) AS size,
+    SUM(CASE WHEN prev IS NOT NULL AND pageno != prev + 1
+        THEN 1 ELSE 0 END) AS out_of_order
+FROM (
+    SELECT
+        name,
+        pageno,
+        pgsize,
+        LAG(pageno) OVER (PARTITION BY name ORDER BY path) AS prev
+    FROM dbstat
+)
+GROUP BY name
+ORDER BY size DESC;"""
+
+sqlite_list_tables = """SELECT name FROM sqlite_master
+WHERE type='table' AND name NOT LIKE 'sqlite_%';"""
+
+# PRAGMA auto_vacuum values
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+# Rows sampled per index by ANALYZE, keeps it fast on large tables.
+DEFAULT_ANALYSIS_LIMIT = 1000
+
+# Pages freed per incremental vacuum step.
+INCREMENTAL_VACUUM_PAGES = 256
+
+
+def _pragma(conn, name):
+    return conn.execute(f'PRAGMA {name};').fetchone()[0]
+
+
+def object_sizes(conn):
+    """
+    Get per table/index page counts, sizes and fragmentation.
+
+    Needs SQLite compiled with the dbstat virtual table.
+
+    Args:
+        conn: SQLite connection object.
+
+    Returns:
+        list: dicts with keys (name, pages, size, out_of_order),
+              or None when dbstat is not available.
+    """
+    try:
+        return [dict(row) for row in conn.execute(sqlite_object_sizes)]
+    except sqlite3.OperationalError:
+        return None
+
+
+def db_stats(conn):
+    """
+    Get size statistics of a database.
+
+    Args:
+        conn: SQLite connection object.
+
+    Returns:
+        dict: page_size, page_count, size (bytes), freelist_count,
+              free_size (bytes), auto_vacuum mode, fragmentation
+              (share of pages not following their predecessor, None if
+              unknown) and objects (see object_sizes).
+    """
+    page_size = _pragma(conn, 'page_size')
+    page_count = _pragma(conn, 'page_count')
+    freelist_count = _pragma(conn, 'freelist_count')
+    objects = object_sizes(conn)
+
+    fragmentation = None
+    if objects:
+        pages = sum(obj['pages'] for obj in objects)
+        out_of_order = sum(obj['out_of_order'] for obj in objects)
+        fragmentation = out_of_order / pages if pages else 0.0
+
+    return {
+        'page_size': page_size,
+        'page_count': page_count,
+        'size': page_size * page_count,
+        'freelist_count': freelist_count,
+        'free_size': page_size * freelist_count,
+        'auto_vacuum': AUTO_VACUUM_MODES.get(_pragma(conn, 'auto_vacuum')),
+        'fragmentation': fragmentation,
+        'objects': objects,
+    }
+
+
+def _maintenance_error(exc):
+    if db.is_lock_error(exc):
+        return exceptions.DatabaseLockedError(db.LOCKED_MESSAGE)
+    return exceptions.DatabaseError(f'Maintenance failed: {exc}')
+
+
+def analyze(conn, time_budget=None, analysis_limit=DEFAULT_ANALYSIS_LIMIT):
+    """
+    Gather query planner statistics table by table.
+
+    Args:
+        conn: SQLite connection object.
+        time_budget (float): seconds after which remaining tables are
+                             skipped. None analyzes every table.
+        analysis_limit (int): rows sampled per index (PRAGMA
+                              analysis_limit), 0 for no limit.
+
+    Returns:
+        list: names of the analyzed tables.
+    """
+    start = time.monotonic()
+    analyzed = []
+    try:
+        conn.execute(f'PRAGMA analysis_limit = {int(analysis_limit):d};')
+        tables = [row[0] for row in conn.execute(sqlite_list_tables)]
+        for table in tables:
+            if time_budget is not None and time.monotonic() - start >= time_budget:
+                break
+            conn.execute(f'ANALYZE "{table}";')
+            analyzed.append(table)
+    except sqlite3.DatabaseError as e:
+        raise _maintenance_error(e)
+    return analyzed
+
+
+def optimize(conn):
+    """
+    Run PRAGMA optimize, refreshing statistics the planner is missing.
+
+    Args:
+        conn: SQLite connection object.
+    """
+    try:
+        conn.execute('PRAGMA optimize;').fetchall()
+    except sqlite3.DatabaseError as e:
+        raise _maintenance_error(e)
+
+
+def enable_incremental_vacuum(conn):
+    """
+    Switch a database to auto_vacuum=INCREMENTAL.
+
+    Changing the mode of an existing database requires a full VACUUM,
+    which rewrites the whole file once.
+
+    Args:
+        conn: SQLite connection object.
+    """
+    try:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL;')
+        conn.execute('VACUUM;')
+    except sqlite3.DatabaseError as e:
+        raise _maintenance_error(e)
+
+
+def incremental_vacuum(conn, time_budget=None,
+                       pages=INCREMENTAL_VACUUM_PAGES):
+    """
+    Reclaim free pages in small steps.
+
+    Does nothing unless the database uses auto_vacuum=INCREMENTAL.
+
+    Args:
+        conn: SQLite connection object.
+        time_budget (float): seconds to spend, None until no free pages.
+        pages (int): pages freed per step, each step is its own transaction.
+
+    Returns:
+        int: number of pages reclaimed.
+    """
+    if _pragma(conn, 'auto_vacuum') != 2:
+        return 0
+
+    start = time.monotonic()
+    reclaimed = 0
+    try:
+        while True:
+            free = _pragma(conn, 'freelist_count')
+            if not free:
+                break
+            if time_budget is not None and time.monotonic() - start >= time_budget:
+                break
+            conn.execute(f'PRAGMA incremental_vacuum({int(pages):d});').fetchall()
+            reclaimed += free - _pragma(conn, 'freelist_count')
+    except sqlite3.DatabaseError as e:
+        raise _maintenance_error(e)
+    return reclaimed
+
+
+def integrity_check(conn, full=False, max_errors=100):
+    """
+    Check the database for corruption.
+
+    Args:
+        conn: SQLite connection object.
+        full (bool): run integrity_check instead of the faster
+                     quick_check (which skips index content checks).
+        max_errors (int): maximum number of problems reported.
+
+    Returns:
+        list: problem descriptions, empty if the database is ok.
+    """
+    pragma = 'integrity_check' if full else 'quick_check'
+    try:
+        rows = conn.execute(f'PRAGMA {pragma}({int(max_errors):d});').fetchall()
+    except sqlite3.DatabaseError as e:
+        raise _maintenance_error(e)
+    messages = [row[0] for row in rows]
+    return [] if messages == ['ok'] else messages
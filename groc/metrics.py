@@ -0,0 +1,314 @@
+import collections
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+
+""" Run metrics
+
+While a Metrics collector is enabled, the db functions count what a
+command does: rows read, inserted, duplicated and rejected by csv
+imports (db.insert_from_csv_dict), bytes of csv read, commits, and the
+latency of every statement run by db.execute_sql, db.query and the
+insert path. The result cache counts its hits and misses.
+
+    collector = metrics.enable(metrics.Metrics('list'))
+    ...
+    metrics.disable()
+    metrics.write_json_lines('groc.jsonl', collector.snapshot(db_url))
+
+Metrics are written after each command, appended to a JSON lines file or
+merged into a Prometheus textfile (node_exporter textfile collector),
+which keeps the last run of every command.
+
+When no collector is enabled (the default), the db functions only check
+the module attribute active.
+"""
+# Statement latency samples kept per statement kind, for percentiles
+LATENCY_SAMPLES = 10000
+
+# Statement kinds, by their first keyword
+STATEMENT_KINDS = ['select', 'insert', 'update', 'delete']
+
+# The enabled Metrics, None when metrics are off
+active = None
+
+# name: (help, snapshot key), Prometheus gauges of the last run. Counts
+# are gauges as well: a run replaces the samples of the previous run of
+# its command, they are not counters and have no _total suffix.
+PROMETHEUS_METRICS = {
+    'groc_run_timestamp_seconds': ('Unix time the command finished.',
+                                   'time'),
+    'groc_run_duration_seconds': ('Duration of the command.', 'duration'),
+    'groc_rows_read': ('Csv rows read.', 'rows_read'),
+    'groc_rows_inserted': ('Purchases inserted from csv rows.',
+                           'rows_inserted'),
+    'groc_rows_duplicate': ('Duplicate csv rows.', 'rows_duplicate'),
+    'groc_rows_rejected': ('Invalid csv rows.', 'rows_rejected'),
+    'groc_bytes_read': ('Bytes of csv files read.', 'bytes_read'),
+    'groc_import_duration_seconds': ('Time spent importing csv files.',
+                                     'import_seconds'),
+    'groc_import_rows_per_second': ('Csv rows imported per second.',
+                                    'rows_per_second'),
+    'groc_commits': ('Transactions committed.', 'commits'),
+    'groc_cache_hits': ('Result cache hits.', 'cache_hits'),
+    'groc_cache_misses': ('Result cache misses.', 'cache_misses'),
+    'groc_cache_hit_ratio': ('Result cache hits per lookup.',
+                             'cache_hit_ratio'),
+    'groc_db_size_bytes': ('Size of the database files.', 'db_size'),
+}
+# name: help, Prometheus summaries of the statements of the last run,
+# by kind: latency QUANTILES, total time (_sum) and count (_count).
+PROMETHEUS_SUMMARIES = {
+    'groc_statement_duration_seconds': 'Statement latency, by kind.',
+}
+QUANTILES = {'p50': '0.5', 'p95': '0.95', 'p99': '0.99'}
+
+prometheus_sample_re = re.compile(
+    r'^(?P<name>\w+)\{command="(?P<command>[^"]*)"[^}]*\} \S+$')
+
+
+def statement_kind(sql):
+    """ select, insert, update, delete or other, by the first keyword. """
+    kind = sql.lstrip().split(None, 1)[0].lower() if sql.strip() else ''
+    return kind if kind in STATEMENT_KINDS else 'other'
+
+
+def percentiles(samples):
+    """ p50/p95/p99 of latency samples, in seconds. """
+    samples = sorted(samples)
+    if not samples:
+        return {name: None for name in QUANTILES}
+
+    def at(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+    return {'p50': at(0.50), 'p95': at(0.95), 'p99': at(0.99)}
+
+
+class Metrics:
+    """ Counters of a groc command run, see module docstring. """
+
+    def __init__(self, command=None):
+        """
+        Args:
+            command (str): name of the command measured.
+        """
+        self.command = command
+        self.counters = collections.Counter()
+        self.import_seconds = 0.0
+        self._statements = {}
+        self._start = time.time()
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        """ Add amount to the counter name. """
+        with self._lock:
+            self.counters[name] += amount
+
+    def on_statement(self, sql):
+        """ Trace callback of connections, counts commits. """
+        if sql.startswith('COMMIT'):
+            self.count('commits')
+
+    def record(self, sql, seconds):
+        """ Record the duration of a statement. """
+        kind = statement_kind(sql)
+        with self._lock:
+            stats = self._statements.get(kind)
+            if stats is None:
+                stats = self._statements[kind] = [
+                    0, 0.0, collections.deque(maxlen=LATENCY_SAMPLES)]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2].append(seconds)
+
+    def timed(self, execute):
+        """
+        Wrap an execute(sql, values) function to record its duration.
+        """
+        def timed_execute(sql, values=()):
+            start = time.perf_counter()
+            try:
+                return execute(sql, values)
+            finally:
+                self.record(sql, time.perf_counter() - start)
+        return timed_execute
+
+    @contextlib.contextmanager
+    def timed_import(self):
+        """ Context manager adding its duration to the import time. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.import_seconds += seconds
+
+    def snapshot(self, db_url=None):
+        """
+        The metrics of the run so far.
+
+        Args:
+            db_url (str): database path, to measure its size.
+
+        Returns:
+            dict: JSON serializable metrics.
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            statements = {
+                kind: dict(count=count, total=total,
+                           **percentiles(samples))
+                for kind, (count, total, samples)
+                in sorted(self._statements.items())}
+            import_seconds = self.import_seconds
+
+        now = time.time()
+        rows_read = counters.get('rows_read', 0)
+        lookups = counters.get('cache_hits', 0) + counters.get(
+            'cache_misses', 0)
+        return {
+            'time': round(now, 3),
+            'command': self.command,
+            'duration': round(now - self._start, 6),
+            'rows_read': rows_read,
+            'rows_inserted': counters.get('rows_inserted', 0),
+            'rows_duplicate': counters.get('rows_duplicate', 0),
+            'rows_rejected': counters.get('rows_rejected', 0),
+            'bytes_read': counters.get('bytes_read', 0),
+            'import_seconds': round(import_seconds, 6),
+            'rows_per_second': (round(rows_read / import_seconds, 1)
+                                if import_seconds else 0),
+            'commits': counters.get('commits', 0),
+            'statements': statements,
+            'cache_hits': counters.get('cache_hits', 0),
+            'cache_misses': counters.get('cache_misses', 0),
+            'cache_hit_ratio': (round(counters.get('cache_hits', 0) /
+                                      lookups, 4) if lookups else 0),
+            'db_size': database_size(db_url),
+        }
+
+
+def database_size(db_url):
+    """
+    Bytes of a database file, its write-ahead log and its partitions,
+    None for an in-memory database.
+    """
+    # Imported here, partitions depends on db which depends on this module
+    from . import db, partitions
+
+    if db_url == db.MEMORY_DB:
+        return None
+    path = os.path.abspath(os.path.expanduser(db_url or db.default_db_path()))
+    partition_dir = db.sidecar_path(path, partitions.PARTITION_DIR)
+    files = [path, path + '-wal']
+    if os.path.isdir(partition_dir):
+        files.extend(os.path.join(partition_dir, name)
+                     for name in os.listdir(partition_dir)
+                     if partitions.partition_file_re.match(name))
+    return sum(os.path.getsize(file) for file in files
+               if os.path.isfile(file))
+
+
+def enable(collector):
+    """ Collect metrics of the connections created from now on. """
+    global active
+    active = collector
+    return collector
+
+
+def disable():
+    """ Stop collecting, returning the collector that was enabled. """
+    global active
+    collector, active = active, None
+    return collector
+
+
+def write_json_lines(path, snapshot):
+    """ Append a snapshot as a line of a JSON lines file. """
+    with open(os.path.expanduser(path), 'a', encoding='utf-8') as file:
+        file.write(json.dumps(snapshot, sort_keys=True) + '\n')
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus_samples(snapshot):
+    """
+    Prometheus samples of a snapshot.
+
+    Returns:
+        dict: metric name -> list of sample lines.
+    """
+    command = f'command="{_label(snapshot["command"])}"'
+    samples = {}
+    for name, (_, key) in PROMETHEUS_METRICS.items():
+        value = snapshot[key]
+        if value is not None:
+            samples[name] = [f'{name}{{{command}}} {value}']
+    for name in PROMETHEUS_SUMMARIES:
+        lines = samples[name] = []
+        for kind, stats in snapshot['statements'].items():
+            labels = f'{command},kind="{kind}"'
+            for p, quantile in QUANTILES.items():
+                lines.append(f'{name}{{{labels},quantile="{quantile}"}} '
+                             f'{stats[p]}')
+            lines.append(f'{name}_sum{{{labels}}} {stats["total"]}')
+            lines.append(f'{name}_count{{{labels}}} {stats["count"]}')
+    return samples
+
+
+def _prometheus_family(name):
+    """ Metric name of a sample name, e.g. of a summary's _sum. """
+    for suffix in ('_sum', '_count'):
+        if (name.endswith(suffix) and
+                name[:-len(suffix)] in PROMETHEUS_SUMMARIES):
+            return name[:-len(suffix)]
+    return name
+
+
+def write_prometheus(path, snapshot):
+    """
+    Merge a snapshot into a Prometheus textfile: the samples of its
+    command are replaced, those of other commands kept. The file is
+    replaced atomically, so the collector never reads a partial file.
+    """
+    path = os.path.expanduser(path)
+    samples = {name: [] for name in list(PROMETHEUS_METRICS) +
+               list(PROMETHEUS_SUMMARIES)}
+    command = str(snapshot['command'])
+    try:
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                match = prometheus_sample_re.match(line.rstrip('\n'))
+                if not match or match.group('command') == _label(command):
+                    continue
+                name = _prometheus_family(match.group('name'))
+                if name in samples:
+                    samples[name].append(line.rstrip('\n'))
+    except FileNotFoundError:
+        pass
+    for name, lines in prometheus_samples(snapshot).items():
+        samples[name].extend(lines)
+
+    lines = []
+    for name, name_samples in samples.items():
+        if not name_samples:
+            continue
+        if name in PROMETHEUS_SUMMARIES:
+            lines.append(f'# HELP {name} {PROMETHEUS_SUMMARIES[name]}')
+            lines.append(f'# TYPE {name} summary')
+        else:
+            lines.append(f'# HELP {name} {PROMETHEUS_METRICS[name][0]}')
+            lines.append(f'# TYPE {name} gauge')
+        lines.extend(sorted(name_samples))
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(lines) + '\n')
+    os.replace(temp_path, path)
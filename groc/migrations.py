@@ -0,0 +1,165 @@
+import sqlite3
+
+from . import db, exceptions
+
+
+""" Schema migrations, keyed on PRAGMA user_version """
+
+
+class Migration:
+    """
+    A single schema change.
+
+    Every migration runs in its own transaction which also bumps
+    PRAGMA user_version to the migration's version, so a migration
+    is either fully applied or not at all.
+
+    SQLite cannot build an index incrementally; index builds are kept
+    in their own migration so the exclusive lock lasts one statement.
+    """
+
+    def __init__(self, version, description, statements=()):
+        """
+        Args:
+            version (int): user_version after this migration.
+            description (str): short summary shown by `groc migrate`.
+            statements (list/tuple): SQL statements run in one transaction.
+        """
+        self.version = version
+        self.description = description
+        self.statements = statements
+
+    def __repr__(self):
+        return f'Migration({self.version}, {self.description!r})'
+
+
+MIGRATIONS = [
+    Migration(1, 'Create store and purchase tables', (
+        db.sqlite_create_store_table,
+        db.sqlite_create_purchase_table,
+        db.sqlite_insert_purchase_trigger,
+    )),
+    Migration(2, 'Add integer purchase year/month columns', (
+        db.sqlite_add_purchase_year_column,
+        db.sqlite_add_purchase_month_column,
+    )),
+    Migration(3, 'Index purchases by year and month', (
+        db.sqlite_create_purchase_year_month_index,
+    )),
+    Migration(4, 'Track a data version for cached reports', (
+        db.sqlite_create_meta_table,
+        db.sqlite_init_meta,
+    ) + tuple(db.sqlite_data_version_trigger.format(event=event)
+              for event in ('INSERT', 'UPDATE', 'DELETE'))),
+    Migration(5, 'Narrow the year/month index to year and month', (
+        db.sqlite_drop_purchase_year_month_index,
+        db.sqlite_create_purchase_year_month_index,
+    )),
+    Migration(6, 'Bump the data version once per write, not per row', tuple(
+        db.sqlite_drop_data_version_trigger.format(event=event)
+        for event in ('INSERT', 'UPDATE', 'DELETE'))),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def get_version(conn):
+    """
+    Get the schema version of a database.
+
+    Args:
+        conn: SQLite connection object.
+
+    Returns:
+        int: value of PRAGMA user_version.
+    """
+    return conn.execute('PRAGMA user_version;').fetchone()[0]
+
+
+def is_initialized(conn):
+    """ Check whether the groc tables exist in the database. """
+    return bool(conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='store';"
+    ).fetchone())
+
+
+def pending_migrations(conn):
+    """
+    Get migrations not yet applied to a database.
+
+    Args:
+        conn: SQLite connection object.
+
+    Returns:
+        list: Migration objects in the order they will be applied.
+
+    Raises:
+        exceptions.DatabaseError: if the database is newer than groc.
+    """
+    version = get_version(conn)
+    if version > LATEST_VERSION:
+        raise exceptions.DatabaseError(
+            f'Database schema version {version} is newer than this '
+            f'version of groc supports ({LATEST_VERSION}). Upgrade groc.')
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+@db.retry_on_lock
+def _run_in_transaction(conn, migration, func):
+    """
+    Run func(conn) inside an immediate transaction, unless another
+    process applied the migration in the meantime.
+
+    Returns:
+        The return value of func, or None if the migration was applied.
+    """
+    try:
+        conn.execute('BEGIN IMMEDIATE;')
+        try:
+            if get_version(conn) >= migration.version:
+                result = None
+            else:
+                result = func(conn)
+            conn.commit()
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+    except sqlite3.DatabaseError as e:
+        if db.is_lock_error(e):
+            raise exceptions.DatabaseLockedError(db.LOCKED_MESSAGE)
+        raise exceptions.DatabaseError(
+            f'Migration {migration.version} failed: {e}')
+
+
+def apply_migration(conn, migration):
+    """
+    Apply a single migration.
+
+    Args:
+        conn: SQLite connection object.
+        migration (Migration): migration to apply.
+    """
+    def finish(c):
+        for stmt in migration.statements:
+            c.execute(stmt)
+        c.execute(f'PRAGMA user_version = {migration.version:d};')
+
+    _run_in_transaction(conn, migration, finish)
+
+
+def migrate(conn):
+    """
+    Bring a database up to the latest schema version.
+
+    Args:
+        conn: SQLite connection object.
+
+    Returns:
+        list: the Migration objects that were applied.
+    """
+    applied = []
+    for migration in pending_migrations(conn):
+        apply_migration(conn, migration)
+        applied.append(migration)
+    return applied
@@ -1,37 +1,442 @@
+import contextlib
+import functools
 import os
 import sqlite3
+import threading
 
-from . import db, exceptions, utils
+from . import (archive, backup, cache, db, exceptions, lock, maintenance,
+               migrations, partitions, records, search, utils)
+
+
+def cancellable(row_inserter, cancelled):
+    """
+    Wrap a row inserter (see db.insert_from_csv_dict) to stop an import
+    once the cancelled event is set.
+
+    Raises:
+        exceptions.ImportCancelled: from the first row after cancelling.
+    """
+    def insert(row, ignore_duplicate):
+        if cancelled.is_set():
+            raise exceptions.ImportCancelled('Import cancelled.')
+        return row_inserter(row, ignore_duplicate)
+    return insert
+
+
+def cached_report(method):
+    """
+    Serve a reporting method from the result cache (see cache.py), if
+    enabled. Results are keyed by database id, method and arguments and
+    only reused while the database keeps the data version they were
+    computed from. Cursors are fetched into cache.CachedCursor objects;
+    results of more than cache.MAX_ROWS rows are returned uncached.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        result_cache = self._get_cache()
+        version = result_cache and self._data_version()
+        if not version:
+            return method(self, *args, **kwargs)
+
+        db_id, data_version = version
+        key = f'{db_id}:{method.__name__}{args!r}{sorted(kwargs.items())!r}'
+        hit, result = result_cache.get(key, data_version)
+        if hit:
+            return result
+
+        # The version is read first: a write landing in between only
+        # stores a result under a version that is already outdated.
+        result = method(self, *args, **kwargs)
+        if isinstance(result, sqlite3.Cursor):
+            complete, result = cache.CachedCursor.from_cursor(result)
+            if not complete:
+                return result
+        result_cache.put(key, data_version, result)
+        return result
+    return wrapper
 
 
 class Groc:
-    def __init__(self):
-        self.groc_dir = os.path.expanduser('~/.groc/')
-        self.db_name = 'groc.db'
+    """
+    Groc database operations.
+
+    Connections are opened lazily, one per thread, so a single instance
+    can be shared by worker threads. Use it as a context manager (or call
+    close()) to release the connections:
+
+        with Groc() as g:
+            g.select_purchase_count()
+
+    In memory mode the database file is loaded into a shared in-memory
+    database on first use, and written back by flush() (or on close if
+    anything was written). Meant for a single process: a flush replaces
+    the database file with the in-memory copy.
+
+        with Groc('~/groc.db', in_memory=True) as g:
+            g.breakdown(['01'], ['2019'])
+
+    Groc(':memory:') uses an in-memory database without a file.
+    """
+
+    def __init__(self, db_url=None, busy_timeout=None, lock_timeout=None,
+                 read_only_reports=False, auto_migrate=True,
+                 include_archive=False, in_memory=False, cache=False,
+                 cache_size=None):
+        """
+        Args:
+            db_url (str): path of the database, ~/.groc/groc.db by default,
+                          ':memory:' for a database without a file.
+            busy_timeout (float): seconds to wait on a locked database.
+            lock_timeout (float): seconds a write waits for other writers.
+            read_only_reports (bool): run reporting methods on separate
+                                      read-only (mode=ro) connections.
+            auto_migrate (bool): apply pending schema migrations on connect.
+            include_archive (bool): include archived purchases in
+                                    list and breakdown reports.
+            in_memory (bool): work on an in-memory copy of the database.
+            cache (bool): serve repeated reports from the result cache.
+            cache_size (int): bytes of cached results kept.
+        """
+        if db_url in (None, db.MEMORY_DB):
+            self.groc_dir = os.path.expanduser('~/.groc/')
+            self.db_name = 'groc.db'
+        else:
+            self.groc_dir, self.db_name = os.path.split(
+                os.path.abspath(os.path.expanduser(db_url)))
         self.db_url = self._get_db_url()
-        # Set instance db connection
-        self.connection = self._get_connection() if self.groc_dir_exists() else None
+        # Lock file, partitions, archive and cache live next to the
+        # database, named after it (see db.sidecar_path)
+        sidecar_base = self.db_url
+
+        # Database file loaded into and flushed from memory, if any
+        self.in_memory = in_memory or db_url == db.MEMORY_DB
+        self.disk_url = None if db_url == db.MEMORY_DB else self.db_url
+        if self.in_memory:
+            self.db_url = db.shared_memory_url(f'groc-{os.getpid()}-{id(self)}')
+        self._loaded = False
+        self._dirty = False
+        self._load_lock = threading.Lock()
+
+        self.partition_dir = db.sidecar_path(sidecar_base,
+                                             partitions.PARTITION_DIR)
+        self.archive_url = archive.archive_path(sidecar_base)
+        self.cache_url = self._get_cache_url(sidecar_base)
+        self.busy_timeout = (db.DEFAULT_BUSY_TIMEOUT if busy_timeout is None
+                             else busy_timeout)
+        self.lock_timeout = (lock.DEFAULT_LOCK_TIMEOUT if lock_timeout is None
+                             else lock_timeout)
+        self.read_only_reports = read_only_reports
+        self.auto_migrate = auto_migrate
+        self.include_archive = include_archive
+        self.cache = cache
+        self.cache_size = cache_size
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        # Per thread, the connection of an open transaction()
+        self._local = threading.local()
+        self._lock = lock.WriterLock(
+            db.sidecar_path(sidecar_base, lock.LOCK_NAME, 'groc.lock'),
+            self.lock_timeout)
+        self._pool = db.ConnectionPool(
+            lambda: self._get_connection())
+        self._read_pool = db.ConnectionPool(
+            lambda: self._get_connection(read_only=True))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def connection(self):
+        """ The calling thread's connection, None if not connected yet. """
+        return self._pool.peek()
+
+    def close(self):
+        """
+        Close all connections opened by this instance.
+        In memory mode, writes are flushed to the database file first.
+        """
+        try:
+            if self._dirty and self.disk_url and len(self._pool):
+                self.flush()
+        finally:
+            self._pool.close()
+            self._read_pool.close()
+            if self._cache is not None:
+                self._cache.close()
 
     def _get_db_url(self):
         """ Create the db_url attribute. """
         return os.path.join(self.groc_dir, self.db_name)
 
-    def _get_connection(self):
+    def _get_cache_url(self, db_path):
+        """
+        Create the cache_url attribute. A method, as the cache argument
+        of __init__ shadows the cache module.
+        """
+        return cache.cache_path(db_path)
+
+    def _get_connection(self, read_only=False):
         """
-        Sets the connection attribute.
+        Create a new database connection.
+
+        Args:
+            read_only (bool): open the connection in read-only mode.
 
         Raises:
             exceptions.DatabaseError: Any error connecting to db
         """
         try:
-            return db.create_connection(self.db_url)
-        except (sqlite3.OperationalError, sqlite3.DatabaseError):
+            conn = db.create_connection(self.db_url, self.busy_timeout,
+                                        read_only=read_only,
+                                        check_same_thread=False,
+                                        migrate=self.auto_migrate)
+        except (sqlite3.OperationalError, sqlite3.DatabaseError) as e:
+            if db.is_lock_error(e):
+                raise exceptions.DatabaseLockedError(db.LOCKED_MESSAGE)
             raise exceptions.DatabaseError('Error connecting to database. Make sure database is initialized.')
 
+        if self.in_memory:
+            with self._load_lock:
+                if not self._loaded:
+                    self._loaded = True
+                    if self.disk_url and os.path.isfile(self.disk_url):
+                        self._load(conn, self.disk_url)
+        return conn
+
+    def _load(self, conn, path):
+        """ Copy a database file into the in-memory database. """
+        try:
+            source = db.create_connection(path, self.busy_timeout,
+                                          read_only=True, migrate=False)
+        except sqlite3.DatabaseError:
+            raise exceptions.DatabaseError(f'Error opening {path}.')
+        try:
+            backup.copy(source, conn)
+        finally:
+            source.close()
+
+        if (self.auto_migrate and migrations.is_initialized(conn) and
+                migrations.pending_migrations(conn)):
+            migrations.migrate(conn)
+            self._dirty = True
+
+    def load(self, path=None):
+        """
+        Replace the in-memory database with a database file.
+        It is loaded automatically when the first connection opens.
+
+        Args:
+            path (str): database file, the db_url passed in by default.
+
+        Raises:
+            exceptions.DatabaseError: if not in memory mode.
+        """
+        if not self.in_memory:
+            raise exceptions.DatabaseError('Groc is not in memory mode.')
+        path = path or self.disk_url
+        self._load(self._writer(), path)
+        self._dirty = path != self.disk_url
+
+    def flush(self, path=None):
+        """
+        Write the in-memory database to a database file.
+
+        Args:
+            path (str): database file, the db_url passed in by default.
+
+        Raises:
+            exceptions.DatabaseError: if not in memory mode.
+        """
+        if not self.in_memory:
+            raise exceptions.DatabaseError('Groc is not in memory mode.')
+        path = path or self.disk_url
+        if path is None:
+            raise exceptions.DatabaseError('No database file to flush to.')
+
+        conn = self._writer()
+        try:
+            target = db.create_connection(path, self.busy_timeout,
+                                          migrate=False)
+        except sqlite3.DatabaseError:
+            raise exceptions.DatabaseError(f'Error opening {path}.')
+        try:
+            with self._writer_lock():
+                backup.copy(conn, target)
+        finally:
+            target.close()
+        if path == self.disk_url:
+            self._dirty = False
+
+    def _get_cache(self):
+        """
+        Result cache of the groc directory, opened on first use.
+        None if caching is off, in memory mode (the copy can diverge
+        from the file without its data version telling) or before the
+        groc directory exists.
+        """
+        if (not self.cache or self.in_memory or self._in_transaction() or
+                not self.groc_dir_exists()):
+            return None
+        with self._cache_lock:
+            if self._cache is None:
+                self._cache = cache.ResultCache(
+                    self.cache_url,
+                    (cache.DEFAULT_MAX_SIZE if self.cache_size is None
+                     else self.cache_size),
+                    self.busy_timeout)
+        return self._cache
+
+    def _data_version(self):
+        """
+        Database id and data version of the data reports read, covering
+        the archive when reports include it. None if it cannot be read.
+        """
+        conn, with_archive = self._archive_reader()
+        try:
+            db_id, data_version = db.select_data_version(conn)
+            if with_archive:
+                archive_id, archive_version = db.select_data_version(
+                    conn, archive.ARCHIVE_SCHEMA)
+                db_id = f'{db_id}+{archive_id}'
+                data_version = f'{data_version}+{archive_version}'
+        except exceptions.DatabaseError:
+            return None
+        if db_id is None:
+            return None
+        return db_id, str(data_version)
+
+    def cache_stats(self):
+        """
+        Get result cache statistics. See cache.ResultCache.stats.
+
+        Returns:
+            dict: hits, misses, entries and size, None if not caching.
+        """
+        result_cache = self._get_cache()
+        return result_cache.stats() if result_cache else None
+
+    def _in_transaction(self):
+        return getattr(self._local, 'transaction', None) is not None
+
+    def _writer(self):
+        """ Connection used for writes, opened on first use. """
+        if self._in_transaction():
+            return self._local.transaction
+        return self._pool.get()
+
+    def _reader(self):
+        """ Connection used by reporting methods. """
+        if (self.read_only_reports and not self.in_memory and
+                not self._in_transaction()):
+            return self._read_pool.get()
+        return self._writer()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context manager running the methods called inside it (on this
+        thread) in a single write transaction, committed at the end or
+        rolled back entirely on an error. Reports inside it see its
+        uncommitted writes and bypass the result cache.
+
+            with g.transaction():
+                g.add_purchase_manual(row, False)
+                g.delete_purchase([1])
+
+        Yields:
+            db.TransactionConnection: the connection of the transaction.
+        """
+        if self._in_transaction():
+            raise exceptions.DatabaseError('A transaction is already open.')
+        conn = self._writer()
+        # The archive cannot be attached inside the transaction
+        self._attach_archive(conn)
+        with self._writer_lock():
+            with db.transaction(conn) as tx:
+                self._local.transaction = tx
+                try:
+                    yield tx
+                finally:
+                    self._local.transaction = None
+
+    def savepoint(self):
+        """
+        Context manager undoing the writes of the methods called inside
+        it if it raises, while the surrounding transaction() goes on.
+
+            with g.transaction():
+                for row in rows:
+                    try:
+                        with g.savepoint():
+                            g.add_purchase_manual(row, False)
+                    except exceptions.DuplicateRow:
+                        pass
+
+        Raises:
+            exceptions.DatabaseError: if no transaction is open.
+        """
+        if not self._in_transaction():
+            raise exceptions.DatabaseError('No transaction is open.')
+        return db.savepoint(self._writer())
+
+    def _attach_archive(self, conn):
+        """
+        Attach the archive database to a connection, if it exists.
+
+        Returns:
+            True if the archive is attached, False otherwise.
+        """
+        if not self.has_archive():
+            return False
+        archive.attach(conn, self.archive_url)
+        return True
+
+    def _archive_reader(self):
+        """
+        Reader connection, and whether reports include the archive.
+        """
+        conn = self._reader()
+        return conn, self.include_archive and self._attach_archive(conn)
+
+    def read_snapshot(self):
+        """
+        Context manager running the reporting methods called inside it
+        in one consistent read transaction, without commits.
+
+            with g.read_snapshot():
+                count = g.select_purchase_count()
+                rows = g.list_purchases_limit(10).fetchall()
+
+        Yields:
+            the SQLite connection the reporting methods read from.
+        """
+        # The archive can only be attached outside a transaction
+        conn, _ = self._archive_reader()
+        return db.read_snapshot(conn)
+
+    def _writer_lock(self):
+        """
+        Advisory lock held while writing, so concurrent groc
+        processes queue up instead of failing on a locked database.
+        No-op until the groc directory exists.
+        In memory mode, marks the database for flushing on close.
+        """
+        if self.in_memory:
+            self._dirty = True
+            if not self.disk_url:
+                return contextlib.nullcontext()
+        if not self.groc_dir_exists():
+            return contextlib.nullcontext()
+        return self._lock
+
     def _create_and_setup_db(self):
         """ Create database and tables. """
-        self.connection = self.connection or self._get_connection()
-        db.setup_db(self.connection)
+        conn = self._writer()
+        with self._writer_lock():
+            db.setup_db(conn)
 
     def groc_dir_exists(self):
         """
@@ -42,32 +447,222 @@ class Groc:
         """
         return os.path.exists(self.groc_dir)
 
-    def init_groc(self):
+    def is_partitioned(self):
+        """
+        Check if purchases are stored in yearly partitions
+        (see PartitionedGroc).
+
+        Returns:
+            True if the partition directory exists, False otherwise.
+        """
+        return not self.in_memory and os.path.isdir(self.partition_dir)
+
+    def init_groc(self, partitioned=False):
         """
         Initializes .groc directory and creates the database.
 
         Creates the groc directory if it doesn't exist.
         Raises an exception if the db exists. If not, creates the db.
 
+        Args:
+            partitioned (bool): store purchases in yearly partitions.
+
         Raises:
             exceptions.DatabaseError: If database exists.
         """
+        if partitioned and self.in_memory:
+            raise exceptions.DatabaseError(
+                'Partitioned databases cannot be used in memory mode.')
 
-        # If ~/.groc exists and is a directory
-        if not os.path.isdir(self.groc_dir):
-            os.mkdir(self.groc_dir)
+        # Without a database file there is nothing to check
+        if self.disk_url:
+            # If ~/.groc exists and is a directory
+            if not os.path.isdir(self.groc_dir):
+                os.mkdir(self.groc_dir)
 
-        # Check ~/.groc/groc.db exists
-        if os.path.isfile(self.db_url):
-            raise exceptions.DatabaseError('Database already exists!')
+            # Check ~/.groc/groc.db exists
+            if os.path.isfile(self.disk_url):
+                raise exceptions.DatabaseError('Database already exists!')
 
         # Create groc.db here
         self._create_and_setup_db()
 
+        if partitioned and not os.path.isdir(self.partition_dir):
+            os.mkdir(self.partition_dir)
+
+    def has_archive(self):
+        """
+        Check if old purchases were moved to the archive database.
+
+        Returns:
+            True if the archive database exists, False otherwise.
+        """
+        return os.path.exists(self.archive_url)
+
+    def count_archivable(self, before):
+        """
+        Count purchases older than a cutoff date.
+
+        Args:
+            before (datetime.date): cutoff date.
+
+        Returns:
+            int: number of purchases made before the cutoff.
+        """
+        return archive.count_archivable(self._reader(), before)
+
+    def archive(self, before, chunk_size=archive.DEFAULT_CHUNK_SIZE,
+                progress=None):
+        """
+        Move purchases older than a cutoff date to the archive database.
+        See archive.archive_before.
+
+        Args:
+            before (datetime.date): cutoff date.
+            chunk_size (int): purchases moved per transaction.
+            progress (callable): called as progress(moved) after each chunk.
+
+        Returns:
+            int: number of purchases moved.
+        """
+        conn = self._writer()
+        with self._writer_lock():
+            return archive.archive_before(conn, self.archive_url, before,
+                                          chunk_size, progress)
+
+    def schema_version(self):
+        """
+        Get the current and latest schema versions.
+
+        Returns:
+            tuple: (current version, latest version).
+        """
+        return (migrations.get_version(self._writer()),
+                migrations.LATEST_VERSION)
+
+    def pending_migrations(self):
+        """
+        Get migrations not yet applied to the database.
+
+        Returns:
+            list: migrations.Migration objects.
+        """
+        return migrations.pending_migrations(self._writer())
+
+    def migrate(self):
+        """
+        Apply pending schema migrations.
+
+        Returns:
+            list: the migrations.Migration objects applied.
+        """
+        conn = self._writer()
+        with self._writer_lock():
+            return migrations.migrate(conn)
+
+    def db_stats(self):
+        """
+        Get database size, free pages, fragmentation and
+        per table/index sizes. See maintenance.db_stats.
+
+        Returns:
+            dict: database statistics.
+        """
+        return maintenance.db_stats(self._reader())
+
+    def analyze(self, time_budget=None):
+        """
+        Gather query planner statistics.
+
+        Args:
+            time_budget (float): seconds to spend, None for no limit.
+
+        Returns:
+            list: names of the analyzed tables.
+        """
+        conn = self._writer()
+        with self._writer_lock():
+            analyzed = maintenance.analyze(conn, time_budget)
+            maintenance.optimize(conn)
+        return analyzed
+
+    def vacuum(self, time_budget=None, full=False):
+        """
+        Reclaim free pages.
+
+        Without the full flag, free pages are reclaimed in small steps
+        (only for auto_vacuum=INCREMENTAL databases). A full vacuum
+        rebuilds the file and switches it to incremental auto vacuum.
+
+        Args:
+            time_budget (float): seconds to spend on incremental steps.
+            full (bool): rebuild the whole database file.
+
+        Returns:
+            int: pages reclaimed by incremental steps.
+        """
+        conn = self._writer()
+        with self._writer_lock():
+            if full:
+                maintenance.enable_incremental_vacuum(conn)
+                return 0
+            return maintenance.incremental_vacuum(conn, time_budget)
+
+    def integrity_check(self, full=False):
+        """
+        Check the database for corruption.
+
+        Args:
+            full (bool): run the slower, complete integrity check.
+
+        Returns:
+            list: problem descriptions, empty if the database is ok.
+        """
+        return maintenance.integrity_check(self._reader(), full)
+
+    def backup_db(self, dest, pages=backup.DEFAULT_PAGES,
+                  sleep=backup.DEFAULT_STEP_SLEEP, compress=None,
+                  overwrite=False, progress=None):
+        """
+        Back up the database while it stays in use. See backup.backup.
+
+        Args:
+            dest (str): path of the backup file.
+            pages (int): pages copied per step.
+            sleep (float): seconds slept between steps.
+            compress (bool): gzip the backup, None to decide by a .gz suffix.
+            overwrite (bool): replace an existing file at dest.
+            progress (callable): called as progress(copied, total).
+
+        Returns:
+            dict: pages, size, seconds and pages_per_second.
+        """
+        return backup.backup(self._reader(), dest, pages, sleep, compress,
+                             overwrite, progress)
+
+    def restore_db(self, src, pages=backup.DEFAULT_PAGES,
+                   sleep=backup.DEFAULT_STEP_SLEEP, progress=None):
+        """
+        Replace the database with a backup. See backup.restore.
+
+        Args:
+            src (str): path of the backup file.
+            pages (int): pages copied per step.
+            sleep (float): seconds slept between steps.
+            progress (callable): called as progress(copied, total).
+
+        Returns:
+            dict: pages, size, seconds and pages_per_second.
+        """
+        conn = self._writer()
+        with self._writer_lock():
+            return backup.restore(conn, src, pages, sleep, progress)
+
     def clear_db(self):
         """ Delete all data from tables. """
-        self.connection = self.connection or self._get_connection()
-        db.clear_db(self.connection)
+        conn = self._writer()
+        with self._writer_lock():
+            db.clear_db(conn)
 
     def select_by_id(self, ids):
         """
@@ -79,8 +674,7 @@ class Groc:
         Returns:
             A SQLite cursor object.
         """
-        self.connection = self.connection or self._get_connection()
-        return db.select_by_id(self.connection, ids)
+        return db.select_by_id(self._reader(), ids)
 
     def select_purchase_ids(self, ids):
         """
@@ -93,9 +687,9 @@ class Groc:
         Returns:
             A SQLite cursor object.
         """
-        self.connection = self.connection or self._get_connection()
-        return db.select_purchase_ids(self.connection, ids)
+        return db.select_purchase_ids(self._reader(), ids)
 
+    @cached_report
     def breakdown(self, month, year):
         """
         Get purchase stats grouped by month and year.
@@ -111,10 +705,33 @@ class Groc:
         Returns:
             A SQLite cursor object.
         """
-        self.connection = self.connection or self._get_connection()
-        return db.select_count_total_per_month(
-            self.connection, month, year)
+        conn, with_archive = self._archive_reader()
+        if with_archive:
+            return archive.select_count_total_per_month(conn, month, year)
+        return db.select_count_total_per_month(conn, month, year)
 
+    def analytics(self, use_numpy=None):
+        """
+        Load all purchases into columns for fast repeated grouping.
+        See analytics.PurchaseColumns.
+
+        Args:
+            use_numpy (bool): group with NumPy, None to use it if installed.
+
+        Returns:
+            analytics.PurchaseColumns: the loaded purchases.
+        """
+        # Imported on first use, NumPy is slow to import
+        from . import analytics
+        conn, with_archive = self._archive_reader()
+        columns = analytics.PurchaseColumns(use_numpy)
+        with db.read_snapshot(conn):
+            columns.load(conn)
+            if with_archive:
+                columns.load(conn, archive.ARCHIVE_SCHEMA)
+        return columns
+
+    @cached_report
     def select_purchase_count(self):
         """
         Get total number of purchases.
@@ -122,8 +739,10 @@ class Groc:
         Returns:
             int: total number of purchases.
         """
-        self.connection = self.connection or self._get_connection()
-        cur = db.select_purchase_count(self.connection)
+        conn, with_archive = self._archive_reader()
+        if with_archive:
+            return archive.select_purchase_count(conn)
+        cur = db.select_purchase_count(conn)
         # indexing with SQLite Row
         return cur.fetchone()['purchase_count']
 
@@ -134,9 +753,11 @@ class Groc:
         Args:
             ids (list/tuple): purchase ids.
         """
-        self.connection = self.connection or self._get_connection()
-        db.delete_from_db(self.connection, ids)
+        conn = self._writer()
+        with self._writer_lock():
+            db.delete_from_db(conn, ids)
 
+    @cached_report
     def list_purchases_date(self, month, year):
         """
         Get all purchases for a month/year.
@@ -148,9 +769,12 @@ class Groc:
         Returns:
             A SQLite cursor object.
         """
-        self.connection = self.connection or self._get_connection()
-        return db.get_purchases_date(self.connection, month, year)
+        conn, with_archive = self._archive_reader()
+        if with_archive:
+            return archive.get_purchases_date(conn, month, year)
+        return db.get_purchases_date(conn, month, year)
 
+    @cached_report
     def list_purchases_limit(self, limit=50):
         """
         Get latest purchases limited by limit amount.
@@ -161,9 +785,12 @@ class Groc:
         Returns:
             A SQLite cursor object.
         """
-        self.connection = self.connection or self._get_connection()
-        return db.get_purchases_limit(self.connection, limit)
+        conn, with_archive = self._archive_reader()
+        if with_archive:
+            return archive.get_purchases_limit(conn, limit)
+        return db.get_purchases_limit(conn, limit)
 
+    @cached_report
     def list_purchases_date_limit(self, month, year, limit=50):
         """
         Get purchases for a month/year limited by limit amount.
@@ -176,8 +803,114 @@ class Groc:
         Returns:
             A SQLite cursor object.
         """
-        self.connection = self.connection or self._get_connection()
-        return db.get_purchases_date_limit(self.connection, month, year, limit)
+        conn, with_archive = self._archive_reader()
+        if with_archive:
+            return archive.get_purchases_date_limit(conn, month, year, limit)
+        return db.get_purchases_date_limit(conn, month, year, limit)
+
+    def iter_purchases(self, month=None, year=None, limit=-1,
+                       batch_size=records.DEFAULT_BATCH_SIZE):
+        """
+        Iterate over purchases as records, newest first.
+        Unlike the list methods, totals are integer cents and dates are
+        datetime.date objects, see records.Purchase.
+
+        Args:
+            month (str): Two digit month, None for all purchases.
+            year (str): Four digit year, with month.
+            limit (int): most purchases returned, negative for no limit.
+            batch_size (int): rows fetched from the database at a time.
+
+        Returns:
+            iterator: records.Purchase records.
+        """
+        conn, with_archive = self._archive_reader()
+        schemas = archive.SCHEMAS if with_archive else ['main']
+        return records.select_purchases(conn, schemas, month, year, limit,
+                                        batch_size)
+
+    def build_search_index(self, chunk_size=search.DEFAULT_CHUNK_SIZE,
+                           progress=None):
+        """
+        Create the full-text search index, or resume building it.
+        See search.build_index.
+
+        Args:
+            chunk_size (int): purchases indexed per transaction.
+            progress (callable): called as progress(indexed) after each chunk.
+
+        Returns:
+            int: number of purchases indexed.
+        """
+        conn = self._writer()
+        with self._writer_lock():
+            return search.build_index(conn, chunk_size, progress)
+
+    def drop_search_index(self):
+        """ Remove the full-text search index. """
+        conn = self._writer()
+        with self._writer_lock():
+            search.drop_index(conn)
+
+    def search_index_status(self):
+        """
+        Get the state of the search index. See search.index_status.
+
+        Returns:
+            dict: pending purchases, None if there is no index.
+        """
+        return search.index_status(self._reader())
+
+    def search(self, text, since=None, until=None, limit=-1, order='rank',
+               raw=False):
+        """
+        Search purchases by store name and description.
+        See search.search_purchases.
+
+        Args:
+            text (str): words to search for.
+            since (str): first purchase date (YYYY-MM-DD), optional.
+            until (str): last purchase date (YYYY-MM-DD), optional.
+            limit (int): most purchases returned, negative for no limit.
+            order (str): 'rank' (best match first) or 'newest'.
+            raw (bool): text is an FTS5 query.
+
+        Returns:
+            cursor: SQLite cursor object.
+        """
+        return search.search_purchases(self._reader(), text, since, until,
+                                       limit, order, raw)
+
+    def add_purchases(self, purchases, ignore_duplicate):
+        """
+        Add purchase records, each in its own transaction.
+        Records hold final values and are not cleaned like the rows
+        of add_purchase_manual.
+
+        Args:
+            purchases (iterable): records.Purchase records, ids are ignored.
+            ignore_duplicate (bool): Flag to ignore exceptions thrown
+                                     for duplicate purchases.
+
+        Returns:
+            int: count of how many purchases added.
+
+        Raises:
+            exceptions.DuplicateRow: if purchase is duplicate.
+            exceptions.DatabaseInsertError: if data invalid.
+        """
+        conn = self._writer()
+        check_archive = self._attach_archive(conn)
+        count = 0
+        with self._writer_lock():
+            try:
+                for purchase in purchases:
+                    if db.insert_row(conn, purchase, ignore_duplicate,
+                                     check_archive, bump_version=False):
+                        count += 1
+            finally:
+                db.commit_data_version(conn)
+        return count
 
     def add_purchase_manual(self, row, ignore_duplicate):
         """
@@ -197,11 +930,14 @@ class Groc:
             exceptions.DuplicateRow: if purchase is duplicate.
             exceptions.DatabaseInsertError: if data invalid.
         """
-        self.connection = self.connection or self._get_connection()
-        return db.validate_insert_row(self.connection,
-                                      row, ignore_duplicate)
+        conn = self._writer()
+        check_archive = self._attach_archive(conn)
+        with self._writer_lock():
+            return db.validate_insert_row(conn, row, ignore_duplicate,
+                                          check_archive)
 
-    def add_purchase_path(self, path, ignore_duplicate):
+    def add_purchase_path(self, path, ignore_duplicate, cancelled=None,
+                          progress=None):
         """
         Add a purchase via file or directory.
         If path is directory, compile all csv files in a list.
@@ -211,6 +947,12 @@ class Groc:
             path (str): A path to file or directory.
             ignore_duplicate (bool): Flag to ignore exceptions thrown
                                      for duplicate purchases.
+            cancelled (threading.Event): optional, stops the import
+                                         when set from another thread.
+            progress (callable): optional, called as
+                                 progress(rows, bytes_read, total_bytes,
+                                 finished),
+                                 see db.insert_from_csv_dict.
 
         Returns:
             int: count of how many purchases added.
@@ -219,6 +961,7 @@ class Groc:
             Exception: if path could not be found.
             exceptions.DuplicateRow: if purchase is duplicate.
             exceptions.DatabaseInsertError: if data invalid.
+            exceptions.ImportCancelled: if cancelled was set.
         """
         path = os.path.abspath(os.path.expanduser(path))
 
@@ -231,6 +974,334 @@ class Groc:
         else:
             raise Exception(f'{path} could not be found!')
 
-        self.connection = self.connection or self._get_connection()
-        return db.insert_from_csv_dict(self.connection,
-                                       csv_files, ignore_duplicate)
+        return self._insert_csv_files(csv_files, ignore_duplicate, cancelled,
+                                      progress)
+
+    def _insert_csv_files(self, csv_files, ignore_duplicate, cancelled=None,
+                          progress=None):
+        """ Insert purchases of csv files, see add_purchase_path. """
+        conn = self._writer()
+        check_archive = self._attach_archive(conn)
+        if not check_archive and cancelled is None and progress is None:
+            with self._writer_lock():
+                return db.insert_from_csv_dict(conn, csv_files,
+                                               ignore_duplicate)
+
+        row_inserter = functools.partial(db.validate_insert_row, conn,
+                                         check_archive=check_archive,
+                                         bump_version=False)
+        if cancelled is not None:
+            row_inserter = cancellable(row_inserter, cancelled)
+        with self._writer_lock():
+            return db.insert_from_csv_dict(conn, csv_files, ignore_duplicate,
+                                           row_inserter=row_inserter,
+                                           progress=progress)
+
+
+class PartitionedGroc(Groc):
+    """
+    Groc storing purchases in one database file per year.
+
+    Reporting methods attach only the partitions their month/year
+    filters need (see the partitions module), imports route every
+    purchase to the partition of its year. The main database keeps
+    the schema version and holds no purchases.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._partition_pools = {}
+        self._partition_pools_lock = threading.Lock()
+
+    def close(self):
+        """ Close all connections opened by this instance. """
+        super().close()
+        with self._partition_pools_lock:
+            pools = list(self._partition_pools.values())
+            self._partition_pools.clear()
+        for pool in pools:
+            pool.close()
+
+    def read_snapshot(self):
+        """
+        Partitions cannot be attached inside a transaction, so reads are
+        consistent per partition rather than across the whole command.
+        """
+        return contextlib.nullcontext(self._reader())
+
+    def _get_cache(self):
+        """ Not cached, the main database has no data version to check. """
+        return None
+
+    def transaction(self):
+        """ Not supported, partitions are separate database files. """
+        raise exceptions.DatabaseError(
+            'Transactions across partitioned databases are not supported.')
+
+    def _get_partition_connection(self, year):
+        """ Open (and set up, if new) the partition of a year. """
+        path = partitions.partition_path(self.partition_dir, year)
+        is_new = not os.path.isfile(path)
+        try:
+            conn = db.create_connection(path, self.busy_timeout,
+                                        check_same_thread=False)
+        except (sqlite3.OperationalError, sqlite3.DatabaseError):
+            raise exceptions.DatabaseError(
+                f'Error connecting to partition {path}.')
+        if is_new:
+            partitions.setup_partition(conn, year)
+        return conn
+
+    def _partition_writer(self, year):
+        """ Writer connection to the partition of a year. """
+        year = int(year)
+        with self._partition_pools_lock:
+            pool = self._partition_pools.get(year)
+            if pool is None:
+                pool = db.ConnectionPool(
+                    lambda: self._get_partition_connection(year))
+                self._partition_pools[year] = pool
+        return pool.get()
+
+    def _attach(self, years):
+        """ Attach partitions of years to the reader, 'main' if none. """
+        conn = self._reader()
+        schemas = partitions.attach(conn, self.partition_dir, years)
+        return conn, schemas or ['main']
+
+    def _ids_by_year(self, ids):
+        years = {}
+        for purchase_id in ids:
+            years.setdefault(partitions.year_of_id(purchase_id), []).append(
+                purchase_id)
+        return years
+
+    def clear_db(self):
+        """ Delete all data from every partition. """
+        with self._writer_lock():
+            for year in partitions.partition_years(self.partition_dir):
+                db.clear_db(self._partition_writer(year))
+
+    def select_by_id(self, ids):
+        """ See Groc.select_by_id. """
+        by_year = self._ids_by_year(ids)
+        conn, schemas = self._attach(by_year)
+        values = [i for year in by_year for i in by_year[year]
+                  if partitions.schema_name(year) in schemas]
+        where = ' WHERE p.id IN (%s)' % ','.join('?' * len(values))
+        sql = partitions.union_sql(partitions.sqlite_partition_purchases,
+                                   schemas, where if values else ' WHERE 0')
+        return db.query(conn, sql, values * len(schemas))
+
+    def select_purchase_ids(self, ids):
+        """ See Groc.select_purchase_ids. """
+        by_year = self._ids_by_year(ids)
+        conn, schemas = self._attach(by_year)
+        values = [i for year in by_year for i in by_year[year]
+                  if partitions.schema_name(year) in schemas]
+        where = ' WHERE id IN (%s)' % ','.join('?' * len(values))
+        sql = partitions.union_sql(partitions.sqlite_partition_purchase_ids,
+                                   schemas, where if values else ' WHERE 0')
+        return db.query(conn, sql, values * len(schemas))
+
+    def breakdown(self, month, year):
+        """ See Groc.breakdown. Only partitions of the years are read. """
+        conn, schemas = self._attach(year)
+        sql = partitions.union_sql(
+            partitions.sqlite_partition_count_and_total_per_month, schemas,
+            suffix='\nORDER BY year DESC, num_month DESC;')
+        sql = db.multiple_parameter_substitution(
+            sql, [len(month)] * len(schemas))
+        return db.query(conn, sql, [int(m) for m in month] * len(schemas))
+
+    def select_purchase_count(self):
+        """ See Groc.select_purchase_count. """
+        years = partitions.partition_years(self.partition_dir)
+        count = 0
+        # Count in batches, all partitions may not fit the attach limit
+        for i in range(0, len(years), partitions.MAX_ATTACHED):
+            conn, schemas = self._attach(years[i:i + partitions.MAX_ATTACHED])
+            sql = partitions.union_sql(partitions.sqlite_partition_count,
+                                       schemas)
+            count += sum(row['purchase_count'] for row in db.query(conn, sql))
+        return count
+
+    def analytics(self, use_numpy=None):
+        """ See Groc.analytics. Partitions are loaded in batches. """
+        from . import analytics
+        years = partitions.partition_years(self.partition_dir)
+        columns = analytics.PurchaseColumns(use_numpy)
+        for i in range(0, len(years), partitions.MAX_ATTACHED):
+            conn, schemas = self._attach(years[i:i + partitions.MAX_ATTACHED])
+            for schema in schemas:
+                columns.load(conn, schema)
+        return columns
+
+    def delete_purchase(self, ids):
+        """ See Groc.delete_purchase. """
+        with self._writer_lock():
+            for year, year_ids in self._ids_by_year(ids).items():
+                if year in partitions.partition_years(self.partition_dir):
+                    db.delete_from_db(self._partition_writer(year), year_ids)
+
+    def list_purchases_date(self, month, year):
+        """ See Groc.list_purchases_date. Only one partition is read. """
+        conn, schemas = self._attach([year])
+        sql = partitions.union_sql(
+            partitions.sqlite_partition_purchases, schemas,
+            ' WHERE p.purchase_month = ? AND p.purchase_year = ?',
+            '\nORDER BY date DESC;')
+        return db.query(conn, sql, (int(month), int(year)) * len(schemas))
+
+    def list_purchases_limit(self, limit=50):
+        """
+        See Groc.list_purchases_limit. Reads the newest partitions
+        until they hold enough purchases. More partitions than fit the
+        attach limit are read in batches, newest first, and the rows of
+        all batches are returned as a cache.CachedCursor.
+        """
+        conn = self._reader()
+        needed = []
+        found = 0
+        for year in partitions.partition_years(self.partition_dir):
+            needed.append(year)
+            schemas = partitions.attach(conn, self.partition_dir, [year])
+            sql = partitions.union_sql(partitions.sqlite_partition_count,
+                                       schemas)
+            found += db.query(conn, sql).fetchone()['purchase_count']
+            # A negative limit (no limit, as in SQLite) reads every partition
+            if 0 <= limit <= found:
+                break
+
+        sql_suffix = '\nORDER BY date DESC\nLIMIT ?;'
+        if len(needed) <= partitions.MAX_ATTACHED:
+            conn, schemas = self._attach(needed)
+            sql = partitions.union_sql(partitions.sqlite_partition_purchases,
+                                       schemas, suffix=sql_suffix)
+            return db.query(conn, sql, (limit,))
+
+        # Partitions hold whole years, so the batches of newer years
+        # come first in date order. Every batch is fetched before the
+        # next one is attached.
+        rows = []
+        for i in range(0, len(needed), partitions.MAX_ATTACHED):
+            conn, schemas = self._attach(needed[i:i + partitions.MAX_ATTACHED])
+            sql = partitions.union_sql(partitions.sqlite_partition_purchases,
+                                       schemas, suffix=sql_suffix)
+            cursor = db.query(conn, sql,
+                              (limit - len(rows) if limit >= 0 else -1,))
+            rows.extend(cursor.fetchall())
+            if 0 <= limit <= len(rows):
+                break
+        return cache.CachedCursor(cursor.description, rows)
+
+    def list_purchases_date_limit(self, month, year, limit=50):
+        """ See Groc.list_purchases_date_limit. Only one partition is read. """
+        conn, schemas = self._attach([year])
+        sql = partitions.union_sql(
+            partitions.sqlite_partition_purchases, schemas,
+            ' WHERE p.purchase_month = ? AND p.purchase_year = ?',
+            '\nORDER BY date DESC\nLIMIT ?;')
+        return db.query(conn, sql,
+                        (int(month), int(year)) * len(schemas) + (limit,))
+
+    def has_archive(self):
+        """ Partitions already keep old years apart, there is no archive. """
+        return False
+
+    def archive(self, before, chunk_size=archive.DEFAULT_CHUNK_SIZE,
+                progress=None):
+        """ Not supported, see has_archive. """
+        raise exceptions.DatabaseError(
+            'Partitioned databases keep every year in its own file '
+            'already, archiving is not supported.')
+
+    def build_search_index(self, *args, **kwargs):
+        """ Not supported, partitions are separate database files. """
+        raise exceptions.DatabaseError(
+            'Search is not supported on partitioned databases.')
+
+    def drop_search_index(self):
+        """ Not supported, see build_search_index. """
+        raise exceptions.DatabaseError(
+            'Search is not supported on partitioned databases.')
+
+    def search_index_status(self):
+        """ No search index, see build_search_index. """
+        return None
+
+    def search(self, *args, **kwargs):
+        """ Not supported, see build_search_index. """
+        raise exceptions.DatabaseError(
+            'Search is not supported on partitioned databases.')
+
+    def backup_db(self, dest, *args, **kwargs):
+        """ Not supported, partitions are separate database files. """
+        raise exceptions.DatabaseError(
+            'Backing up partitioned databases is not supported, '
+            'back up the groc directory instead.')
+
+    def restore_db(self, src, *args, **kwargs):
+        """ Not supported, partitions are separate database files. """
+        raise exceptions.DatabaseError(
+            'Restoring partitioned databases is not supported, '
+            'restore the groc directory instead.')
+
+    def _insert_partitioned(self, row, ignore_duplicate):
+        """ Validate a raw row and insert it into its year's partition. """
+        row = utils.validate_row(row)
+        conn = self._partition_writer(row['date'].year)
+        # Partitioned databases are not cached, see _get_cache
+        return db.insert_row(conn, row, ignore_duplicate, bump_version=False)
+
+    def add_purchase_manual(self, row, ignore_duplicate):
+        """ See Groc.add_purchase_manual. """
+        with self._writer_lock():
+            return self._insert_partitioned(row, ignore_duplicate)
+
+    def iter_purchases(self, month=None, year=None, limit=-1,
+                       batch_size=records.DEFAULT_BATCH_SIZE):
+        """
+        See Groc.iter_purchases. A month reads one partition, otherwise
+        partitions are read one at a time, newest first.
+        """
+        if month:
+            conn, schemas = self._attach([year])
+            return records.select_purchases(conn, schemas, month, year,
+                                            limit, batch_size)
+        return self._iter_partition_purchases(limit, batch_size)
+
+    def _iter_partition_purchases(self, limit, batch_size):
+        count = 0
+        for year in partitions.partition_years(self.partition_dir):
+            if 0 <= limit <= count:
+                return
+            conn, schemas = self._attach([year])
+            remaining = limit - count if limit >= 0 else -1
+            # Read to the end before the next partition is attached
+            for purchase in records.select_purchases(
+                    conn, schemas, limit=remaining, batch_size=batch_size):
+                count += 1
+                yield purchase
+
+    def add_purchases(self, purchases, ignore_duplicate):
+        """ See Groc.add_purchases. """
+        count = 0
+        with self._writer_lock():
+            for purchase in purchases:
+                conn = self._partition_writer(purchase.date.year)
+                if db.insert_row(conn, purchase, ignore_duplicate,
+                                 bump_version=False):
+                    count += 1
+        return count
+
+    def _insert_csv_files(self, csv_files, ignore_duplicate, cancelled=None,
+                          progress=None):
+        """ Insert purchases of csv files into their partitions. """
+        row_inserter = self._insert_partitioned
+        if cancelled is not None:
+            row_inserter = cancellable(row_inserter, cancelled)
+        with self._writer_lock():
+            return db.insert_from_csv_dict(
+                None, csv_files, ignore_duplicate,
+                row_inserter=row_inserter, progress=progress)
@@ -0,0 +1,181 @@
+import os
+import re
+import sqlite3
+
+from . import db, exceptions
+
+
+""" Year-partitioned storage
+
+Purchases of every year live in their own database file
+(partitions/purchases_<year>.db) with the full groc schema. Partitions
+are ATTACHed to the main connection as schema p<year> when a query needs
+them, so a query touching the current year never opens the others.
+
+Purchase ids are unique across partitions: the AUTOINCREMENT sequence of
+each partition starts at year * PARTITION_ID_SPAN, so the partition of
+an id is id // PARTITION_ID_SPAN.
+"""
+PARTITION_DIR = 'partitions'
+PARTITION_ID_SPAN = 10 ** 8
+
+# SQLite attaches at most 10 databases by default (SQLITE_MAX_ATTACHED).
+MAX_ATTACHED = 10
+
+partition_file_re = re.compile(r'^purchases_(\d{4})\.db$')
+partition_schema_re = re.compile(r'^p(\d{4})$')
+
+
+""" SQLite specific statements, formatted per partition with {schema} """
+sqlite_partition_purchases = """SELECT
+    p.id,
+    p.purchase_date AS date,
+    p.total AS "total [total_money]",
+    s.name AS store,
+    COALESCE(p.description, '--') description
+FROM {schema}.purchase p
+INNER JOIN {schema}.store s ON p.store_id = s.id"""
+
+sqlite_partition_purchase_ids = """SELECT
+    id
+FROM {schema}.purchase"""
+
+sqlite_partition_count = """SELECT
+    COUNT(*) AS purchase_count
+FROM {schema}.purchase"""
+
+sqlite_partition_count_and_total_per_month = """SELECT
+    printf('%%02d', p.purchase_month) AS num_month,
+    CAST(p.purchase_year AS TEXT) AS year,
+    printf('%%04d-%%02d-01', p.purchase_year, p.purchase_month)
+        AS "month [purchase_month_abbreviated]",
+    SUM(p.total) as "total [total_money]",
+    COUNT(*) AS "purchase count",
+    MIN(p.total) as "min purchase [total_money]",
+    MAX(p.total) as "max purchase [total_money]",
+    round(avg(p.total)) as "avg purchase [total_money]",
+    COUNT(DISTINCT p.store_id) as "store count"
+FROM {schema}.purchase p
+WHERE p.purchase_month IN (%s)
+GROUP BY
+    p.purchase_year,
+    p.purchase_month"""
+
+sqlite_seed_purchase_id = """INSERT INTO sqlite_sequence (name, seq)
+SELECT 'purchase', ?
+WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'purchase');"""
+
+
+def partition_path(partition_dir, year):
+    """ Path of the database file holding purchases of a year. """
+    return os.path.join(partition_dir, f'purchases_{int(year):04d}.db')
+
+
+def schema_name(year):
+    """ Schema name a partition is attached as. """
+    return f'p{int(year):04d}'
+
+
+def partition_years(partition_dir):
+    """
+    List the years that have a partition.
+
+    Args:
+        partition_dir (str): directory of the partition files.
+
+    Returns:
+        list: years (int), newest first.
+    """
+    if not os.path.isdir(partition_dir):
+        return []
+    years = []
+    for name in os.listdir(partition_dir):
+        match = partition_file_re.match(name)
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years, reverse=True)
+
+
+def year_of_id(purchase_id):
+    """ Year of the partition holding a purchase id. """
+    return int(purchase_id) // PARTITION_ID_SPAN
+
+
+def setup_partition(conn, year):
+    """
+    Create the groc schema in a new partition and seed its
+    id sequence so its ids do not collide with other partitions.
+
+    Args:
+        conn: SQLite connection to the partition database.
+        year (int): year stored in the partition.
+    """
+    db.setup_db(conn)
+    with conn:
+        conn.execute(sqlite_seed_purchase_id, (int(year) * PARTITION_ID_SPAN,))
+
+
+def attach(conn, partition_dir, years):
+    """
+    Attach the partitions of the given years to a connection.
+
+    Partitions attached earlier but not needed now are detached if
+    SQLite's attach limit would be exceeded. Must not be called inside
+    a transaction.
+
+    Args:
+        conn: SQLite connection to the main database.
+        partition_dir (str): directory of the partition files.
+        years (list): years to attach, missing partitions are skipped.
+
+    Returns:
+        list: schema names of the attached partitions, in order of years.
+
+    Raises:
+        exceptions.DatabaseError: if more partitions are needed than
+                                  SQLite can attach at once.
+    """
+    existing = set(partition_years(partition_dir))
+    years = [int(y) for y in years if int(y) in existing]
+    if len(years) > MAX_ATTACHED:
+        raise exceptions.DatabaseError(
+            f'Query spans {len(years)} yearly partitions, at most '
+            f'{MAX_ATTACHED} can be read at once. Narrow the years.')
+
+    wanted = [schema_name(y) for y in years]
+    attached = [row[1] for row in conn.execute('PRAGMA database_list;')
+                if partition_schema_re.match(row[1])]
+
+    try:
+        missing = [s for s in wanted if s not in attached]
+        if len(attached) + len(missing) > MAX_ATTACHED:
+            for schema in attached:
+                if schema not in wanted:
+                    conn.execute(f'DETACH DATABASE {schema};')
+        for year, schema in zip(years, wanted):
+            if schema in missing:
+                conn.execute(f'ATTACH DATABASE ? AS {schema};',
+                             (partition_path(partition_dir, year),))
+    except sqlite3.DatabaseError as e:
+        raise exceptions.DatabaseError(f'Error attaching partitions: {e}')
+
+    return wanted
+
+
+def union_sql(template, schemas, where='', suffix=''):
+    """
+    Build a UNION ALL query over partitions.
+
+    Args:
+        template (str): SELECT statement with a {schema} placeholder.
+        schemas (list): schema names of attached partitions.
+        where (str): condition appended to every branch.
+        suffix (str): ORDER BY/LIMIT clause of the compound query.
+
+    Returns:
+        str: sql statement, or None if there are no schemas.
+    """
+    if not schemas:
+        return None
+    branches = [template.format(schema=schema) + where for schema in schemas]
+    return '\nUNION ALL\n'.join(branches) + suffix
@@ -0,0 +1,131 @@
+import cProfile
+import datetime
+import io
+import pstats
+import tracemalloc
+
+
+""" Profiling
+
+Runs a groc command under cProfile (cpu) or tracemalloc (mem):
+
+    profiler = make_profiler('cpu')
+    profiler.start()
+    ...
+    profiler.stop()
+    profiler.write('groc-list.prof')
+    print(profiler.summary())
+
+A cpu profile is written as a pstats file, to be read with
+python -m pstats or a viewer like snakeviz; its summary lists the
+functions with the highest cumulative time. A mem profile is written as
+its summary: peak traced memory and the lines allocating the most.
+"""
+MODES = ['cpu', 'mem']
+
+# Lines shown in summaries
+DEFAULT_TOP = 25
+
+# Frames kept per traced allocation, the allocating line and its callers
+# are grouped together in the summary
+MEMORY_FRAMES = 1
+
+# Allocations of the profiling machinery itself
+MEMORY_IGNORED = ['<frozen importlib._bootstrap>',
+                  '<frozen importlib._bootstrap_external>',
+                  tracemalloc.__file__]
+
+
+class CpuProfiler:
+    extension = '.prof'
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def write(self, path):
+        """ Write the profile as a pstats file. """
+        self._profile.dump_stats(path)
+
+    def summary(self, top=DEFAULT_TOP):
+        """ Functions with the highest cumulative time. """
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(top)
+        return stream.getvalue().strip('\n')
+
+
+class MemoryProfiler:
+    extension = '.txt'
+
+    def __init__(self):
+        self._snapshot = None
+        self._peak = 0
+        self._started = False
+
+    def start(self):
+        # Keep tracing if it was started before, e.g. by PYTHONTRACEMALLOC
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start(MEMORY_FRAMES)
+        elif hasattr(tracemalloc, 'reset_peak'):
+            # Python 3.9+
+            tracemalloc.reset_peak()
+
+    def stop(self):
+        self._snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, name) for name in MEMORY_IGNORED])
+        _, self._peak = tracemalloc.get_traced_memory()
+        if self._started:
+            tracemalloc.stop()
+
+    def write(self, path):
+        """ Write the summary to a text file. """
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.summary() + '\n')
+
+    def summary(self, top=DEFAULT_TOP):
+        """
+        Peak memory and the lines holding the most memory at exit.
+        tracemalloc only snapshots live allocations, so memory freed
+        before the command finished counts towards the peak but is not
+        listed by line.
+        """
+        stats = self._snapshot.statistics('lineno')
+        lines = [f'Peak traced memory: {self._peak / 1024:,.1f} KiB',
+                 f'Retained at exit: '
+                 f'{sum(stat.size for stat in stats) / 1024:,.1f} KiB '
+                 f'in {sum(stat.count for stat in stats):,} blocks',
+                 f"{'KiB':>10} {'blocks':>8}  retained at exit, "
+                 f"allocated at"]
+        for stat in stats[:top]:
+            frame = stat.traceback[0]
+            lines.append(f'{stat.size / 1024:>10,.1f} {stat.count:>8,}  '
+                         f'{frame.filename}:{frame.lineno}')
+        return '\n'.join(lines)
+
+
+def make_profiler(mode):
+    """
+    Args:
+        mode (str): one of MODES.
+
+    Returns:
+        CpuProfiler or MemoryProfiler.
+    """
+    if mode == 'cpu':
+        return CpuProfiler()
+    if mode == 'mem':
+        return MemoryProfiler()
+    raise ValueError(f'Unknown profile mode {mode!r}.')
+
+
+def default_path(command, profiler):
+    """ File name for a profile of command, in the working directory. """
+    timestamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    return f'groc-{command}-{timestamp}{profiler.extension}'
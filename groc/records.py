@@ -0,0 +1,93 @@
+import collections
+import datetime
+
+from . import db, partitions
+
+
+""" Purchase records
+
+The library API of Groc (Groc.iter_purchases) yields Purchase records
+with the stored values: the total in integer cents and the date as a
+datetime.date. Unlike the report cursors, whose columns are formatted
+for display ('$1,234.00', 'January 01, 2019'), nothing needs parsing;
+formatting is left to the presentation layer (see utils.format_cents).
+
+Records are built straight from the result tuples by a cursor row
+factory, without an intermediate sqlite3.Row or dict per purchase.
+"""
+# Rows fetched from SQLite at a time by iter_purchases
+DEFAULT_BATCH_SIZE = 500
+
+
+""" SQLite specific statements, formatted per schema with {schema} """
+sqlite_purchase_records = """SELECT
+    p.id AS purchase_id,
+    p.purchase_date AS date,
+    s.name AS store,
+    p.total,
+    p.description
+FROM {schema}.purchase p
+INNER JOIN {schema}.store s ON p.store_id = s.id"""
+
+sqlite_records_where_month = (
+    ' WHERE p.purchase_month = ? AND p.purchase_year = ?')
+
+sqlite_records_order = '\nORDER BY date DESC, purchase_id DESC\nLIMIT ?;'
+
+
+class Purchase(collections.namedtuple(
+        'Purchase', ['id', 'date', 'store', 'total', 'description'])):
+    """
+    A stored purchase.
+
+    Attributes:
+        id (int): purchase id, None for a purchase not saved yet.
+        date (datetime.date): purchase date.
+        store (str): store name.
+        total (int): total in cents.
+        description (str): description, None if there is none.
+
+    Fields can also be read by name (purchase['total']), so a record
+    can be passed wherever a validated purchase dict is expected
+    (see db.insert_row).
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return super().__getitem__(key)
+
+
+def purchase_record(cursor, row):
+    """ Cursor row factory building Purchase records. """
+    return Purchase(row[0], datetime.date.fromisoformat(row[1]), row[2],
+                    row[3], row[4])
+
+
+def select_purchases(conn, schemas, month=None, year=None, limit=-1,
+                     batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Iterate over purchases of attached schemas, newest first.
+
+    Args:
+        conn: SQLite connection object.
+        schemas (list): schemas holding purchases, e.g. ['main'].
+        month (str): two digit month, None for all months.
+        year (str): four digit year, with month.
+        limit (int): most purchases returned, negative for no limit.
+        batch_size (int): rows fetched from SQLite at a time.
+
+    Returns:
+        iterator: Purchase records.
+    """
+    values = []
+    where = ''
+    if month:
+        where = sqlite_records_where_month
+        values = [int(month), int(year)] * len(schemas)
+    sql = partitions.union_sql(sqlite_purchase_records, schemas, where,
+                               sqlite_records_order)
+    cursor = db.query(conn, sql, values + [limit])
+    cursor.row_factory = purchase_record
+    return db.iter_rows(cursor, batch_size)
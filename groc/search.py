@@ -0,0 +1,345 @@
+import sqlite3
+
+from . import db, exceptions
+
+
+""" Full-text search
+
+An FTS5 index (purchase_search) over the store name and description of
+every purchase. The index is opt-in: build_index creates it and keeps it
+in sync with triggers on purchase inserts, updates and deletes.
+
+The index is contentless (content=''), it stores tokens only and the
+rowid of every entry is the purchase id, so results are joined back to
+purchase. Removing an entry needs the values it was indexed with, which
+the triggers read from the deleted row.
+
+Purchases existing when the index is created are backfilled in chunks
+of ascending ids, each in its own short transaction, so other groc
+processes can read and write meanwhile and an interrupted build resumes
+where it stopped. groc_meta records the progress: search_backfill_end
+is the largest id when the index was created (later purchases are
+indexed by the trigger), search_backfilled the largest id backfilled.
+Delete and update triggers only touch purchases already indexed.
+"""
+SEARCH_TABLE = 'purchase_search'
+
+# Purchases indexed per transaction while backfilling.
+DEFAULT_CHUNK_SIZE = 20000
+
+# Store names weigh more than descriptions in the bm25 ranking.
+RANK = 'bm25(2.0, 1.0)'
+
+ORDERS = {
+    'rank': 'f.rank, p.id DESC',
+    'newest': 'p.purchase_date DESC, p.id DESC',
+}
+
+
+""" SQLite specific statements """
+sqlite_create_search_table = """CREATE VIRTUAL TABLE IF NOT EXISTS
+purchase_search USING fts5(
+    store,
+    description,
+    content = '',
+    tokenize = 'unicode61 remove_diacritics 2'
+);"""
+
+sqlite_set_search_rank = """INSERT INTO purchase_search
+    (purchase_search, rank)
+VALUES ('rank', ?);"""
+
+sqlite_init_search_meta = """INSERT OR IGNORE INTO groc_meta (key, value)
+VALUES
+    ('search_backfill_end', (SELECT COALESCE(MAX(id), 0) FROM purchase)),
+    ('search_backfilled', 0);"""
+
+# Only purchases already in the index can be removed from it
+sqlite_search_indexed = """(
+    OLD.id > (SELECT value FROM groc_meta
+              WHERE key = 'search_backfill_end')
+    OR OLD.id <= (SELECT value FROM groc_meta
+                  WHERE key = 'search_backfilled')
+)"""
+
+sqlite_search_insert_trigger = """CREATE TRIGGER IF NOT EXISTS
+purchase_search_insert
+AFTER INSERT
+ON purchase
+BEGIN
+    INSERT INTO purchase_search (rowid, store, description)
+    VALUES (
+        NEW.id,
+        (SELECT name FROM store WHERE id = NEW.store_id),
+        NEW.description
+    );
+END;"""
+
+sqlite_search_delete_trigger = f"""CREATE TRIGGER IF NOT EXISTS
+purchase_search_delete
+AFTER DELETE
+ON purchase
+WHEN {sqlite_search_indexed}
+BEGIN
+    INSERT INTO purchase_search
+        (purchase_search, rowid, store, description)
+    VALUES (
+        'delete',
+        OLD.id,
+        (SELECT name FROM store WHERE id = OLD.store_id),
+        OLD.description
+    );
+END;"""
+
+sqlite_search_update_trigger = f"""CREATE TRIGGER IF NOT EXISTS
+purchase_search_update
+AFTER UPDATE OF store_id, description
+ON purchase
+WHEN {sqlite_search_indexed}
+BEGIN
+    INSERT INTO purchase_search
+        (purchase_search, rowid, store, description)
+    VALUES (
+        'delete',
+        OLD.id,
+        (SELECT name FROM store WHERE id = OLD.store_id),
+        OLD.description
+    );
+    INSERT INTO purchase_search (rowid, store, description)
+    VALUES (
+        NEW.id,
+        (SELECT name FROM store WHERE id = NEW.store_id),
+        NEW.description
+    );
+END;"""
+
+sqlite_select_search_progress = """SELECT
+    (SELECT value FROM groc_meta WHERE key = 'search_backfilled')
+        AS backfilled,
+    (SELECT value FROM groc_meta WHERE key = 'search_backfill_end')
+        AS backfill_end;"""
+
+sqlite_count_search_pending = """SELECT
+    COUNT(*) AS purchase_count
+FROM purchase
+WHERE id > ? AND id <= ?;"""
+
+sqlite_select_backfill_chunk_end = """SELECT MAX(id) FROM (
+    SELECT id
+    FROM purchase
+    WHERE id > ? AND id <= ?
+    ORDER BY id
+    LIMIT ?
+);"""
+
+sqlite_backfill_search = """INSERT INTO purchase_search
+    (rowid, store, description)
+SELECT
+    p.id,
+    s.name,
+    p.description
+FROM purchase p
+INNER JOIN store s ON p.store_id = s.id
+WHERE p.id > ? AND p.id <= ?;"""
+
+sqlite_update_search_backfilled = """UPDATE groc_meta
+SET value = ?
+WHERE key = 'search_backfilled';"""
+
+sqlite_drop_search = (
+    'DROP TRIGGER IF EXISTS purchase_search_insert;',
+    'DROP TRIGGER IF EXISTS purchase_search_delete;',
+    'DROP TRIGGER IF EXISTS purchase_search_update;',
+    'DROP TABLE IF EXISTS purchase_search;',
+    """DELETE FROM groc_meta
+    WHERE key IN ('search_backfill_end', 'search_backfilled');""",
+)
+
+# Formatted with the date filters and ORDERS
+sqlite_search_purchases = """SELECT
+    p.id,
+    p.purchase_date AS date,
+    p.total AS "total [total_money]",
+    s.name AS store,
+    COALESCE(p.description, '--') description
+FROM purchase_search f
+INNER JOIN purchase p ON p.id = f.rowid
+INNER JOIN store s ON p.store_id = s.id
+WHERE purchase_search MATCH ?{where}
+ORDER BY {order}
+LIMIT ?;"""
+
+
+def has_index(conn):
+    """ Check whether the search index exists in the database. """
+    return bool(conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?;",
+        (SEARCH_TABLE,)).fetchone())
+
+
+def index_status(conn):
+    """
+    Get the state of the search index.
+
+    Args:
+        conn: SQLite connection object.
+
+    Returns:
+        dict: pending (purchases left to backfill), None if there is
+              no index.
+    """
+    if not has_index(conn):
+        return None
+    row = db.query(conn, sqlite_select_search_progress).fetchone()
+    pending = db.query(conn, sqlite_count_search_pending,
+                       (row['backfilled'], row['backfill_end'])).fetchone()
+    return {'pending': pending['purchase_count']}
+
+
+@db.retry_on_lock
+def _run_in_transaction(conn, func, *args):
+    """ Run func(conn, *args) in an immediate transaction. """
+    try:
+        conn.execute('BEGIN IMMEDIATE;')
+        try:
+            result = func(conn, *args)
+            conn.commit()
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+    except sqlite3.DatabaseError as e:
+        if db.is_lock_error(e):
+            raise exceptions.DatabaseLockedError(db.LOCKED_MESSAGE)
+        raise exceptions.DatabaseError(f'Updating the search index failed: {e}')
+
+
+def _create_index(conn):
+    conn.execute(sqlite_create_search_table)
+    conn.execute(sqlite_set_search_rank, (RANK,))
+    conn.execute(sqlite_init_search_meta)
+    for stmt in (sqlite_search_insert_trigger, sqlite_search_delete_trigger,
+                 sqlite_search_update_trigger):
+        conn.execute(stmt)
+
+
+def _backfill_chunk(conn, chunk_size):
+    """ Index the next chunk of existing purchases. """
+    row = conn.execute(sqlite_select_search_progress).fetchone()
+    backfilled, backfill_end = row['backfilled'], row['backfill_end']
+    chunk_end = conn.execute(
+        sqlite_select_backfill_chunk_end,
+        (backfilled, backfill_end, chunk_size)).fetchone()[0]
+    if chunk_end is None:
+        chunk_end = backfill_end
+    indexed = conn.execute(sqlite_backfill_search,
+                           (backfilled, chunk_end)).rowcount
+    if chunk_end != backfilled:
+        conn.execute(sqlite_update_search_backfilled, (chunk_end,))
+    return indexed
+
+
+def build_index(conn, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Create the search index, if needed, and index the purchases not
+    indexed yet. Resumes an interrupted build.
+
+    Args:
+        conn: SQLite connection object, not inside a transaction.
+        chunk_size (int): purchases indexed per transaction.
+        progress (callable): optional, called as progress(indexed)
+                             after each chunk.
+
+    Returns:
+        int: number of purchases indexed.
+
+    Raises:
+        exceptions.DatabaseLockedError: if the database stayed locked.
+        exceptions.DatabaseError: if SQLite lacks FTS5.
+    """
+    _run_in_transaction(conn, _create_index)
+    total = 0
+    while True:
+        indexed = _run_in_transaction(conn, _backfill_chunk, chunk_size)
+        if not indexed:
+            return total
+        total += indexed
+        if progress:
+            progress(indexed)
+
+
+def drop_index(conn):
+    """ Remove the search index and its triggers. """
+    def drop(conn):
+        for stmt in sqlite_drop_search:
+            conn.execute(stmt)
+    _run_in_transaction(conn, drop)
+
+
+def match_query(text):
+    """
+    Turn words into an FTS5 query matching purchases with all of them.
+    Words are quoted, so punctuation is not FTS5 syntax; a trailing *
+    matches words starting with the rest.
+
+    Args:
+        text (str): words to search for.
+
+    Returns:
+        str: FTS5 query.
+
+    Raises:
+        exceptions.GrocException: if text has no words.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '')
+        if word:
+            terms.append(f'"{word}"' + ('*' if prefix else ''))
+    if not terms:
+        raise exceptions.GrocException('Nothing to search for.')
+    return ' '.join(terms)
+
+
+def search_purchases(conn, text, since=None, until=None, limit=-1,
+                     order='rank', raw=False):
+    """
+    Search purchases by store name and description.
+
+    Args:
+        conn: SQLite connection object.
+        text (str): words to search for, see match_query.
+        since (str): optional, first purchase date (YYYY-MM-DD).
+        until (str): optional, last purchase date (YYYY-MM-DD).
+        limit (int): maximum number of purchases, -1 for all.
+        order (str): 'rank' (best match first) or 'newest'.
+        raw (bool): text is an FTS5 query (AND/OR/NOT, NEAR, column
+                    filters like store:pharmacy, ...).
+
+    Returns:
+        cursor: SQLite cursor object, rows are fetched lazily.
+
+    Raises:
+        exceptions.GrocException: if the index does not exist or the
+                                  query is invalid.
+    """
+    if not has_index(conn):
+        raise exceptions.GrocException(
+            'No search index. Build it with groc search --build.')
+    where = ''
+    values = [text if raw else match_query(text)]
+    if since:
+        where += '\n    AND p.purchase_date >= ?'
+        values.append(since)
+    if until:
+        where += '\n    AND p.purchase_date <= ?'
+        values.append(until)
+    values.append(limit)
+    sql = sqlite_search_purchases.format(where=where, order=ORDERS[order])
+    try:
+        return db.timed(conn.execute)(sql, values)
+    except sqlite3.OperationalError as e:
+        if db.is_lock_error(e):
+            raise exceptions.DatabaseLockedError(db.LOCKED_MESSAGE)
+        raise exceptions.GrocException(f'Invalid search query: {e}')
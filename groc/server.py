@@ -0,0 +1,332 @@
+import http.server
+import json
+import os
+import queue
+import socket
+import socketserver
+import stat
+import threading
+from concurrent.futures import Future
+
+import click
+
+from . import batch, exceptions
+
+
+""" Local groc server
+
+groc serve keeps one Groc instance (and its connections) open and
+answers JSON requests over a Unix domain socket or localhost HTTP:
+
+    POST /list       {"limit": 10}
+    POST /add        {"store": "Store Foo", "total": 20, "date": "2019-01-01"}
+    POST /bulk_add   {"purchases": [{"date": ..., "store": ..., ...}]}
+
+Options are the batch/command line options (see batch.json_args), the
+response is {"ok": true, "result": ...} or {"ok": false, "error": ...}.
+
+Reports run on the request threads, each with its own read-only
+connection, and reuse the result cache. Writes are queued to a single
+writer thread, which runs the writes queued meanwhile together in one
+transaction (one savepoint per request), so concurrent inserts share a
+commit instead of waiting for the database lock one by one.
+"""
+# Default socket file in the groc directory
+SOCKET_NAME = 'groc.sock'
+
+# Most write requests committed in one transaction
+MAX_WRITE_BATCH = 500
+
+WRITE_COMMANDS = ['add', 'bulk_add', 'delete']
+COMMANDS = WRITE_COMMANDS + ['list', 'breakdown', 'export']
+
+
+class WriteQueue:
+    """
+    Single writer thread running write jobs in batched transactions.
+
+        writes = WriteQueue(g)
+        writes.submit(lambda g: g.delete_purchase([1])).result()
+    """
+
+    def __init__(self, groc, max_batch=MAX_WRITE_BATCH):
+        """
+        Args:
+            groc: Groc instance to write with.
+            max_batch (int): most jobs run in one transaction.
+        """
+        self.groc = groc
+        self.max_batch = max_batch
+        # Partitions are separate files, without a shared transaction
+        self.batching = not groc.is_partitioned()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run,
+                                        name='groc-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, job):
+        """
+        Queue a write job.
+
+        Args:
+            job (callable): called as job(groc) on the writer thread.
+
+        Returns:
+            concurrent.futures.Future: result of the job, set once its
+                                       transaction is committed.
+        """
+        future = Future()
+        self._queue.put((job, future))
+        return future
+
+    def close(self):
+        """ Finish the queued jobs and stop the writer thread. """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _take(self):
+        """ Block for a job, then take the jobs queued meanwhile. """
+        jobs = [self._queue.get()]
+        while jobs[-1] is not None and len(jobs) < self.max_batch:
+            try:
+                jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._take()
+            stop = jobs[-1] is None
+            jobs = [job for job in jobs if job is not None]
+            if jobs:
+                self._run_jobs(jobs)
+            if stop:
+                return
+
+    def _run_jobs(self, jobs):
+        if not self.batching:
+            for job, future in jobs:
+                try:
+                    future.set_result(job(self.groc))
+                except Exception as e:
+                    future.set_exception(e)
+            return
+
+        results = []
+        try:
+            with self.groc.transaction():
+                for job, future in jobs:
+                    try:
+                        with self.groc.savepoint():
+                            results.append((future, job(self.groc), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            # Begin or commit failed, nothing was written
+            for _, future in jobs:
+                future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+class GrocService:
+    """ Runs the server commands on a Groc instance. """
+
+    def __init__(self, groc, group):
+        """
+        Args:
+            groc: Groc instance, closed by close().
+            group (click.Group): the groc command group, parsing options.
+        """
+        self.groc = groc
+        self.group = group
+        self.writes = WriteQueue(groc)
+
+    def call(self, name, options):
+        """
+        Run a command.
+
+        Args:
+            name (str): command name, one of COMMANDS.
+            options (dict): JSON options of the command.
+
+        Returns:
+            JSON serializable result.
+
+        Raises:
+            exceptions.BatchError: if the command is unknown.
+            click.ClickException: if the options are invalid.
+        """
+        if name not in COMMANDS:
+            raise exceptions.BatchError(f'Unknown command {name!r}.')
+        if options.get('include_archive'):
+            # The Groc instance is shared by all request threads
+            raise exceptions.BatchError(
+                'Start groc serve with --include-archive instead.')
+
+        if name == 'bulk_add':
+            purchases = options.get('purchases') or []
+            ignore_duplicate = bool(options.get('ignore_duplicate'))
+
+            def job(g):
+                added = 0
+                for row in purchases:
+                    if g.add_purchase_manual(dict(row), ignore_duplicate):
+                        added += 1
+                return {'added': added}
+        else:
+            params = batch.parse_params(self.group, name,
+                                        batch.json_args(options))
+            if name not in WRITE_COMMANDS:
+                return batch.run(self.groc, name, params)
+
+            def job(g):
+                return batch.run(g, name, params)
+
+        return self.writes.submit(job).result()
+
+    def close(self):
+        self.writes.close()
+        self.groc.close()
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """ JSON requests: POST /<command>, GET /health. """
+
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, body):
+        data = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, {'ok': True})
+        else:
+            self._send(404, {'ok': False, 'error': 'Not found.'})
+
+    def do_POST(self):
+        name = self.path.strip('/')
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            options = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(options, dict):
+                raise ValueError('expected a JSON object')
+        except ValueError as e:
+            self._send(400, {'ok': False, 'error': f'Invalid JSON: {e}'})
+            return
+
+        if name not in COMMANDS:
+            self._send(404, {'ok': False,
+                             'error': f'Unknown command {name!r}.'})
+            return
+        try:
+            result = self.server.service.call(name, options)
+        except click.ClickException as e:
+            self._send(400, {'ok': False, 'error': e.format_message()})
+        except exceptions.GrocException as e:
+            self._send(400, {'ok': False, 'error': str(e)})
+        except Exception as e:
+            self._send(500, {'ok': False, 'error': str(e)})
+        else:
+            self._send(200, {'ok': True, 'result': result})
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class HTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def remove_stale_socket(path):
+    """
+    Remove a socket file left by a server that did not shut down
+    cleanly, so a new server can bind to path.
+
+    Raises:
+        exceptions.ServerError: if path is not a socket or a server is
+                                still listening on it.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise exceptions.ServerError(
+            f'Cannot listen on {path}: the file exists and is not a socket.')
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.remove(path)
+        return
+    except OSError as e:
+        raise exceptions.ServerError(f'Cannot listen on {path}: {e}')
+    finally:
+        probe.close()
+    raise exceptions.ServerError(
+        f'Cannot listen on {path}: another server is listening on it.')
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn,
+                     socketserver.UnixStreamServer):
+    daemon_threads = True
+    # (device, inode) of the socket file created by server_bind
+    _socket_file = None
+
+    def server_bind(self):
+        remove_stale_socket(self.server_address)
+        super().server_bind()
+        info = os.lstat(self.server_address)
+        self._socket_file = (info.st_dev, info.st_ino)
+
+    def server_close(self):
+        super().server_close()
+        # Only remove the socket file this server created, the path may
+        # have been taken over since
+        try:
+            info = os.lstat(self.server_address)
+        except FileNotFoundError:
+            return
+        if (info.st_dev, info.st_ino) == self._socket_file:
+            os.remove(self.server_address)
+
+
+def make_server(service, socket_path=None, host='127.0.0.1', port=None,
+                verbose=False):
+    """
+    Create a server for a GrocService.
+
+    Args:
+        service (GrocService): the service answering requests.
+        socket_path (str): Unix socket to listen on, unless port is given.
+        host (str): address to listen on with port.
+        port (int): TCP port to listen on, 0 for any free port.
+        verbose (bool): log requests to stderr.
+
+    Returns:
+        socketserver.BaseServer: call serve_forever() on it.
+    """
+    if port is not None:
+        server = HTTPServer((host, port), RequestHandler)
+    else:
+        server = UnixHTTPServer(socket_path, RequestHandler)
+    server.service = service
+    server.verbose = verbose
+    return server
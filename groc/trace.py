@@ -0,0 +1,164 @@
+import datetime
+import os
+import re
+import threading
+import time
+
+
+""" SQL tracing
+
+While a Tracer is enabled, every connection created by db.create_connection
+reports its statements to it (Connection.set_trace_callback), and the
+statements run by db.execute_sql, db.query and the insert path are timed:
+
+    tracer = trace.enable(trace.Tracer(slow_log='slow.log'))
+    ...
+    for stats in tracer.summary():
+        print(stats['statement'], stats['count'], stats['total'])
+
+Statements are aggregated by their normalized text, with literals and
+IN lists replaced by placeholders. Timed statements taking at least the
+slow threshold are appended to the slow-query log. Timing db.query
+covers executing the statement up to its first row, rows fetched later
+by the caller are not included.
+
+When no tracer is enabled (the default), the db functions only check
+the module attribute active, so tracing costs next to nothing.
+"""
+# Timed statements at least this slow (seconds) go to the slow-query log
+DEFAULT_SLOW_THRESHOLD = 0.1
+
+# Normalized forms of statements remembered, expanded statements with
+# their values differ on every execution
+NORMALIZED_CACHE_SIZE = 10000
+
+# The enabled Tracer, None when tracing is off
+active = None
+
+literal_re = re.compile(
+    r"\b[xX]'[0-9a-fA-F]*'|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\bNULL\b", re.I)
+in_list_re = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+whitespace_re = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """
+    Normalize a statement for aggregation: literal values become ?,
+    lists of placeholders become (?...), whitespace is collapsed.
+    """
+    sql = literal_re.sub('?', sql)
+    sql = in_list_re.sub('(?...)', sql)
+    return whitespace_re.sub(' ', sql).strip().rstrip(';').rstrip()
+
+
+class Tracer:
+    """ Aggregates statement counts and timings, see module docstring. """
+
+    def __init__(self, slow_log=None, slow_threshold=DEFAULT_SLOW_THRESHOLD):
+        """
+        Args:
+            slow_log (str): path of the slow-query log, None for no log.
+            slow_threshold (float): seconds a statement takes to be logged.
+        """
+        self.slow_log = slow_log and os.path.expanduser(slow_log)
+        self.slow_threshold = slow_threshold
+        self._stats = {}
+        self._normalized = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, sql):
+        # Normalizing is the costly part, statements repeat a lot
+        key = self._normalized.get(sql)
+        if key is None:
+            if len(self._normalized) >= NORMALIZED_CACHE_SIZE:
+                self._normalized.clear()
+            key = self._normalized[sql] = normalize(sql)
+        entry = self._stats.get(key)
+        if entry is None:
+            # executed, timed, total seconds, max seconds
+            entry = self._stats[key] = [0, 0, 0.0, 0.0]
+        return entry
+
+    def on_statement(self, sql):
+        """ Trace callback of connections, counts executed statements. """
+        if sql.startswith('--'):
+            # Statements of triggers
+            return
+        with self._lock:
+            self._entry(sql)[0] += 1
+
+    def record(self, sql, seconds, values=()):
+        """
+        Record the duration of a statement.
+
+        Args:
+            sql (str): the statement.
+            seconds (float): time it took.
+            values (tuple): its values, written to the slow-query log.
+        """
+        with self._lock:
+            entry = self._entry(sql)
+            entry[1] += 1
+            entry[2] += seconds
+            if seconds > entry[3]:
+                entry[3] = seconds
+        if self.slow_log and seconds >= self.slow_threshold:
+            self._log_slow(sql, seconds, values)
+
+    def _log_slow(self, sql, seconds, values):
+        line = '\t'.join([
+            datetime.datetime.now().isoformat(timespec='milliseconds'),
+            f'pid={os.getpid()}',
+            f'{seconds * 1000:.1f}ms',
+            whitespace_re.sub(' ', sql).strip(),
+            repr(tuple(values)),
+        ])
+        try:
+            with open(self.slow_log, 'a', encoding='utf-8') as log:
+                log.write(line + '\n')
+        except OSError:
+            # Tracing must never make a command fail
+            pass
+
+    def timed(self, execute):
+        """
+        Wrap an execute(sql, values) function to record its duration.
+        """
+        def timed_execute(sql, values=()):
+            start = time.perf_counter()
+            try:
+                return execute(sql, values)
+            finally:
+                self.record(sql, time.perf_counter() - start, values)
+        return timed_execute
+
+    def summary(self):
+        """
+        Aggregated statements, slowest total time first.
+
+        Returns:
+            list: dicts with statement, count (executions), timed,
+                  total and max (seconds).
+        """
+        with self._lock:
+            # SQLite reports a statement again for each trigger step it
+            # runs, timed executions are counted exactly
+            stats = [{'statement': key, 'count': entry[1] or entry[0],
+                      'timed': entry[1], 'total': entry[2], 'max': entry[3]}
+                     for key, entry in self._stats.items()]
+        return sorted(stats, key=lambda s: (-s['total'], -s['count']))
+
+
+def enable(tracer):
+    """ Trace the connections created from now on with tracer. """
+    global active
+    active = tracer
+    return tracer
+
+
+def disable():
+    """ Stop tracing, returning the tracer that was enabled. """
+    global active
+    tracer, active = active, None
+    return tracer
+
@@ -2,8 +2,6 @@ import datetime
 import decimal as dc
 import os
 
-from unidecode import unidecode
-
 from . import exceptions
 
 
@@ -51,6 +49,8 @@ def check_required_row_values(row):
 
 def convert_unicode_whitespace(value):
     """Converts all unicode characters to ascii and removes whitespace."""
+    # Imported on first use, unidecode loads large tables
+    from unidecode import unidecode
     return unidecode(value).strip()
 
 
@@ -104,6 +104,21 @@ def format_total(total):
             f'(Format must be whole or decimal number like 10, 100.00, 1000.01).')
 
 
+def format_cents(cents):
+    """
+    Converts cents to a dollar amount, the reverse of format_total.
+
+    Args:
+        cents (int): Total cents.
+
+    Returns:
+        str: Decimal dollar amount, e.g. '1234.50'.
+    """
+    sign = '-' if cents < 0 else ''
+    dollars, cents = divmod(abs(cents), 100)
+    return f'{sign}{dollars}.{cents:02d}'
+
+
 def format_date(date):
     """
     Formats a value to a datetime.date object.
@@ -30,6 +30,9 @@ setup(
     packages=["groc"],
     include_package_data=True,
     install_requires=["click", "colorama", "ptable", "unidecode"],
+    extras_require={
+        "analytics": ["numpy"],
+    },
     entry_points={
         "console_scripts": [
             "groc=groc.__main__:safe_entry_point",
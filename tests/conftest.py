@@ -1,9 +1,11 @@
 # import sqlite3
 import textwrap
+from unittest import mock
 
 import pytest
 
 from groc import db
+from groc.models import Groc
 
 
 @pytest.fixture
@@ -82,6 +84,17 @@ def create_invalid_purchase_csvs(tmpdir):
     return [str(jan_purchases), str(feb_purchases)]
 
 
+@pytest.fixture
+def groc_db(tmp_path, monkeypatch):
+    """ An initialized groc database, used by cli commands via GROC_DB. """
+    groc_dir = tmp_path / 'groc'
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(groc_dir)):
+        Groc().init_groc()
+    monkeypatch.setenv('GROC_DB', str(groc_dir / 'groc.db'))
+    return groc_dir / 'groc.db'
+
+
 @pytest.fixture
 def date_bytes():
     # Fixed date string to bytes
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from unittest import mock
+
+import pytest
+
+from groc import exceptions
+from groc.aio import AsyncGroc
+from groc.models import Groc
+
+
+def purchase(total, store='Store Foo', date='2019-01-01'):
+    return {'date': date, 'store': store, 'total': str(total),
+            'description': None}
+
+
+@pytest.fixture
+def groc(tmp_path):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(tmp_path / 'groc')):
+        g = Groc(read_only_reports=True)
+    g.init_groc()
+    return g
+
+
+def write_csv(path, count):
+    lines = ['Date,Store,Total,Description']
+    lines += [f'2019-01-01,Store Foo,{total}.00,' for total in range(1, count + 1)]
+    path.write_text('\n'.join(lines) + '\n')
+    return str(path)
+
+
+def test_async_groc(groc, tmp_path):
+    csv_file = write_csv(tmp_path / 'purchases.csv', 20)
+
+    async def main():
+        async with AsyncGroc(groc, readers=2) as g:
+            assert await g.add_purchase_path(csv_file, False) == 20
+            await g.add_purchase_manual(purchase(99, 'Store Bar'), False)
+            with pytest.raises(exceptions.DuplicateRow):
+                await g.add_purchase_manual(purchase(99, 'Store Bar'), False)
+
+            count, months, rows = await asyncio.gather(
+                g.select_purchase_count(),
+                g.breakdown(['01'], ['2019']),
+                g.list_purchases_limit(5))
+            assert count == 21
+            assert months[0]['purchase count'] == 21
+            assert len(rows) == 5
+
+            batches = [len(rows) async for rows in g.stream(
+                'list_purchases_limit', -1, batch_size=8)]
+            assert batches == [8, 8, 5]
+
+            # Stopping early stops the reader thread
+            async for rows in g.stream('list_purchases_limit', -1,
+                                       batch_size=1):
+                break
+            await g.delete_purchase([1])
+            assert await g.select_purchase_count() == 20
+
+    asyncio.run(main())
+
+
+def test_cancel_import(groc, tmp_path):
+    csv_file = write_csv(tmp_path / 'purchases.csv', 50)
+    started = threading.Event()
+    release = threading.Event()
+    add_row = groc._writer
+
+    def slow_writer():
+        # Hold the import on its first row until the task is cancelled
+        if groc._in_transaction() and not started.is_set():
+            started.set()
+            release.wait(5)
+        return add_row()
+
+    async def main():
+        async with AsyncGroc(groc) as g:
+            with mock.patch.object(groc, '_writer', side_effect=slow_writer):
+                task = asyncio.ensure_future(
+                    g.add_purchase_path(csv_file, False))
+                while not started.is_set():
+                    await asyncio.sleep(0.01)
+                task.cancel()
+                await asyncio.sleep(0.05)
+                release.set()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+            # Rolled back entirely
+            assert await g.select_purchase_count() == 0
+
+    asyncio.run(main())
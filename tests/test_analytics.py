@@ -0,0 +1,98 @@
+import datetime
+import random
+
+import pytest
+
+from groc import analytics, db
+
+
+sql_by_store = """SELECT
+    s.name AS store,
+    COUNT(*) AS count,
+    SUM(p.total) AS total,
+    MIN(p.total) AS min,
+    MAX(p.total) AS max,
+    CAST(round(avg(p.total)) AS INTEGER) AS avg
+FROM purchase p
+INNER JOIN store s ON p.store_id = s.id
+GROUP BY s.name
+ORDER BY total DESC, store;"""
+
+sql_by_week = """SELECT
+    date(purchase_date,
+         '-' || ((strftime('%w', purchase_date) + 6) % 7) || ' days') AS week,
+    COUNT(*) AS count,
+    SUM(total) AS total,
+    MIN(total) AS min,
+    MAX(total) AS max,
+    CAST(round(avg(total)) AS INTEGER) AS avg,
+    COUNT(DISTINCT store_id) AS store_count
+FROM purchase
+GROUP BY week
+ORDER BY week DESC;"""
+
+backends = [
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(
+        analytics.numpy is None, reason='NumPy is not installed')),
+]
+
+
+@pytest.fixture(scope='module')
+def conn():
+    conn = db.create_connection(':memory:')
+    db.setup_db(conn)
+    rng = random.Random(1)
+    stores = [f'Store {i}' for i in range(12)]
+    conn.executemany('INSERT INTO store (name) VALUES (?);',
+                     [(name,) for name in stores])
+    start = datetime.date(2018, 11, 1)
+    conn.executemany(
+        """INSERT INTO purchase (purchase_date, total, description, store_id)
+        VALUES (?, ?, ?, ?);""",
+        [((start + datetime.timedelta(days=rng.randrange(500))).isoformat(),
+          rng.randrange(1, 5000) * 10 + i % 10 - 5,
+          f'purchase {i}',
+          rng.randrange(1, len(stores) + 1)) for i in range(3000)])
+    conn.commit()
+    return conn
+
+
+@pytest.mark.parametrize('use_numpy', backends)
+def test_breakdown_matches_sql(conn, use_numpy):
+    columns = analytics.PurchaseColumns(use_numpy).load(conn)
+    assert len(columns) == 3000
+
+    for month, year in [(['01'], ['2019']),
+                        (['11', '12', '02'], ['2018', '2019', '2020']),
+                        ([f'{m:02d}' for m in range(1, 13)], ['2019']),
+                        (['05'], ['2030'])]:
+        expected = [dict(row) for row in
+                    db.select_count_total_per_month(conn, month, year)]
+        assert columns.breakdown(month, year) == expected
+
+
+@pytest.mark.parametrize('use_numpy', backends)
+def test_groupings_match_sql(conn, use_numpy):
+    columns = analytics.PurchaseColumns(use_numpy).load(conn)
+
+    assert columns.by_store() == [
+        dict(row) for row in conn.execute(sql_by_store)]
+
+    assert [dict(row, week=row['week'].isoformat())
+            for row in columns.by_week()] == [
+        dict(row) for row in conn.execute(sql_by_week)]
+
+
+def test_numpy_matches_python(conn):
+    if analytics.numpy is None:
+        pytest.skip('NumPy is not installed')
+    python = analytics.PurchaseColumns(False).load(conn)
+    vectorized = analytics.PurchaseColumns(True).load(conn)
+    assert python.monthly() == vectorized.monthly()
+
+
+def test_round_half_away():
+    assert analytics.round_half_away(2.5) == 3
+    assert analytics.round_half_away(-2.5) == -3
+    assert analytics.round_half_away(2.49) == 2
@@ -0,0 +1,164 @@
+import datetime
+import os
+from unittest import mock
+
+import pytest
+from click.testing import CliRunner
+
+from groc import archive, db, exceptions
+from groc.cli import groc_entrypoint as groc_cli
+from groc.models import Groc
+
+
+PURCHASES = [
+    {'date': '2018-12-30', 'store': 'Store Old', 'total': '10.00',
+     'description': None},
+    {'date': '2019-01-01', 'store': 'Store Foo', 'total': '20.00',
+     'description': 'fruits'},
+    {'date': '2019-01-03', 'store': 'Store Bar', 'total': '25.00',
+     'description': None},
+    {'date': '2019-01-20', 'store': 'Store Foo', 'total': '7.00',
+     'description': None},
+    {'date': '2019-02-01', 'store': 'Store Bar', 'total': '5.00',
+     'description': 'bars'},
+]
+
+CUTOFF = datetime.date(2019, 1, 15)
+
+
+def make_groc(groc_dir, **kwargs):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(groc_dir)):
+        return Groc(**kwargs)
+
+
+@pytest.fixture
+def groc_dir(tmp_path):
+    groc_dir = tmp_path / 'groc'
+    with make_groc(groc_dir) as g:
+        g.init_groc()
+        for row in PURCHASES:
+            g.add_purchase_manual(dict(row), False)
+    return groc_dir
+
+
+def test_archive_moves_old_purchases(groc_dir):
+    with make_groc(groc_dir) as g:
+        assert g.count_archivable(CUTOFF) == 3
+        ids = [row['id'] for row in g.list_purchases_limit(10)]
+
+        chunks = []
+        assert g.archive(CUTOFF, chunk_size=2, progress=chunks.append) == 3
+        assert chunks == [2, 1]
+        assert g.has_archive()
+        assert g.select_purchase_count() == 2
+
+        # Stores only used by archived purchases are removed
+        stores = [row[0] for row in g.connection.execute(
+            'SELECT name FROM main.store ORDER BY name;')]
+        assert stores == ['Store Bar', 'Store Foo']
+
+    with make_groc(groc_dir, include_archive=True) as g:
+        assert g.select_purchase_count() == 5
+        # Purchases keep their ids
+        assert sorted(row['id'] for row in g.list_purchases_limit(10)) == sorted(ids)
+
+
+def test_archive_per_database(tmp_path):
+    """ Databases sharing a directory have their own archive and lock """
+    a_db, b_db = str(tmp_path / 'a.db'), str(tmp_path / 'b.db')
+    with Groc(a_db) as a, Groc(b_db) as b:
+        a.init_groc()
+        b.init_groc()
+        a.add_purchase_manual(dict(PURCHASES[0]), False)
+        assert a.archive(CUTOFF) == 1
+        assert a.archive_url == str(tmp_path / 'a.archive.db')
+        assert a._lock.path == str(tmp_path / 'a.lock')
+        assert a.partition_dir == str(tmp_path / 'a.partitions')
+        assert not b.has_archive()
+
+        b.add_purchase_manual(dict(PURCHASES[0]), False)
+        with a._writer_lock():
+            b.add_purchase_manual(dict(PURCHASES[1]), False)
+
+    with Groc(b_db, include_archive=True) as b:
+        assert [row['store'] for row in b.list_purchases_limit(10)] == [
+            'Store Foo', 'Store Old']
+
+
+def test_reports_include_archive(groc_dir):
+    with make_groc(groc_dir) as g:
+        before = [tuple(r) for r in g.breakdown(['12', '01'], ['2018', '2019'])]
+        g.archive(CUTOFF)
+        assert len(g.list_purchases_date('01', '2019').fetchall()) == 1
+
+    with make_groc(groc_dir, include_archive=True) as g:
+        with g.read_snapshot():
+            # January 2019 is split by the cutoff and aggregated over both
+            assert [tuple(r) for r in g.breakdown(
+                ['12', '01'], ['2018', '2019'])] == before
+            assert len(g.list_purchases_date('01', '2019').fetchall()) == 3
+            assert len(g.list_purchases_date_limit(
+                '01', '2019', 2).fetchall()) == 2
+
+
+def test_archived_purchases_are_duplicates(groc_dir, tmpdir):
+    with make_groc(groc_dir) as g:
+        g.archive(CUTOFF)
+
+        with pytest.raises(exceptions.DuplicateRow):
+            g.add_purchase_manual(dict(PURCHASES[0]), False)
+        assert not g.add_purchase_manual(dict(PURCHASES[2]), True)
+
+        csv_file = tmpdir.join('old.csv')
+        csv_file.write('Date,Store,Total,Description\n'
+                       '2019-01-01,Store Foo,20.00,fruits\n'
+                       '2019-01-02,Store Foo,20.00,fruits\n')
+        assert g.add_purchase_path(str(csv_file), True) == 1
+
+
+def test_archive_duplicate_check_uses_index(groc_dir):
+    with make_groc(groc_dir) as g:
+        g.archive(CUTOFF)
+        conn = g._writer()
+        plan = ' '.join(row['detail'] for row in conn.execute(
+            'EXPLAIN QUERY PLAN ' + db.sqlite_select_archived_purchase,
+            ('Store Foo', '2019-01-01', 2000, 'fruits')))
+        assert 'SCAN' not in plan
+
+
+def test_archive_is_resumable(groc_dir):
+    with make_groc(groc_dir) as g:
+        conn = g._writer()
+        # A crash after copying but before deleting leaves rows in both
+        archive.create_archive(g.archive_url)
+        archive.attach(conn, g.archive_url)
+        conn.execute(archive.sqlite_create_archive_batch)
+        conn.execute(archive.sqlite_fill_archive_batch,
+                     (CUTOFF.year, CUTOFF.isoformat(), 10))
+        conn.execute(archive.sqlite_archive_stores)
+        conn.execute(archive.sqlite_archive_purchases)
+        conn.commit()
+
+        assert g.archive(CUTOFF) == 3
+        assert conn.execute(
+            'SELECT COUNT(*) FROM archive.purchase;').fetchone()[0] == 3
+
+
+def test_cli_archive(groc_dir):
+    runner = CliRunner()
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(groc_dir)):
+        result = runner.invoke(groc_cli, ['archive', '--before', '2019-01-15',
+                                          '--dry-run'])
+        assert result.output == ('Archiving will move 3 purchase(s) '
+                                 'made before 2019-01-15.\n')
+        assert not os.path.exists(archive.archive_path(str(groc_dir / 'groc.db')))
+
+        result = runner.invoke(groc_cli, ['archive', '--before', '2019-01-15'])
+        assert result.exit_code == 0
+        assert result.output.endswith('Archived 3 purchase(s).\n')
+
+        result = runner.invoke(groc_cli, ['list', '--include-archive'])
+        assert result.exit_code == 0
+        assert 'Store Old' in result.output
@@ -0,0 +1,146 @@
+import gzip
+import sqlite3
+import threading
+from unittest import mock
+
+import pytest
+from click.testing import CliRunner
+
+from groc import backup, db, exceptions
+from groc.cli import groc_entrypoint as groc_cli
+from groc.models import Groc
+
+
+def make_groc(groc_dir):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(groc_dir)):
+        return Groc()
+
+
+def add_purchases(g, count, store='Store Foo'):
+    for i in range(count):
+        g.add_purchase_manual({
+            'date': '2019-01-01',
+            'store': store,
+            'total': str(i + 1),
+            'description': f'purchase {i}'
+        }, False)
+
+
+@pytest.fixture
+def groc_dir(tmp_path):
+    groc_dir = tmp_path / 'groc'
+    with make_groc(groc_dir) as g:
+        g.init_groc()
+        add_purchases(g, 50)
+    return groc_dir
+
+
+def count_purchases(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM purchase;').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_backup_and_restore(groc_dir, tmp_path):
+    dest = str(tmp_path / 'backup.db')
+    steps = []
+    with make_groc(groc_dir) as g:
+        stats = g.backup_db(dest, pages=1, sleep=0,
+                            progress=lambda copied, total: steps.append(copied))
+        assert stats['pages'] == steps[-1]
+        assert len(steps) == stats['pages']
+        assert count_purchases(dest) == 50
+
+        with pytest.raises(exceptions.DatabaseError):
+            g.backup_db(dest)
+
+        g.clear_db()
+        add_purchases(g, 3, 'Store Bar')
+        g.restore_db(dest)
+        assert g.select_purchase_count() == 50
+
+
+def test_gzip_backup(groc_dir, tmp_path):
+    dest = str(tmp_path / 'backup.db.gz')
+    with make_groc(groc_dir) as g:
+        g.backup_db(dest)
+        with gzip.open(dest) as f:
+            assert f.read(16) == b'SQLite format 3\x00'
+        assert backup.purchase_count(dest) == 50
+
+        g.clear_db()
+        g.restore_db(dest)
+        assert g.select_purchase_count() == 50
+
+
+def test_restore_rejects_other_files(groc_dir, tmp_path):
+    not_groc = tmp_path / 'other.db'
+    sqlite3.connect(str(not_groc)).close()
+    not_db = tmp_path / 'other.db.gz'
+    not_db.write_text('foo')
+
+    with make_groc(groc_dir) as g:
+        for src in (str(not_groc), str(not_db)):
+            with pytest.raises(exceptions.DatabaseError):
+                g.restore_db(src)
+        assert g.select_purchase_count() == 50
+
+
+def test_backup_is_consistent_during_import(groc_dir, tmp_path):
+    """ A backup taken while another connection imports is a snapshot """
+    dest = str(tmp_path / 'backup.db')
+    started = threading.Event()
+    done = threading.Event()
+
+    def import_purchases():
+        conn = db.create_connection(str(groc_dir / 'groc.db'))
+        i = 0
+        while not done.is_set():
+            db.validate_insert_row(conn, {
+                'date': '2019-02-01',
+                'store': 'Store Bar',
+                'total': str(i + 1),
+                'description': None
+            })
+            i += 1
+            started.set()
+        conn.close()
+
+    importer = threading.Thread(target=import_purchases)
+    importer.start()
+    try:
+        started.wait(5)
+        with make_groc(groc_dir) as g:
+            g.backup_db(dest, pages=1, sleep=0.001)
+    finally:
+        done.set()
+        importer.join()
+
+    conn = sqlite3.connect(dest)
+    assert conn.execute('PRAGMA integrity_check;').fetchone()[0] == 'ok'
+    count, max_id = conn.execute(
+        'SELECT COUNT(*), MAX(id) FROM purchase;').fetchone()
+    # Every purchase up to the snapshot, none missing in between
+    assert count == max_id
+    assert 50 < count < count_purchases(str(groc_dir / 'groc.db'))
+
+
+def test_cli_backup(groc_dir, tmp_path):
+    dest = str(tmp_path / 'backup.db.gz')
+    runner = CliRunner()
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(groc_dir)):
+        result = runner.invoke(groc_cli, ['backup', dest])
+        assert result.exit_code == 0
+        assert f'to {dest}.' in result.output
+
+        result = runner.invoke(groc_cli, ['restore', dest], input='n\n')
+        assert result.exit_code == 1
+        assert 'Restore will replace 50 purchase entries.' in result.output
+
+        result = runner.invoke(groc_cli, ['restore', dest, '--yes'])
+        assert result.exit_code == 0
+        assert f'from {dest}.' in result.output
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from groc import batch, exceptions
+from groc.cli import groc_entrypoint as groc_cli
+
+
+def run_batch(lines, *options):
+    result = CliRunner().invoke(groc_cli, ['batch', *options, '-'],
+                                input='\n'.join(lines))
+    return result, [json.loads(line) for line in result.output.splitlines()]
+
+
+def test_parse_line():
+    assert batch.parse_line(
+        'add --store "Store Foo" --total 20  # comment') == (
+        'add', ['--store', 'Store Foo', '--total', '20'])
+    assert batch.parse_line(
+        '{"command": "delete", "id": [1, 2], "dry_run": true, '
+        '"verbose": false}') == (
+        'delete', ['--id', '1', '--id', '2', '--dry-run'])
+    assert batch.parse_line('  # comment') is None
+
+    for line in ['reset', '{"id": 1}', '{"command": ', 'add "Store']:
+        with pytest.raises(exceptions.BatchError):
+            batch.parse_line(line)
+
+
+def test_batch(groc_db):
+    result, lines = run_batch([
+        'add --store "Store Foo" --total 20.00 --date 2019-01-01',
+        '{"command": "add", "store": "Store Bar", "total": 5.5, '
+        '"date": "2019-01-03", "description": "bars"}',
+        'add --store "Store Foo" --total 20.00 --date 2019-01-01',
+        '',
+        'list --month 01 --year 2019 --all',
+        'breakdown -m 01 -y 2019',
+        'delete --id 1 --id 99',
+        'list --limit abc',
+        'export',
+    ])
+    assert result.exit_code == 1
+    assert [(line['line'], line['ok']) for line in lines] == [
+        (1, True), (2, True), (3, False), (5, True), (6, True), (7, True),
+        (8, False), (9, True)]
+
+    assert lines[0]['result'] == {'added': 1}
+    assert 'Duplicate purchase' in lines[2]['error']
+    assert [row['store'] for row in lines[3]['result']['purchases']] == [
+        'Store Bar', 'Store Foo']
+    assert lines[4]['result']['months'][0]['purchase count'] == 2
+    assert lines[5]['result'] == {'deleted': [1], 'dry_run': False}
+    assert 'abc' in lines[6]['error']
+    assert lines[7]['result'] == {'purchases': [{
+        'date': '2019-01-03', 'store': 'Store Bar', 'total': '5.50',
+        'description': 'bars'}]}
+
+
+def test_batch_transaction(groc_db):
+    add_lines = ['add --store "Store Foo" --total 1 --date 2019-01-01',
+                 'add --store "Store Foo" --total 2 --date 2019-01-02']
+
+    result, lines = run_batch(add_lines + [add_lines[0], add_lines[1]],
+                              '--transaction')
+    assert result.exit_code == 1
+    assert [line.get('ok') for line in lines] == [True, True, False, None]
+    assert lines[-1] == {'transaction': 'rolled back'}
+
+    result, lines = run_batch(add_lines + ['list'], '--transaction')
+    assert result.exit_code == 0
+    # Reports see the writes of the transaction
+    assert len(lines[2]['result']['purchases']) == 2
+    assert lines[-1] == {'transaction': 'committed'}
+
+    result = CliRunner().invoke(groc_cli, ['export'])
+    assert result.output == ('Date,Store,Total,Description\n'
+                             '2019-01-02,Store Foo,2.00,\n'
+                             '2019-01-01,Store Foo,1.00,\n')
+
+
+def test_batch_import_is_quiet(groc_db, purchase_csv_dir):
+    result, lines = run_batch([f'add --source "{purchase_csv_dir}"'])
+    assert result.exit_code == 0
+    assert [line['result'] for line in lines] == [{'added': 4}]
+    assert 'Importing data' not in result.output
@@ -0,0 +1,55 @@
+import multiprocessing
+import sqlite3
+
+import pytest
+
+from benchmarks import bench
+
+
+def test_percentiles():
+    assert bench.percentiles([i / 1000 for i in range(100, 0, -1)]) == {
+        'p50': 51.0, 'p95': 96.0, 'p99': 100.0}
+    assert bench.percentiles([]) == {'p50': None, 'p95': None, 'p99': None}
+
+
+def test_sample_ids(tmp_path):
+    db_path = str(tmp_path / 'groc.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE purchase (id INTEGER PRIMARY KEY);')
+    assert bench.sample_ids(db_path, 5) == []
+    conn.executemany('INSERT INTO purchase (id) VALUES (?);',
+                     [(i,) for i in range(1, 101) if i % 10])
+    conn.commit()
+    conn.close()
+
+    ids = bench.sample_ids(db_path, 20, seed=1)
+    assert len(ids) <= 20 and len(set(ids)) == len(ids)
+    assert all(1 <= i <= 99 and i % 10 for i in ids)
+    assert ids == bench.sample_ids(db_path, 20, seed=1)
+
+
+def failing_bench_size(size, repeat, seed):
+    raise ValueError('boom')
+
+
+def test_run_reports_failed_child(monkeypatch):
+    if multiprocessing.get_start_method() != 'fork':
+        pytest.skip('children only run the patched function when forked')
+    monkeypatch.setattr(bench, 'bench_size', failing_bench_size)
+    with pytest.raises(RuntimeError, match='exit code 1'):
+        bench.run([10])
+
+
+def test_compare():
+    baseline = {'results': {'10000': {
+        'import_rows_per_sec': 1000, 'validate_rows_per_sec': 1000,
+        'list_ms': {'p50': 1.0, 'p95': 2.0}}}}
+    results = {'results': {
+        '10000': {'import_rows_per_sec': 950, 'validate_rows_per_sec': 800,
+                  'list_ms': {'p50': 1.05, 'p95': 3.0}},
+        '1000000': {'import_rows_per_sec': 10}}}
+
+    assert bench.compare(results, baseline, 0.1) == [
+        '10000 rows: validate_rows_per_sec 800 < baseline 1,000',
+        '10000 rows: list_ms p95 3.0ms > baseline 2.0ms']
+    assert bench.compare(results, baseline, 0.5) == []
@@ -0,0 +1,181 @@
+import json
+from unittest import mock
+
+from click.testing import CliRunner
+
+from groc import cache, db
+from groc.cli import groc_entrypoint as groc_cli
+from groc.models import Groc
+
+
+def make_groc(groc_dir, **kwargs):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(groc_dir)):
+        return Groc(**kwargs)
+
+
+def add_purchase(g, total, date='2019-01-01'):
+    g.add_purchase_manual({
+        'date': date,
+        'store': 'Store Foo',
+        'total': str(total),
+        'description': None
+    }, False)
+
+
+def test_data_version_bumped_by_changes(tmp_path):
+    with make_groc(tmp_path / 'groc') as g:
+        g.init_groc()
+        conn = g._writer()
+        db_id, version = db.select_data_version(conn)
+
+        add_purchase(g, 1)
+        add_purchase(g, 2)
+        assert db.select_data_version(conn) == (db_id, version + 2)
+
+        g.delete_purchase([1])
+        assert db.select_data_version(conn) == (db_id, version + 3)
+
+
+def test_data_version_bumped_once_per_write(tmp_path, purchase_csv_dir):
+    with make_groc(tmp_path / 'groc') as g:
+        g.init_groc()
+        conn = g._writer()
+        assert not conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            "AND name LIKE '%data_version';").fetchall()
+        db_id, version = db.select_data_version(conn)
+
+        assert g.add_purchase_path(str(purchase_csv_dir), False) == 4
+        assert db.select_data_version(conn) == (db_id, version + 1)
+
+        with g.transaction():
+            add_purchase(g, 1, '2019-03-01')
+            add_purchase(g, 2, '2019-03-02')
+        assert db.select_data_version(conn) == (db_id, version + 2)
+
+        g.clear_db()
+        assert db.select_data_version(conn) == (db_id, version + 3)
+
+
+def test_reports_served_from_cache(tmp_path):
+    groc_dir = tmp_path / 'groc'
+    with make_groc(groc_dir) as g:
+        g.init_groc()
+        add_purchase(g, 1)
+
+    with make_groc(groc_dir, cache=True) as g:
+        rows = [dict(row) for row in g.breakdown(['01'], ['2019'])]
+        assert g.select_purchase_count() == 1
+
+        with mock.patch('groc.models.db.select_count_total_per_month') as query:
+            cursor = g.breakdown(['01'], ['2019'])
+            assert [dict(row) for row in cursor] == rows
+            assert not query.called
+        assert g.cache_stats()['hits'] == 1
+
+        # A write invalidates the cached results
+        add_purchase(g, 2)
+        assert g.select_purchase_count() == 2
+        assert g.breakdown(['01'], ['2019']).fetchone()['purchase count'] == 2
+
+    # Reused by the next process
+    with make_groc(groc_dir, cache=True) as g:
+        assert g.select_purchase_count() == 2
+        assert g.cache_stats()['hits'] == 1
+
+
+def test_restored_database_gets_new_id(tmp_path):
+    groc_dir = tmp_path / 'groc'
+    dest = str(tmp_path / 'backup.db')
+    with make_groc(groc_dir, cache=True) as g:
+        g.init_groc()
+        add_purchase(g, 1)
+        g.backup_db(dest)
+        db_id, _ = db.select_data_version(g._writer())
+
+        add_purchase(g, 2)
+        assert g.select_purchase_count() == 2
+        g.restore_db(dest)
+        assert db.select_data_version(g._writer())[0] != db_id
+        assert g.select_purchase_count() == 1
+
+
+def test_lru_eviction(tmp_path):
+    size = len(json.dumps({'value': 'x' * 100}))
+    result_cache = cache.ResultCache(str(tmp_path / 'cache.db'), size * 2)
+    result_cache.put('a', '1', 'x' * 100)
+    result_cache.put('b', '1', 'x' * 100)
+    assert result_cache.get('a', '1') == (True, 'x' * 100)
+
+    # b is the least recently used entry now
+    result_cache.put('c', '1', 'x' * 100)
+    assert result_cache.get('b', '1') == (False, None)
+    assert result_cache.get('a', '1')[0]
+    assert result_cache.get('c', '2') == (False, None)
+    assert result_cache.stats() == {
+        'hits': 2, 'misses': 2, 'entries': 2, 'size': size * 2}
+    result_cache.close()
+
+
+def test_results_stored_as_json(tmp_path):
+    groc_dir = tmp_path / 'groc'
+    with make_groc(groc_dir, cache=True) as g:
+        g.init_groc()
+        add_purchase(g, 1)
+        rows = [dict(row) for row in g.list_purchases_limit(10)]
+        assert g.select_purchase_count() == 1
+
+    conn = db.create_connection(str(groc_dir / 'cache.db'), migrate=False)
+    values = [json.loads(row['value'])
+              for row in conn.execute('SELECT value FROM cache;')]
+    assert {'value': 1} in values
+    assert {'columns': list(rows[0]),
+            'rows': [list(row.values()) for row in rows]} in values
+
+    # Anything else in the cache file is a miss, never loaded as code
+    with conn:
+        conn.execute('UPDATE cache SET value = ?;',
+                     (b'cos\nsystem\n(S"echo hi"\ntR.',))
+    conn.close()
+    with make_groc(groc_dir, cache=True) as g:
+        assert [dict(row) for row in g.list_purchases_limit(10)] == rows
+        assert g.select_purchase_count() == 1
+        assert g.cache_stats()['hits'] == 0
+
+
+def test_large_results_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'MAX_ROWS', 2)
+    groc_dir = tmp_path / 'groc'
+    with make_groc(groc_dir, cache=True) as g:
+        g.init_groc()
+        for total in range(1, 4):
+            add_purchase(g, total)
+
+        # Rows past MAX_ROWS are read from the query cursor
+        cursor = g.list_purchases_limit(10)
+        assert cursor.fetchone()['id'] == 3
+        assert [row['id'] for row in cursor.fetchmany(2)] == [2, 1]
+        assert cursor.fetchall() == []
+        assert g.cache_stats()['entries'] == 0
+
+        assert len(g.list_purchases_limit(2).fetchall()) == 2
+        assert g.cache_stats()['entries'] == 1
+
+
+def test_cli_verbose_cache_stats(tmp_path, monkeypatch):
+    groc_dir = tmp_path / 'groc'
+    with make_groc(groc_dir) as g:
+        g.init_groc()
+        add_purchase(g, 1)
+
+    monkeypatch.setenv('GROC_DB', str(groc_dir / 'groc.db'))
+    runner = CliRunner()
+    runner.invoke(groc_cli, ['breakdown', '-m', '01', '-y', '2019'])
+    result = runner.invoke(groc_cli,
+                           ['breakdown', '-m', '01', '-y', '2019', '--verbose'])
+    assert result.exit_code == 0
+    assert 'Cache: 2 hit(s), 0 miss(es), 2 entries' in result.output
+
+    result = runner.invoke(groc_cli, ['--no-cache', 'breakdown', '--verbose'])
+    assert 'Cache:' not in result.output
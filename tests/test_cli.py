@@ -2,13 +2,21 @@ import copy
 import datetime
 from unittest import mock
 
+import pytest
 from click.testing import CliRunner
 from prettytable import from_db_cursor
 
+from groc import migrations
 from groc.cli import groc_entrypoint as groc_cli
 from groc.models import Groc
 
 
+@pytest.fixture(autouse=True)
+def no_result_cache(monkeypatch):
+    # Connections are mocked here, keep the cache out of the way
+    monkeypatch.setenv('GROC_CACHE', '0')
+
+
 @mock.patch('groc.cli.Groc._get_db_url')
 @mock.patch('groc.cli.Groc._get_connection')
 @mock.patch('groc.cli.Groc.groc_dir_exists', return_value=True, autospec=True)
@@ -524,3 +532,100 @@ def test_add_date_field_only():
     assert result.output == 'Error: Illegal usage: date ' \
                             'requires arguments:' \
                             ' [total, store]\n'
+
+
+@mock.patch('groc.cli.Groc._get_db_url')
+@mock.patch('groc.cli.Groc._get_connection')
+def test_migrate_up_to_date(groc_connection, groc_db_url,
+                            connection_function_scope):
+    groc_connection.return_value = connection_function_scope
+    latest = migrations.LATEST_VERSION
+
+    runner = CliRunner()
+    result = runner.invoke(groc_cli, ['migrate', '--status'])
+    assert result.exit_code == 0
+    assert result.output == (f'Schema version {latest} (latest {latest}).\n'
+                             'Database is up to date.\n')
+
+
+@mock.patch('groc.cli.Groc._get_db_url')
+@mock.patch('groc.cli.Groc._get_connection')
+def test_maintenance(groc_connection, groc_db_url, connection_function_scope):
+    groc_connection.return_value = connection_function_scope
+
+    runner = CliRunner()
+    result = runner.invoke(groc_cli, ['maintenance'])
+    assert result.exit_code == 0
+    assert result.output.startswith('Before maintenance\nDatabase size: ')
+    assert 'Analyzed 3 table(s).\n' in result.output
+    assert 'Reclaimed 0 free page(s).\n' in result.output
+    assert 'Integrity check ok.\n' in result.output
+    assert 'After maintenance\n' in result.output
+
+
+def test_db_option(tmp_path):
+    db_path = str(tmp_path / 'groc.db')
+    runner = CliRunner()
+
+    result = runner.invoke(groc_cli, ['--db', db_path, 'init'])
+    assert result.exit_code == 0
+
+    result = runner.invoke(
+        groc_cli, ['--in-memory', 'add', '--store', 'Store Foo',
+                   '--total', '1.00', '--date', '2019-01-01'],
+        env={'GROC_DB': db_path})
+    assert result.exit_code == 0
+
+    result = runner.invoke(groc_cli, ['--db', db_path, 'list'])
+    assert result.exit_code == 0
+    assert 'Store Foo' in result.output
+
+
+def test_format_import_progress():
+    from groc.cli import format_import_progress
+
+    assert format_import_progress(0, 0, 4 * 1024 ** 2, 0) == (
+        'Importing   0.0% (0 B of 4.0 MB), 0 rows')
+    assert format_import_progress(5000, 1024 ** 2, 4 * 1024 ** 2, 2) == (
+        'Importing  25.0% (1.0 MB of 4.0 MB), 5,000 rows, 2,500 rows/s, '
+        '0.5 MB/s, ETA 0:00:06')
+    # Finished, no ETA
+    assert format_import_progress(10, 100, 100, 1) == (
+        'Importing 100.0% (100 B of 100 B), 10 rows, 10 rows/s, 0.0 MB/s')
+
+
+def test_import_progress_newline_when_finished(monkeypatch):
+    from groc import cli
+
+    monkeypatch.setattr(cli.sys.stderr, 'isatty', lambda: True)
+    with mock.patch('groc.cli.click.echo') as echo:
+        progress = cli.import_progress(interval=0)
+        # Read ahead to the end of the file before its last rows
+        progress(1000, 100, 100, False)
+        progress(2000, 100, 100, False)
+        progress(3000, 100, 100, True)
+        # Only ends the line if it is up to date
+        progress(3000, 100, 100, False)
+        progress(3000, 100, 100, True)
+    calls = echo.call_args_list
+    assert [call.kwargs['nl'] for call in calls[:3]] == [False, False, True]
+    assert '3,000 rows' in calls[2].args[0]
+    assert calls[4] == mock.call(err=True)
+
+
+def test_add_clears_progress_on_error(groc_db, tmp_path, monkeypatch):
+    from groc import cli, db
+
+    monkeypatch.setattr(db, 'PROGRESS_ROWS', 1)
+    path = tmp_path / 'purchases.csv'
+    path.write_text('Date,Store,Total,Description\n'
+                    '2019-01-01,Store Foo,20.00,cake\n'
+                    '2019-01-01,Store Foo,20.00,cake\n')
+    drawn = []
+    monkeypatch.setattr(cli, 'import_progress',
+                        lambda: lambda *args: drawn.append(args))
+    result = CliRunner().invoke(groc_cli, ['add', '--source', str(path)],
+                                color=True)
+    assert result.exit_code != 0
+    assert drawn and not drawn[-1][3]
+    assert '\r\x1b[K' in result.output
@@ -90,7 +90,7 @@ def test_create_connection(tmp_path):
 
 
 def test_setup_db():
-    """ Test that setup created 3 tables """
+    """ Test that setup created 4 tables """
     connection = db.create_connection(':memory:')
     cur = connection.cursor()
 
@@ -102,7 +102,7 @@ def test_setup_db():
 
     # Select table names and count them after set up
     after_tables = cur.execute(db.sqlite_list_tables).fetchall()
-    assert len(after_tables) == 3
+    assert len(after_tables) == 4
 
     cur.close()
     connection.close()
@@ -179,7 +179,8 @@ def test_select_purchase_ids(
     selected_ids = db.select_purchase_ids(
         connection_function_scope, purchase_ids).fetchall()
     assert len(selected_ids) == 9
-    assert res == selected_ids
+    # Row order is up to the query planner (purchase has covering indexes)
+    assert sorted(purchase_ids) == sorted(row['id'] for row in selected_ids)
 
     # Delete a purchase, select original group of ids with db function
     cursor.execute('DELETE FROM purchase WHERE id=?', (purchase_ids[0],))
@@ -461,6 +462,29 @@ def test_insert_from_csv_dict(connection_function_scope, create_purchase_csvs):
     assert db_count['COUNT(*)'] == 4
 
 
+def test_insert_from_csv_dict_progress(connection_function_scope,
+                                      create_purchase_csvs, capsys,
+                                      monkeypatch):
+    """ Progress is reported instead of the per file messages """
+    monkeypatch.setattr(db, 'PROGRESS_ROWS', 1)
+    calls = []
+    count = db.insert_from_csv_dict(
+        connection_function_scope, create_purchase_csvs,
+        progress=lambda *args: calls.append(args))
+    assert count == 4
+
+    total = sum(len(open(path).read()) for path in create_purchase_csvs)
+    rows = [rows for rows, _, _, _ in calls]
+    assert rows == [1, 2, 2, 3, 4, 4, 4]
+    # Finished only once, after the last file
+    assert [finished for _, _, _, finished in calls] == [False] * 6 + [True]
+    assert calls[-1] == (4, total, total, True)
+    assert all(total_bytes == total for _, _, total_bytes, _ in calls)
+    bytes_read = [bytes_read for _, bytes_read, _, _ in calls]
+    assert bytes_read == sorted(bytes_read)
+    assert capsys.readouterr().out == ''
+
+
 def test_insert_from_csv_dict_invalid(
     connection_function_scope,
     create_invalid_purchase_csvs
@@ -482,3 +506,81 @@ def test_test_open_files_fail(connection_function_scope, tmp_path):
             connection_function_scope, [filepath]
         )
     assert f'Error reading file: {filepath.resolve()}' in e.__str__()
+
+
+def test_create_connection_read_only(tmp_path):
+    db_url = str(tmp_path / "groc_test.db")
+    conn = db.create_connection(db_url)
+    db.setup_db(conn)
+
+    ro_conn = db.create_connection(db_url, read_only=True)
+    assert ro_conn.execute('SELECT COUNT(*) FROM purchase;').fetchone()[0] == 0
+    with pytest.raises(sqlite3.OperationalError):
+        ro_conn.execute("INSERT INTO store (name) VALUES ('Store Foo');")
+
+
+def test_query_does_not_commit(connection_function_scope):
+    conn = connection_function_scope
+    conn.execute("INSERT INTO store (name) VALUES ('Store Foo');")
+    assert conn.in_transaction
+
+    db.query(conn, db.sql_count_store_table)
+    assert conn.in_transaction
+    conn.rollback()
+
+
+def test_read_snapshot_is_consistent(tmp_path):
+    db_url = str(tmp_path / "groc_test.db")
+    writer = db.create_connection(db_url)
+    db.setup_db(writer)
+    reader = db.create_connection(db_url)
+
+    with db.read_snapshot(reader):
+        before = db.select_purchase_count(reader).fetchone()['purchase_count']
+        db.validate_insert_row(writer, {
+            'date': '2019-01-01',
+            'store': 'Store Foo',
+            'total': '1.00',
+            'description': None
+        })
+        during = db.select_purchase_count(reader).fetchone()['purchase_count']
+
+    after = db.select_purchase_count(reader).fetchone()['purchase_count']
+    assert before == during == 0
+    assert after == 1
+    assert not reader.in_transaction
+
+
+def test_iter_rows(
+    connection_function_scope,
+    stores_and_purchases_function_scope
+):
+    cursor = db.get_purchases_limit(connection_function_scope, 10)
+    rows = list(db.iter_rows(cursor, batch_size=2))
+    assert len(rows) == 9
+
+
+def test_purchase_year_month_columns(
+    connection_function_scope,
+    stores_and_purchases_function_scope
+):
+    """ Integer year/month are derived from purchase_date """
+    rows = connection_function_scope.execute(
+        """SELECT purchase_year, purchase_month FROM purchase
+        WHERE purchase_date = '2018-02-10';""").fetchall()
+    assert [tuple(row) for row in rows] == [(2018, 2)]
+
+
+def test_sidecar_path(monkeypatch, tmp_path):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    default = db.default_db_path()
+    assert default == str(tmp_path / '.groc' / 'groc.db')
+    assert db.sidecar_path(None, 'lock', 'groc.lock') == str(
+        tmp_path / '.groc' / 'groc.lock')
+    assert db.sidecar_path(default, 'archive.db') == str(
+        tmp_path / '.groc' / 'archive.db')
+    assert db.sidecar_path(str(tmp_path / 'a.db'), 'cache.db') == str(
+        tmp_path / 'a.cache.db')
+    # Named groc.db, but not the default database
+    assert db.sidecar_path(str(tmp_path / 'groc.db'), 'partitions') == str(
+        tmp_path / 'groc.partitions')
@@ -0,0 +1,62 @@
+import csv
+import datetime
+import io
+
+from click.testing import CliRunner
+
+from groc import generate
+from groc.cli import groc_entrypoint as groc_cli
+
+
+def test_purchase_generator():
+    purchases = [p for chunk in generate.PurchaseGenerator(
+        seed=1, stores=5, null_ratio=0.5).purchases(1000, chunk_size=300)
+        for p in chunk]
+    assert len(purchases) == 1000
+    assert purchases == [p for chunk in generate.PurchaseGenerator(
+        seed=1, stores=5, null_ratio=0.5).purchases(1000, chunk_size=300)
+        for p in chunk]
+
+    assert len({p.store for p in purchases}) == 5
+    assert all(generate.DEFAULT_START <= p.date <= generate.DEFAULT_END
+               for p in purchases)
+    assert all(isinstance(p.total, int) and p.total > 0 for p in purchases)
+    assert 400 < sum(p.description is None for p in purchases) < 600
+
+
+def test_duplicates_and_unicode():
+    dates, stores, totals, descriptions = next(generate.PurchaseGenerator(
+        duplicate_ratio=0.2, unicode_ratio=1).columns(1000))
+    rows = list(zip(dates, stores, totals, descriptions))
+    assert len(rows) - len(set(rows)) >= 200
+    assert all(not store.isascii() for store in stores)
+
+
+def test_write_csv():
+    file = io.StringIO(newline='')
+    generator = generate.PurchaseGenerator(
+        start=datetime.date(2019, 1, 1), end=datetime.date(2019, 1, 31))
+    assert generator.write_csv(file, 50) == 50
+
+    rows = list(csv.DictReader(io.StringIO(file.getvalue())))
+    assert len(rows) == 50
+    assert all(row['Date'].startswith('2019-01-') for row in rows)
+    assert all('.' in row['Total'] for row in rows)
+
+
+def test_gen_cli(groc_db):
+    runner = CliRunner()
+
+    result = runner.invoke(groc_cli, ['gen', '-n', '20', '--seed', '3'])
+    assert result.exit_code == 0
+    assert result.output.count('\n') == 21
+    assert result.output == runner.invoke(
+        groc_cli, ['gen', '-n', '20', '--seed', '3']).output
+
+    result = runner.invoke(groc_cli, ['gen', '-n', '500', '--insert'])
+    assert result.exit_code == 0
+    assert result.output == '500 purchase(s) added\n'
+
+    result = runner.invoke(groc_cli, ['gen', '--start', '2019-02-01',
+                                      '--end', '2019-01-01'])
+    assert result.exit_code == 2
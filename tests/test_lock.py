@@ -0,0 +1,179 @@
+import multiprocessing
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from groc import db, exceptions
+from groc.models import Groc
+from groc.lock import WriterLock
+
+
+def insert_purchases(db_path, lock_path, worker, count):
+    """ Insert purchases from a separate process, queueing on the writer lock. """
+    conn = db.create_connection(db_path)
+    for i in range(count):
+        with WriterLock(lock_path):
+            db.validate_insert_row(conn, {
+                'date': '2019-01-01',
+                'store': f'Store {worker}',
+                'total': str(i + 1),
+                'description': f'purchase {i}'
+            })
+    conn.close()
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    db_path = str(tmp_path / 'groc.db')
+    conn = db.create_connection(db_path)
+    db.setup_db(conn)
+    conn.close()
+    return db_path
+
+
+def test_writer_lock_is_reentrant(tmp_path):
+    lock = WriterLock(str(tmp_path / 'groc.lock'))
+    with lock:
+        with lock:
+            assert lock._depth == 2
+        assert lock._depth == 1
+    assert lock._fd is None
+
+
+def test_writer_lock_serializes_threads(tmp_path):
+    """ Threads sharing a WriterLock hold it one at a time """
+    lock = WriterLock(str(tmp_path / 'groc.lock'))
+    holders, overlaps = [], []
+
+    def write():
+        for _ in range(10):
+            with lock:
+                with lock:
+                    holders.append(threading.get_ident())
+                    if len(holders) > 1:
+                        overlaps.append(len(holders))
+                    time.sleep(0.001)
+                    holders.remove(threading.get_ident())
+
+    threads = [threading.Thread(target=write) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not overlaps
+    assert lock._depth == 0 and lock._fd is None
+
+
+def test_writer_lock_thread_timeout(tmp_path):
+    """ Another thread waits for the lock no longer than the timeout """
+    lock = WriterLock(str(tmp_path / 'groc.lock'), timeout=0.1)
+    errors = []
+
+    def write():
+        try:
+            with lock:
+                pass
+        except exceptions.DatabaseLockedError as e:
+            errors.append(e)
+        # Releasing from a thread not holding the lock does nothing
+        lock.release()
+
+    with lock:
+        thread = threading.Thread(target=write)
+        thread.start()
+        thread.join()
+        assert lock._depth == 1
+
+    assert len(errors) == 1
+
+
+def test_shared_groc_single_writer(tmp_path):
+    """ Threads sharing a Groc are inside its writer lock one at a time """
+    g = Groc(str(tmp_path / 'groc.db'))
+    g.init_groc()
+    writers, overlaps = [], []
+
+    def write(worker):
+        for i in range(5):
+            with g._writer_lock():
+                writers.append(worker)
+                if len(writers) > 1:
+                    overlaps.append(len(writers))
+                g.add_purchase_manual({
+                    'date': '2019-01-01', 'store': f'Store {worker}',
+                    'total': str(i + 1), 'description': None}, False)
+                writers.remove(worker)
+
+    threads = [threading.Thread(target=write, args=(worker,))
+               for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    g.close()
+
+    assert not overlaps
+    conn = db.create_connection(str(tmp_path / 'groc.db'))
+    assert conn.execute('SELECT COUNT(*) FROM purchase;').fetchone()[0] == 40
+
+
+def test_writer_lock_timeout(tmp_path):
+    lock_path = str(tmp_path / 'groc.lock')
+    with WriterLock(lock_path):
+        # flock locks are per open file description, so a second
+        # WriterLock contends even within the same process.
+        with pytest.raises(exceptions.DatabaseLockedError):
+            with WriterLock(lock_path, timeout=0.1):
+                pass
+
+
+def test_parallel_writers(db_file, tmp_path):
+    """ Several processes hammering the same db all succeed """
+    lock_path = str(tmp_path / 'groc.lock')
+    workers, count = 4, 25
+
+    processes = [
+        multiprocessing.Process(target=insert_purchases,
+                                args=(db_file, lock_path, worker, count))
+        for worker in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    conn = db.create_connection(db_file)
+    res = conn.execute('SELECT COUNT(*) FROM purchase;').fetchone()
+    assert res[0] == workers * count
+
+
+def test_locked_database_raises_locked_error(db_file, monkeypatch):
+    """ Contention surfaces as DatabaseLockedError after retrying """
+    monkeypatch.setattr(db, 'LOCK_RETRIES', 1)
+    monkeypatch.setattr(db, 'LOCK_RETRY_BACKOFF', 0.01)
+
+    holder = sqlite3.connect(db_file)
+    holder.execute('BEGIN IMMEDIATE;')
+
+    conn = db.create_connection(db_file, busy_timeout=0.01)
+    with pytest.raises(exceptions.DatabaseLockedError):
+        db.validate_insert_row(conn, {
+            'date': '2019-01-01',
+            'store': 'Store Foo',
+            'total': '1.00',
+            'description': None
+        })
+    with pytest.raises(exceptions.DatabaseLockedError):
+        db.delete_from_db(conn, [1])
+
+    holder.rollback()
+    assert db.validate_insert_row(conn, {
+        'date': '2019-01-01',
+        'store': 'Store Foo',
+        'total': '1.00',
+        'description': None
+    })
@@ -0,0 +1,64 @@
+import pytest
+
+from groc import db, maintenance
+
+
+@pytest.fixture
+def file_connection(tmp_path):
+    conn = db.create_connection(str(tmp_path / 'groc.db'))
+    db.setup_db(conn)
+    with conn:
+        conn.execute("INSERT INTO store (name) VALUES ('Store Foo');")
+        conn.executemany(
+            """INSERT INTO purchase (purchase_date, total, description, store_id)
+            VALUES (?, ?, ?, 1)""",
+            [('2019-01-01', i, 'x' * 200) for i in range(2000)])
+    yield conn
+    conn.close()
+
+
+def test_db_stats(file_connection):
+    stats = maintenance.db_stats(file_connection)
+    assert stats['size'] == stats['page_size'] * stats['page_count']
+    assert stats['freelist_count'] == 0
+    assert stats['auto_vacuum'] == 'none'
+    assert 0 <= stats['fragmentation'] <= 1
+
+    names = {obj['name'] for obj in stats['objects']}
+    assert {'store', 'purchase'} <= names
+
+
+def test_analyze(file_connection):
+    analyzed = maintenance.analyze(file_connection)
+    assert {'store', 'purchase'} <= set(analyzed)
+    assert file_connection.execute(
+        "SELECT COUNT(*) FROM sqlite_stat1 WHERE tbl='purchase';"
+    ).fetchone()[0]
+
+
+def test_analyze_time_budget(file_connection):
+    assert maintenance.analyze(file_connection, time_budget=0) == []
+
+
+def test_incremental_vacuum(file_connection):
+    # Without incremental auto vacuum nothing is reclaimed
+    with file_connection:
+        file_connection.execute('DELETE FROM purchase WHERE total < 1000;')
+    assert maintenance.incremental_vacuum(file_connection) == 0
+
+    maintenance.enable_incremental_vacuum(file_connection)
+    assert maintenance.db_stats(file_connection)['auto_vacuum'] == 'incremental'
+
+    with file_connection:
+        file_connection.execute('DELETE FROM purchase;')
+    free = maintenance.db_stats(file_connection)['freelist_count']
+    assert free
+
+    reclaimed = maintenance.incremental_vacuum(file_connection, pages=10)
+    assert reclaimed == free
+    assert maintenance.db_stats(file_connection)['freelist_count'] == 0
+
+
+def test_integrity_check(file_connection):
+    assert maintenance.integrity_check(file_connection) == []
+    assert maintenance.integrity_check(file_connection, full=True) == []
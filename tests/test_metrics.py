@@ -0,0 +1,104 @@
+import json
+from unittest import mock
+
+import pytest
+from click.testing import CliRunner
+
+from groc import db, exceptions, metrics
+from groc.cli import groc_entrypoint as groc_cli
+
+
+CSV = ('Date,Store,Total,Description\n'
+       '2019-01-01,Store Foo,20.00,cake\n'
+       '2019-01-02,Store Foo,15.50,\n'
+       '2019-01-01,Store Foo,20.00,cake\n')
+
+
+@pytest.fixture
+def collector():
+    yield metrics.enable(metrics.Metrics('add'))
+    metrics.disable()
+
+
+def test_import_counters(collector, tmp_path):
+    path = tmp_path / 'purchases.csv'
+    path.write_text(CSV)
+    conn = db.create_connection(':memory:')
+    db.setup_db(conn)
+    commits = collector.counters['commits']
+    assert 'insert' not in collector.snapshot()['statements']
+
+    assert db.insert_from_csv_dict(conn, [str(path)], True) == 2
+    path.write_text(CSV + '2019-01-03,Store Foo,abc,\n')
+    with pytest.raises(exceptions.GrocException):
+        db.insert_from_csv_dict(conn, [str(path)], True)
+
+    snapshot = collector.snapshot(db.MEMORY_DB)
+    assert snapshot['rows_read'] == 7
+    assert snapshot['rows_inserted'] == 2
+    assert snapshot['rows_duplicate'] == 4
+    assert snapshot['rows_rejected'] == 1
+    assert snapshot['bytes_read'] == len(CSV) * 2 + 26
+    assert snapshot['import_seconds'] > 0
+    assert snapshot['rows_per_second'] > 0
+    # One transaction per row, ignored duplicates commit their store,
+    # and one data version bump per import
+    assert snapshot['commits'] - commits == 6 + 2
+    # Store and purchase of every valid row
+    assert snapshot['statements']['insert']['count'] == 12
+    assert snapshot['db_size'] is None
+
+
+def test_metrics_disabled():
+    assert metrics.active is None
+    row_inserter = mock.Mock()
+    with mock.patch('groc.db._insert_csv_files') as insert:
+        db.insert_from_csv_dict(None, [], row_inserter=row_inserter)
+    insert.assert_called_once_with([], False, row_inserter, None)
+
+
+def test_write_prometheus(tmp_path):
+    path = tmp_path / 'groc.prom'
+    for command in ['add', 'list', 'add']:
+        collector = metrics.Metrics(command)
+        collector.count('rows_read', 3 if command == 'add' else 0)
+        collector.record('SELECT 1', 0.5)
+        metrics.write_prometheus(str(path), collector.snapshot())
+
+    lines = path.read_text().splitlines()
+    assert lines.count('# TYPE groc_rows_read gauge') == 1
+    assert 'groc_rows_read{command="add"} 3' in lines
+    assert 'groc_rows_read{command="list"} 0' in lines
+    assert lines.count('# TYPE groc_statement_duration_seconds summary') == 1
+    assert len([line for line in lines if line.startswith(
+        'groc_statement_duration_seconds_count{')]) == 2
+    assert ('groc_statement_duration_seconds'
+            '{command="add",kind="select",quantile="0.99"} 0.5') in lines
+    assert ('groc_statement_duration_seconds_sum'
+            '{command="add",kind="select"} 0.5') in lines
+    assert not [line for line in lines if line.startswith('groc_statements')]
+
+
+def test_metrics_cli(groc_db, tmp_path):
+    path = tmp_path / 'groc.jsonl'
+    args = ['--metrics-file', str(path)]
+    runner = CliRunner()
+    assert runner.invoke(groc_cli, args + [
+        'add', '--store', 'Store Foo', '--total', '20']).exit_code == 0
+    for _ in range(2):
+        assert runner.invoke(groc_cli, args + ['breakdown']).exit_code == 0
+    assert metrics.active is None
+
+    add, miss, hit = [json.loads(line)
+                      for line in path.read_text().splitlines()]
+    assert add['command'] == 'add'
+    assert add['commits'] == 1
+    assert add['db_size'] > 0
+    assert miss['cache_hits'] == 0 and miss['cache_misses'] > 0
+    assert hit['cache_hits'] == miss['cache_misses']
+    assert hit['cache_hit_ratio'] == 1.0
+
+    prom = tmp_path / 'groc.prom'
+    assert runner.invoke(groc_cli, ['--metrics-file', str(prom),
+                                    'list']).exit_code == 0
+    assert 'groc_commits{command="list"}' in prom.read_text()
@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+from groc import db, exceptions, migrations
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """ A database created before migrations existed (user_version 0) """
+    db_url = str(tmp_path / 'groc.db')
+    conn = sqlite3.connect(db_url)
+    conn.execute(db.sqlite_create_store_table)
+    conn.execute(db.sqlite_create_purchase_table)
+    conn.execute(db.sqlite_insert_purchase_trigger)
+    conn.execute("INSERT INTO store (name) VALUES ('Store Foo');")
+    conn.executemany(
+        'INSERT INTO purchase (purchase_date, total, store_id) VALUES (?, ?, 1)',
+        [(f'2019-01-{day:02d}', day * 100) for day in range(1, 29)])
+    conn.commit()
+    conn.close()
+    return db_url
+
+
+def test_setup_db_sets_latest_version():
+    conn = db.create_connection(':memory:')
+    assert migrations.get_version(conn) == 0
+    assert not migrations.is_initialized(conn)
+
+    db.setup_db(conn)
+    assert migrations.get_version(conn) == migrations.LATEST_VERSION
+    assert migrations.pending_migrations(conn) == []
+
+
+def test_legacy_db_migrated_on_connect(legacy_db):
+    conn = db.create_connection(legacy_db)
+    assert migrations.get_version(conn) == migrations.LATEST_VERSION
+    assert conn.execute('SELECT COUNT(*) FROM purchase;').fetchone()[0] == 28
+
+    # Existing rows can be found by the integer year/month index
+    jan_2019 = db.get_purchases_date(conn, '01', '2019').fetchall()
+    assert len(jan_2019) == 28
+    assert conn.execute(
+        """SELECT 1 FROM sqlite_master
+        WHERE type='index' AND name='purchase_year_month_idx';""").fetchone()
+
+
+def test_connect_without_migrate(legacy_db):
+    conn = db.create_connection(legacy_db, migrate=False)
+    assert migrations.get_version(conn) == 0
+    assert len(migrations.pending_migrations(conn)) == len(migrations.MIGRATIONS)
+
+
+def test_failed_migration_rolls_back(legacy_db, monkeypatch):
+    bad = migrations.MIGRATIONS + [migrations.Migration(
+        migrations.LATEST_VERSION + 1, 'Broken',
+        ('CREATE TABLE foo (id INTEGER);', 'SELECT * FROM missing_table;'))]
+    monkeypatch.setattr(migrations, 'MIGRATIONS', bad)
+    monkeypatch.setattr(migrations, 'LATEST_VERSION', bad[-1].version)
+
+    conn = db.create_connection(legacy_db, migrate=False)
+    with pytest.raises(exceptions.DatabaseError):
+        migrations.migrate(conn)
+
+    assert migrations.get_version(conn) == bad[-1].version - 1
+    assert not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name='foo';").fetchone()
+
+
+def test_newer_database_rejected(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    conn.execute(f'PRAGMA user_version = {migrations.LATEST_VERSION + 1};')
+    conn.close()
+
+    with pytest.raises(exceptions.DatabaseError):
+        db.create_connection(legacy_db)
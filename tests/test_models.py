@@ -1,4 +1,5 @@
 import sqlite3
+import threading
 from unittest import mock
 
 import pytest
@@ -283,3 +284,148 @@ def test_add_purchase_path_exception(
     with pytest.raises(Exception) as e:
         g.add_purchase_path('foo', False)
     assert "some-path-to-file could not be found!" in str(e.value)
+
+
+@mock.patch('groc.models.os.path.expanduser', return_value='my-groc-dir')
+@mock.patch('groc.models.db.create_connection')
+def test_groc_connects_lazily(mock_create_connection, mock_os_path_expanduser):
+    g = Groc()
+    assert not mock_create_connection.called
+
+    g.select_purchase_count()
+    g.select_purchase_count()
+    assert mock_create_connection.call_count == 1
+
+
+@mock.patch('groc.models.os.path.expanduser', return_value='my-groc-dir')
+@mock.patch('groc.models.db.create_connection')
+def test_groc_context_manager_closes(mock_create_connection,
+                                     mock_os_path_expanduser):
+    with Groc() as g:
+        g.select_purchase_count()
+        assert g.connection is mock_create_connection.return_value
+
+    assert mock_create_connection.return_value.close.called
+    assert g.connection is None
+
+
+@mock.patch('groc.models.os.path.expanduser', return_value='my-groc-dir')
+@mock.patch('groc.models.db.create_connection')
+@mock.patch('groc.models.db.select_purchase_count', autospec=True)
+def test_read_only_reports(mock_purchase_count, mock_create_connection,
+                           mock_os_path_expanduser):
+    g = Groc(read_only_reports=True)
+    g.select_purchase_count()
+    assert mock_create_connection.call_args[1]['read_only'] is True
+
+
+def test_groc_shared_across_threads(tmp_path):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(tmp_path)):
+        g = Groc()
+    g.init_groc()
+    g.add_purchase_manual({'date': '2019-01-01', 'total': '1.00',
+                           'store': 'Store Foo', 'description': None}, False)
+
+    counts = []
+
+    def worker():
+        counts.append(g.select_purchase_count())
+        g._pool.release()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counts == [1] * 8
+
+    # Connections of finished threads are reused, not opened again
+    pool_size = len(g._pool)
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert len(g._pool) == pool_size
+    g.close()
+
+
+@mock.patch('groc.models.db.create_connection')
+def test_db_url(mock_create_connection, tmp_path):
+    db_path = str(tmp_path / 'tenant' / 'foo.db')
+    g = Groc(db_path)
+    assert g.db_url == db_path
+    assert g.groc_dir == str(tmp_path / 'tenant')
+    assert not g.in_memory
+
+    g.select_purchase_count()
+    assert mock_create_connection.call_args[0][0] == db_path
+
+
+def test_memory_db():
+    with Groc(':memory:') as g:
+        assert g.in_memory and g.disk_url is None
+        g.init_groc()
+        g.add_purchase_manual({'date': '2019-01-01', 'total': '1.00',
+                               'store': 'Store Foo', 'description': None}, False)
+
+        # Connections of other threads share the database
+        counts = []
+        thread = threading.Thread(
+            target=lambda: counts.append(g.select_purchase_count()))
+        thread.start()
+        thread.join()
+        assert counts == [1]
+
+        with pytest.raises(exceptions.DatabaseError):
+            g.flush()
+
+
+def test_in_memory_load_and_flush(tmp_path):
+    db_path = str(tmp_path / 'groc.db')
+    row = {'date': '2019-01-01', 'total': '1.00',
+           'store': 'Store Foo', 'description': None}
+
+    with Groc(db_path) as g:
+        g.init_groc()
+        g.add_purchase_manual(dict(row), False)
+
+    # Reads only, nothing is written back
+    with Groc(db_path, in_memory=True) as g:
+        assert g.select_purchase_count() == 1
+        assert not g._dirty
+
+    with Groc(db_path, in_memory=True) as g:
+        g.add_purchase_manual(dict(row, total='2.00'), False)
+        with Groc(db_path) as disk:
+            assert disk.select_purchase_count() == 1
+
+    # Flushed on close
+    with Groc(db_path) as g:
+        assert g.select_purchase_count() == 2
+
+    with Groc(db_path, in_memory=True) as g:
+        g.clear_db()
+        g.flush(str(tmp_path / 'copy.db'))
+        g.load()
+        assert g.select_purchase_count() == 2
+        assert not g._dirty
+
+    with Groc(str(tmp_path / 'copy.db')) as g:
+        assert g.select_purchase_count() == 0
+
+
+def test_transaction_and_snapshot_yield_connection(tmp_path):
+    row = {'date': '2019-01-01', 'total': '1.00', 'store': 'Store Foo',
+           'description': None}
+    with Groc(str(tmp_path / 'groc.db')) as g:
+        g.init_groc()
+        with g.transaction() as conn:
+            g.add_purchase_manual(dict(row), False)
+            assert conn.execute(
+                'SELECT COUNT(*) FROM purchase;').fetchone()[0] == 1
+
+        with g.read_snapshot() as conn:
+            assert conn.in_transaction
+            assert conn.execute(
+                'SELECT COUNT(*) FROM purchase;').fetchone()[0] == 1
@@ -0,0 +1,144 @@
+import os
+from unittest import mock
+
+import pytest
+
+from groc import exceptions, partitions
+from groc.models import Groc, PartitionedGroc
+
+
+PURCHASES = [
+    {'date': '2018-12-30', 'store': 'Store Foo', 'total': '10.00',
+     'description': 'old'},
+    {'date': '2019-01-01', 'store': 'Store Foo', 'total': '20.00',
+     'description': 'fruits'},
+    {'date': '2019-01-03', 'store': 'Store Bar', 'total': '25.00',
+     'description': None},
+    {'date': '2019-02-01', 'store': 'Store Bar', 'total': '5.00',
+     'description': 'bars'},
+]
+
+
+def make_groc(cls, groc_dir, partitioned):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(groc_dir)):
+        g = cls()
+    g.init_groc(partitioned=partitioned)
+    for row in PURCHASES:
+        g.add_purchase_manual(dict(row), False)
+    return g
+
+
+@pytest.fixture
+def plain(tmp_path):
+    with make_groc(Groc, tmp_path / 'plain', False) as g:
+        yield g
+
+
+@pytest.fixture
+def partitioned(tmp_path):
+    with make_groc(PartitionedGroc, tmp_path / 'partitioned', True) as g:
+        yield g
+
+
+def rows(cursor):
+    return [tuple(row)[1:] for row in cursor.fetchall()]
+
+
+def test_purchases_stored_per_year(partitioned):
+    assert partitioned.is_partitioned()
+    assert partitions.partition_years(partitioned.partition_dir) == [2019, 2018]
+    assert partitioned.select_purchase_count() == 4
+    assert partitioned.connection.execute(
+        'SELECT COUNT(*) FROM purchase;').fetchone()[0] == 0
+
+    ids = [row['id'] for row in partitioned.list_purchases_limit(10)]
+    assert sorted(partitions.year_of_id(i) for i in ids) == [
+        2018, 2019, 2019, 2019]
+
+
+def test_reports_match_single_file(plain, partitioned):
+    assert rows(partitioned.list_purchases_limit(3)) == rows(
+        plain.list_purchases_limit(3))
+    assert rows(partitioned.list_purchases_date('01', '2019')) == rows(
+        plain.list_purchases_date('01', '2019'))
+    assert rows(partitioned.list_purchases_date_limit('01', '2019', 1)) == rows(
+        plain.list_purchases_date_limit('01', '2019', 1))
+
+    months, years = ['01', '02', '12'], ['2018', '2019']
+    assert [tuple(r) for r in partitioned.breakdown(months, years)] == [
+        tuple(r) for r in plain.breakdown(months, years)]
+
+
+@pytest.mark.parametrize('limit', [2, 4, 10, -1])
+def test_list_limit_reads_partitions_in_batches(plain, partitioned, limit):
+    with mock.patch('groc.partitions.MAX_ATTACHED', 1):
+        result = rows(partitioned.list_purchases_limit(limit))
+    assert result == rows(plain.list_purchases_limit(limit))
+
+
+def test_only_needed_partitions_attached(partitioned):
+    partitioned.list_purchases_date('01', '2019')
+    attached = [row[1] for row in partitioned.connection.execute(
+        'PRAGMA database_list;')]
+    assert 'p2019' in attached
+    assert 'p2018' not in attached
+
+
+def test_select_and_delete_by_id(partitioned):
+    ids = [row['id'] for row in partitioned.list_purchases_limit(10)]
+    assert len(partitioned.select_by_id(ids).fetchall()) == 4
+    assert len(partitioned.select_purchase_ids(ids + [1]).fetchall()) == 4
+
+    partitioned.delete_purchase(ids[:2])
+    assert partitioned.select_purchase_count() == 2
+
+    partitioned.clear_db()
+    assert partitioned.select_purchase_count() == 0
+    assert partitioned.list_purchases_limit(10).fetchall() == []
+
+
+def test_duplicate_detected_within_partition(partitioned):
+    with pytest.raises(exceptions.DuplicateRow):
+        partitioned.add_purchase_manual(dict(PURCHASES[1]), False)
+
+
+def test_import_routes_by_year(partitioned, create_purchase_csvs):
+    csv_dir = os.path.dirname(create_purchase_csvs[0])
+    partitioned.add_purchase_path(csv_dir, True)
+    # 2019-01-01 Store Foo 20.00 was already added
+    assert partitioned.select_purchase_count() == 4 + 3
+
+
+def test_too_many_partitions(tmp_path):
+    for year in range(2000, 2000 + partitions.MAX_ATTACHED + 1):
+        open(partitions.partition_path(str(tmp_path), year), 'w').close()
+    years = partitions.partition_years(str(tmp_path))
+
+    conn = mock.Mock()
+    with pytest.raises(exceptions.DatabaseError):
+        partitions.attach(conn, str(tmp_path), years)
+
+
+def test_analytics_loads_all_partitions(plain, partitioned):
+    months, years = ['01', '02', '12'], ['2018', '2019']
+    expected = [dict(row) for row in plain.breakdown(months, years)]
+    assert partitioned.analytics(False).breakdown(months, years) == expected
+    assert plain.analytics(False).breakdown(months, years) == expected
+
+
+def test_backup_and_restore_not_supported(partitioned, tmp_path):
+    dest = str(tmp_path / 'backup.db')
+    with pytest.raises(exceptions.DatabaseError, match='Backing up'):
+        partitioned.backup_db(dest)
+    with pytest.raises(exceptions.DatabaseError, match='Restoring'):
+        partitioned.restore_db(dest)
+
+
+def test_search_not_supported(partitioned):
+    assert partitioned.search_index_status() is None
+    for method, args in [(partitioned.build_search_index, ()),
+                         (partitioned.drop_search_index, ()),
+                         (partitioned.search, ('fruits',))]:
+        with pytest.raises(exceptions.DatabaseError, match='Search'):
+            method(*args)
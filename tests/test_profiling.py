@@ -0,0 +1,44 @@
+import pstats
+
+import pytest
+from click.testing import CliRunner
+
+from groc.cli import groc_entrypoint as groc_cli
+
+
+@pytest.fixture
+def work_dir(groc_db, tmp_path, monkeypatch):
+    """ Working directory, where profiles are written by default. """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_profile_cpu(work_dir):
+    # Without a value, before the command name
+    result = CliRunner().invoke(groc_cli, ['--profile', 'breakdown'])
+    assert result.exit_code == 0, result.output
+    assert 'Ordered by: cumulative time' in result.output
+
+    path, = work_dir.glob('groc-breakdown-*.prof')
+    assert f'Profile written to {path.name}' in result.output
+    functions = {name for _, _, name in pstats.Stats(str(path)).stats}
+    assert 'breakdown' in functions
+
+
+@pytest.mark.parametrize('args', [['--profile', 'mem'], ['--profile=mem']])
+def test_profile_mem(work_dir, args):
+    output = work_dir / 'mem.txt'
+    result = CliRunner().invoke(groc_cli, args + [
+        '--profile-output', str(output),
+        'add', '--store', 'Store Foo', '--total', '20'])
+    assert result.exit_code == 0, result.output
+    summary = output.read_text()
+    assert summary.startswith('Peak traced memory: ')
+    assert '\nRetained at exit: ' in summary
+    assert summary.strip() in result.output
+    assert not [*work_dir.glob('groc-*')]
+
+
+def test_profile_invalid(work_dir):
+    result = CliRunner().invoke(groc_cli, ['--profile=disk', 'list'])
+    assert result.exit_code == 2
@@ -0,0 +1,122 @@
+import datetime
+from unittest import mock
+
+import pytest
+
+from groc import db, explain, generate
+from groc.cli import groc_entrypoint
+from groc.models import Groc, PartitionedGroc
+
+
+# Commands explained, with every option changing their SQL
+COMMANDS = [
+    'add --store "Store Foo" --total 20 --date 2019-01-01',
+    'add --store "Store Foo" --total 20 --date 2019-01-01 '
+    '--description cake',
+    'delete --id 1 --id 2',
+    'list',
+    'list --limit 10 --month 01 --year 2019',
+    'list --month 02 --year 2019 --all',
+    'breakdown -m 01 -y 2019',
+    'breakdown -m 01 -m 02 -m 03 -y 2018 -y 2019',
+    'export',
+    'export -m 01 -y 2019',
+]
+ARCHIVE_COMMANDS = [command + ' --include-archive' for command in COMMANDS
+                    if command.startswith(('list', 'breakdown', 'export'))]
+
+# Statements that read every purchase on purpose
+FULL_SCANS_ALLOWED = [db.sql_clear_purchase_table]
+
+
+def fill(g, rows=300):
+    for chunk in generate.PurchaseGenerator(
+            start=datetime.date(2017, 1, 1)).purchases(rows):
+        g.add_purchases(chunk, True)
+
+
+@pytest.fixture
+def groc(tmp_path):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(tmp_path / 'groc')):
+        g = Groc()
+    g.init_groc()
+    fill(g)
+    g.archive(datetime.date(2018, 1, 1))
+    yield g
+    g.close()
+
+
+def explain_all(g, commands):
+    plans = []
+    for command in commands:
+        name, args = explain.batch.parse_line(command)
+        plans.extend(explain.explain_command(g, groc_entrypoint, name, args))
+    return plans
+
+
+def assert_no_full_scans(plans):
+    allowed = [explain.normalize(sql) for sql in FULL_SCANS_ALLOWED]
+    for sql, plan in plans:
+        if sql not in allowed:
+            assert not explain.full_scans(plan, sql), (
+                f'{sql}\n{explain.format_plan(plan, sql)}')
+
+
+def test_full_scans():
+    conn = db.create_connection(':memory:')
+    db.setup_db(conn)
+    sql = "SELECT * FROM purchase p WHERE strftime('%m', p.purchase_date) = ?"
+    plan = explain.query_plan(conn, sql)
+    assert explain.full_scans(plan, sql) == ['SCAN p']
+    assert 'full table scan' in explain.format_plan(plan, sql)
+
+    # Without the year, the year/month index cannot be searched
+    sql = 'SELECT id FROM purchase WHERE purchase_month = 1'
+    plan = explain.query_plan(conn, sql)
+    assert explain.full_scans(plan, sql) == ['SCAN purchase']
+    assert explain.index_searches(plan) == []
+    sql += ' AND purchase_year = 2019'
+    assert explain.index_searches(explain.query_plan(conn, sql)) == [
+        'purchase_year_month_idx']
+
+    # The duplicate check of the insert trigger
+    sql = ('SELECT 1 FROM purchase WHERE purchase_date = ? AND total = ? '
+           'AND store_id = ? AND description IS NULL')
+    assert not explain.full_scans(explain.query_plan(conn, sql), sql)
+
+
+def test_command_plans(groc):
+    plans = explain_all(groc, COMMANDS)
+    assert_no_full_scans(plans)
+
+    statements = dict(plans)
+    month_queries = [sql for sql in statements
+                     if 'purchase_month =' in sql or 'purchase_month IN' in sql]
+    assert len(month_queries) == 5
+    for sql in month_queries:
+        assert explain.index_searches(statements[sql]) == [
+            'purchase_year_month_idx']
+    # The duplicate check against the archive uses its indexes
+    assert any('archive.purchase' in sql for sql in statements)
+
+    # Rolled back
+    assert groc.select_by_id([1, 2]).fetchall()
+
+
+def test_archive_plans(groc):
+    plans = explain_all(groc, ARCHIVE_COMMANDS)
+    assert any('archive.purchase' in sql for sql, _ in plans)
+    assert_no_full_scans(plans)
+
+
+def test_partition_plans(tmp_path):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(tmp_path / 'groc')):
+        Groc().init_groc(partitioned=True)
+        g = PartitionedGroc()
+    fill(g)
+    read_commands = [command for command in COMMANDS
+                     if command.startswith(('list', 'breakdown', 'export'))]
+    assert_no_full_scans(explain_all(g, read_commands))
+    g.close()
@@ -0,0 +1,73 @@
+import datetime
+from unittest import mock
+
+import pytest
+
+from groc import exceptions
+from groc.models import Groc, PartitionedGroc
+from groc.records import Purchase
+
+
+def record(total, date='2019-01-01', store='Store Foo', description=None):
+    return Purchase(None, datetime.date.fromisoformat(date), store, total,
+                    description)
+
+
+@pytest.fixture
+def groc(tmp_path):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(tmp_path / 'groc')):
+        g = Groc()
+    g.init_groc()
+    yield g
+    g.close()
+
+
+@pytest.fixture
+def partitioned_groc(tmp_path):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(tmp_path / 'groc')):
+        Groc().init_groc(partitioned=True)
+        g = PartitionedGroc()
+    yield g
+    g.close()
+
+
+def test_purchase():
+    purchase = record(123456, description='cake')
+    assert purchase['total'] == purchase.total == purchase[3] == 123456
+    assert purchase._replace(total=5).total == 5
+    with pytest.raises(AttributeError):
+        purchase.extra = 1
+
+
+def test_iter_purchases(groc):
+    assert groc.add_purchases([
+        record(2000), record(550, '2019-01-03', 'Store Bar', 'bars'),
+        record(100000, '2019-02-01')], False) == 3
+    with pytest.raises(exceptions.DuplicateRow):
+        groc.add_purchases([record(2000)], False)
+    assert groc.add_purchases([record(2000)], True) == 0
+
+    purchases = list(groc.iter_purchases())
+    assert [p.total for p in purchases] == [100000, 550, 2000]
+    assert purchases[1] == Purchase(
+        purchases[1].id, datetime.date(2019, 1, 3), 'Store Bar', 550, 'bars')
+    assert purchases[2].description is None
+
+    assert [p.total for p in groc.iter_purchases('01', '2019')] == [550, 2000]
+    assert [p.total for p in groc.iter_purchases(limit=1, batch_size=1)] == [
+        100000]
+
+
+def test_iter_purchases_partitioned(partitioned_groc):
+    partitioned_groc.add_purchases([
+        record(100, '2018-05-01'), record(200, '2019-01-01'),
+        record(300, '2019-02-01'), record(400, '2017-01-01')], False)
+
+    assert [p.total for p in partitioned_groc.iter_purchases()] == [
+        300, 200, 100, 400]
+    assert [p.total for p in partitioned_groc.iter_purchases(limit=3)] == [
+        300, 200, 100]
+    assert [p.date.year for p in partitioned_groc.iter_purchases(
+        '05', '2018')] == [2018]
@@ -0,0 +1,160 @@
+import datetime
+from unittest import mock
+
+import pytest
+from click.testing import CliRunner
+
+from groc import db, exceptions, generate, search
+from groc.cli import groc_entrypoint as groc_cli
+from groc.models import Groc, PartitionedGroc
+
+
+PURCHASES = [
+    ('2019-01-01', 'Corner Pharmacy', '12.00', 'vitamins'),
+    ('2019-01-05', 'Store Foo', '20.00', 'birthday cake'),
+    ('2019-02-01', 'Store Bar', '5.00', None),
+    ('2019-03-01', 'Café Olé', '3.50', 'coffee and cake'),
+]
+
+
+class Interrupted(Exception):
+    pass
+
+
+def add(g, date, store, total, description):
+    g.add_purchase_manual({'date': date, 'store': store, 'total': total,
+                           'description': description}, False)
+
+
+def check_index(conn):
+    """ Every purchase is indexed, with the values it was indexed with. """
+    with conn:
+        conn.execute("INSERT INTO purchase_search (purchase_search, rank) "
+                     "VALUES ('integrity-check', 0);")
+    indexed = conn.execute('SELECT COUNT(*) FROM purchase_search;')
+    purchases = conn.execute('SELECT COUNT(*) FROM purchase;')
+    assert indexed.fetchone()[0] == purchases.fetchone()[0]
+
+
+@pytest.fixture
+def groc(tmp_path):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(tmp_path / 'groc')):
+        g = Groc()
+    g.init_groc()
+    for purchase in PURCHASES:
+        add(g, *purchase)
+    yield g
+    g.close()
+
+
+def ids(cursor):
+    return [row['id'] for row in cursor]
+
+
+def test_match_query():
+    assert search.match_query('cake') == '"cake"'
+    assert search.match_query('pharm* "cvs" AND-or') == (
+        '"pharm"* "cvs" "AND-or"')
+    with pytest.raises(exceptions.GrocException):
+        search.match_query(' * "" ')
+
+
+def test_search(groc):
+    with pytest.raises(exceptions.GrocException):
+        groc.search('cake')
+    assert groc.search_index_status() is None
+    assert groc.build_search_index() == 4
+
+    assert sorted(ids(groc.search('cake'))) == [2, 4]
+    assert ids(groc.search('cake', order='newest')) == [4, 2]
+    assert ids(groc.search('cake', since='2019-02-01')) == [4]
+    assert ids(groc.search('cake', until='2019-02-01')) == [2]
+    assert ids(groc.search('pharm*')) == [1]
+    # Diacritics are ignored
+    assert ids(groc.search('café olé')) == [4]
+    assert ids(groc.search('cake', limit=1)) in ([2], [4])
+    assert ids(groc.search('store:store OR vitamins', raw=True))
+    with pytest.raises(exceptions.GrocException):
+        groc.search('AND (', raw=True)
+
+    # Kept in sync
+    add(groc, '2019-04-01', 'Store Foo', '8.00', 'cupcake')
+    groc.delete_purchase([2])
+    assert ids(groc.search('store foo')) == [5]
+    check_index(groc._writer())
+
+    groc.drop_search_index()
+    assert groc.search_index_status() is None
+    groc.delete_purchase([1])
+
+
+def test_interrupted_build(groc, monkeypatch):
+    for chunk in generate.PurchaseGenerator(
+            start=datetime.date(2018, 1, 1)).purchases(500):
+        groc.add_purchases(chunk, True)
+    total = groc.select_purchase_count()
+
+    def interrupt(indexed):
+        raise Interrupted()
+    with pytest.raises(Interrupted):
+        groc.build_search_index(chunk_size=100, progress=interrupt)
+    assert groc.search_index_status() == {'pending': total - 100}
+
+    # Indexed, not indexed yet and new purchases change meanwhile
+    groc.delete_purchase([1, 2, 300, 301])
+    add(groc, '2019-05-01', 'Corner Pharmacy', '1.00', 'plasters')
+    conn = groc._writer()
+    with conn:
+        conn.execute("UPDATE purchase SET description = 'cake' "
+                     "WHERE id IN (3, 400);")
+
+    assert groc.build_search_index(chunk_size=100) == total - 100 - 2
+    assert groc.search_index_status() == {'pending': 0}
+    check_index(conn)
+    assert 3 in ids(groc.search('cake', limit=-1))
+    assert 400 in ids(groc.search('cake', limit=-1))
+
+
+def test_setup_db_has_no_index():
+    conn = db.create_connection(':memory:')
+    db.setup_db(conn)
+    assert not search.has_index(conn)
+
+
+def test_partitioned(tmp_path):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(tmp_path / 'groc')):
+        Groc().init_groc(partitioned=True)
+        g = PartitionedGroc()
+    assert g.search_index_status() is None
+    with pytest.raises(exceptions.DatabaseError):
+        g.search('cake')
+    g.close()
+
+
+def test_search_cli(groc, monkeypatch):
+    monkeypatch.setenv('GROC_DB', groc.db_url)
+    runner = CliRunner()
+
+    result = runner.invoke(groc_cli, ['search', 'cake'])
+    assert 'groc search --build' in str(result.exception)
+
+    result = runner.invoke(groc_cli, ['search', '--build', 'cake'])
+    assert result.exit_code == 0, result.output
+    assert 'Search index ready, 4 purchase(s) indexed.' in result.output
+    assert '2 purchase(s) matching' in result.output
+
+    result = runner.invoke(groc_cli, ['search', '--csv', '--newest', 'cake'])
+    assert result.output.splitlines()[:2] == [
+        'date,total,store,description',
+        '2019-03-01,$3.50,Cafe Ole,coffee and cake']
+
+    result = runner.invoke(groc_cli, ['search', 'nothing'])
+    assert result.output == "No purchases found for 'nothing'.\n"
+
+    result = runner.invoke(groc_cli, ['search'])
+    assert result.exit_code == 2
+
+    result = runner.invoke(groc_cli, ['search', '--drop'])
+    assert result.output == 'Search index removed.\n'
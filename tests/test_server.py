@@ -0,0 +1,139 @@
+import os
+import socket
+import threading
+from unittest import mock
+
+import pytest
+
+from groc import exceptions, server
+from groc.cli import groc_entrypoint
+from groc.client import GrocClient
+from groc.models import Groc
+
+
+def purchase(total, store='Store Foo', date='2019-01-01'):
+    return {'date': date, 'store': store, 'total': str(total),
+            'description': None}
+
+
+@pytest.fixture
+def groc(tmp_path):
+    with mock.patch('groc.models.os.path.expanduser',
+                    return_value=str(tmp_path / 'groc')):
+        g = Groc(read_only_reports=True, cache=True)
+    g.init_groc()
+    return g
+
+
+@pytest.fixture
+def client(groc, tmp_path):
+    service = server.GrocService(groc, groc_entrypoint)
+    socket_path = str(tmp_path / 'groc.sock')
+    httpd = server.make_server(service, socket_path)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.start()
+    try:
+        with GrocClient(socket_path) as client:
+            yield client
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        thread.join()
+        service.close()
+
+
+def test_write_queue_batches_writes(groc):
+    writes = server.WriteQueue(groc)
+    gate = threading.Event()
+    # Hold the writer thread, so the next jobs queue up
+    blocker = writes.submit(lambda g: gate.wait(5))
+    futures = [writes.submit(
+        lambda g, i=i: g.add_purchase_manual(purchase(i % 3 + 1), False))
+        for i in range(5)]
+    gate.set()
+    writes.close()
+
+    assert blocker.result()
+    assert [f.exception() is None for f in futures] == [
+        True, True, True, False, False]
+    assert all(isinstance(f.exception(), exceptions.DuplicateRow)
+               for f in futures[3:])
+    # Failed jobs are rolled back to their savepoint only
+    assert groc.select_purchase_count() == 3
+    groc.close()
+
+
+def test_server(client):
+    assert client.health()
+    assert client.add(store='Store Foo', total=20, date='2019-01-01') == 1
+    with pytest.raises(exceptions.ServerError, match='Duplicate'):
+        client.add(store='Store Foo', total=20, date='2019-01-01')
+    assert client.bulk_add([purchase(i, 'Store Bar', '2019-01-02')
+                            for i in range(1, 4)]) == 3
+
+    assert [row['store'] for row in client.list(limit=2)] == [
+        'Store Bar', 'Store Bar']
+    months = client.breakdown(month=['01'], year=['2019'])
+    assert months[0]['purchase count'] == 4
+    # Served from the result cache until the next write
+    assert client.breakdown(month=['01'], year=['2019']) == months
+
+    assert client.delete([1, 99]) == [1]
+    assert len(client.export()) == 3
+
+    with pytest.raises(exceptions.ServerError, match='not a valid integer'):
+        client.list(limit='x')
+    with pytest.raises(exceptions.ServerError, match='Unknown command'):
+        client.call('reset')
+
+
+def test_concurrent_clients(client, tmp_path):
+    socket_path = str(tmp_path / 'groc.sock')
+
+    def add_purchases(store):
+        with GrocClient(socket_path) as worker:
+            for total in range(1, 21):
+                worker.add(store=store, total=total, date='2019-02-01')
+
+    threads = [threading.Thread(target=add_purchases, args=(f'Store {i}',))
+               for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert client.breakdown(month=['02'], year=['2019'])[0][
+        'purchase count'] == 100
+
+
+def test_socket_file_safety(groc, tmp_path):
+    service = server.GrocService(groc, groc_entrypoint)
+    try:
+        # Never replaces a file that is not a socket
+        db_path = tmp_path / 'groc.db'
+        db_path.write_bytes(b'data')
+        with pytest.raises(exceptions.ServerError, match='not a socket'):
+            server.make_server(service, str(db_path))
+        assert db_path.read_bytes() == b'data'
+
+        # Nor the socket of a running server
+        socket_path = str(tmp_path / 'groc.sock')
+        httpd = server.make_server(service, socket_path)
+        with pytest.raises(exceptions.ServerError, match='another server'):
+            server.make_server(service, socket_path)
+        assert os.path.exists(socket_path)
+
+        # A socket taken over by another server is left alone on close
+        os.remove(socket_path)
+        other = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        other.bind(socket_path)
+        httpd.server_close()
+        assert os.path.exists(socket_path)
+        other.close()
+
+        # A stale socket left by a crashed server is replaced
+        httpd = server.make_server(service, socket_path)
+        httpd.server_close()
+        assert not os.path.exists(socket_path)
+    finally:
+        service.close()
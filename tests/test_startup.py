@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+import groc
+
+
+# Seconds `import groc.cli` may take (best of a few runs). Generous for
+# slow machines; the lazily imported modules below are checked exactly.
+STARTUP_BUDGET = 0.3
+
+# Only imported by the commands that need them
+LAZY_MODULES = ['groc.models', 'groc.db', 'prettytable', 'unidecode',
+                'numpy', 'urllib.request', 'groc.profiling']
+
+
+def run_python(args, home):
+    env = dict(os.environ,
+               HOME=str(home),
+               PYTHONPATH=os.path.dirname(os.path.dirname(groc.__file__)))
+    return subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                          env=env, capture_output=True, text=True, check=True)
+
+
+def imported_modules(importtime_output):
+    """ Module name -> cumulative import time in seconds. """
+    modules = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        modules[name.strip()] = int(cumulative) / 1e6
+    return modules
+
+
+def test_cli_import_time(tmp_path):
+    times = []
+    for _ in range(3):
+        result = run_python(['-c', 'import groc.cli'], tmp_path)
+        modules = imported_modules(result.stderr)
+        for name in LAZY_MODULES:
+            assert name not in modules, f'{name} imported on startup'
+        times.append(modules['groc.cli'])
+    assert min(times) < STARTUP_BUDGET
+
+
+def test_version_does_not_touch_database(tmp_path):
+    result = run_python(['-m', 'groc', '--version'], tmp_path)
+    assert result.stdout.startswith('groc, version ')
+    assert 'groc.models' not in imported_modules(result.stderr)
+    assert not (tmp_path / '.groc').exists()
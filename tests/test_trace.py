@@ -0,0 +1,74 @@
+from unittest import mock
+
+import pytest
+from click.testing import CliRunner
+
+from groc import db, trace
+from groc.cli import groc_entrypoint as groc_cli
+
+
+def purchase(total, date='2019-01-01'):
+    return {'date': date, 'store': 'Store Foo', 'total': str(total),
+            'description': None}
+
+
+@pytest.fixture
+def tracer(tmp_path):
+    tracer = trace.enable(trace.Tracer(str(tmp_path / 'slow.log'), 0))
+    yield tracer
+    trace.disable()
+
+
+def test_normalize():
+    assert trace.normalize(
+        "SELECT * FROM purchase\n  WHERE id IN (1, 2, 3) AND store = 'a''b' "
+        "AND total > 10.5 AND value = X'00ff';") == (
+        'SELECT * FROM purchase WHERE id IN (?...) AND store = ? '
+        'AND total > ? AND value = ?')
+
+
+def test_tracer(tracer, tmp_path):
+    conn = db.create_connection(':memory:')
+    db.setup_db(conn)
+    for total in range(1, 4):
+        db.validate_insert_row(conn, purchase(total))
+    db.delete_from_db(conn, [1, 2])
+    db.select_purchase_count(conn)
+
+    stats = {s['statement']: s for s in tracer.summary()}
+    insert = stats['INSERT INTO purchase (purchase_date, total, description, '
+                   'store_id) VALUES (?...)']
+    # Trigger steps of the insert are not counted as executions
+    assert insert['count'] == insert['timed'] == 3
+    assert insert['max'] <= insert['total']
+    assert stats['DELETE FROM purchase WHERE id IN (?...)']['count'] == 1
+    # Not timed, but seen by the connection trace callback
+    assert stats['BEGIN']['count'] == 4
+    assert stats['BEGIN']['timed'] == 0
+
+    log = (tmp_path / 'slow.log').read_text().splitlines()
+    assert len(log) == sum(s['timed'] for s in stats.values())
+    assert log[-1].split('\t')[3:] == [
+        'SELECT COUNT(*) as purchase_count FROM purchase;', '()']
+
+
+def test_trace_disabled():
+    assert trace.active is None
+    conn = db.create_connection(':memory:')
+    with mock.patch('groc.trace.Tracer.record') as record:
+        db.setup_db(conn)
+        db.select_purchase_count(conn)
+    assert not record.called
+
+
+def test_trace_cli(groc_db, tmp_path):
+    slow_log = tmp_path / 'slow.log'
+
+    result = CliRunner().invoke(groc_cli, [
+        '--trace', '--slow-log', str(slow_log), '--slow-threshold', '0',
+        'add', '--store', 'Store Foo', '--total', '20'])
+    assert result.exit_code == 0
+    assert 'SQL trace:' in result.output
+    assert 'INSERT INTO purchase' in result.output
+    assert 'INSERT INTO purchase' in slow_log.read_text()
+    assert trace.active is None
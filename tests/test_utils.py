@@ -25,6 +25,15 @@ def test_format_total_fail(bad_input, raised_exception):
         utils.format_total(bad_input)
 
 
+@pytest.mark.parametrize('total_cents, dollar_amount', [
+    (123405, '1234.05'),
+    (5, '0.05'),
+    (-250, '-2.50')
+])
+def test_format_cents(total_cents, dollar_amount):
+    assert utils.format_cents(total_cents) == dollar_amount
+
+
 @pytest.mark.parametrize('date, expected', [
     ('2019-01-01', datetime.date(2019, 1, 1)),
     (datetime.datetime(2019, 1, 1), datetime.date(2019, 1, 1)),